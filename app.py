@@ -1,637 +1,448 @@
 import streamlit as st
 import pandas as pd
 import io
-import csv
-import re
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.utils import get_column_letter
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import date
+from controle_anomalies import (
+    MOTEUR_EXCEL, PROFIL_MANUELLE, PROFIL_RADIO, PROFIL_TELE, CacheResultats, ColonnesManquantesError, IndexAnomalies, empreinte,
+    ExplorateurAnomalies, GestionnaireTravaux, ResultatDelta, colonnes_par_anomalie, executer_controles_parallele,
+    create_summary_with_corrections, colonnes_a_lire, sonder_export, ecrire_rapport_excel, ecrire_rapport_csv, ecrire_rapport_parquet, executer_controles_par_blocs, lire_export,
+    MagasinResultats, executer_controles_delta, ControleGeo, ReferentielCommunes, avec_controle_geo, ecrire_fichier_corrige,
+    ControleParc, ParcCompteurs, avec_controle_parc, ControleStatistique, avec_controle_statistique,
+)
+from controle_anomalies.explorateur import COLONNES_FILTRES, TAILLE_PAGE_DEFAUT
+from controle_anomalies.geo import SEUIL_KM_DEFAUT
+from controle_anomalies.historique import CAMPAGNES_CONSECUTIVES_DEFAUT, HistoriqueAnomalies, effectifs_communes, effectifs_csv
+from controle_anomalies.statistiques import SEUIL_Z_DEFAUT
 
 # Configuration de la page Streamlit
 st.set_page_config(layout="wide")
 st.title("Outil de Contrôle de Données")
 
-# #############################################################################
-# --- CODE POUR L'APPLICATION 1 : RADIORELÈVE ---
-# #############################################################################
+# La logique des contrôles est dans le paquet controle_anomalies (utilisable sans Streamlit,
+# voir `python -m controle_anomalies --help`) ; ce script ne contient que l'interface.
+
+@st.cache_resource
+def cache_partage():
+    """Cache LRU commun à toutes les sessions : lectures, contrôles et rapports indexés par l'empreinte du fichier."""
+    return CacheResultats()
+
+cache = cache_partage()
+
+@st.cache_resource
+def gestionnaire_travaux():
+    """Contrôles en tâche de fond, communs à toutes les sessions : un travail survit aux réexécutions du script."""
+    return GestionnaireTravaux()
+
+travaux = gestionnaire_travaux()
+
+@st.cache_resource
+def historique_campagnes():
+    """Historique des campagnes (base SQLite locale, CONTROLE_ANOMALIES_HISTORIQUE), commun à toutes les sessions."""
+    return HistoriqueAnomalies()
+
+historique = historique_campagnes()
+
+@st.cache_resource
+def referentiel_communes(contenu):
+    """Référentiel des communes (grille spatiale comprise), chargé une fois par contenu de fichier."""
+    return ReferentielCommunes.lire(io.BytesIO(contenu))
 
-def get_csv_delimiter_radio(file):
-    """Détecte le délimiteur d'un fichier CSV."""
+@st.cache_resource
+def parc_compteurs(contenu, nom):
+    """Parc de compteurs indexé une fois par contenu de fichier ; `nom` donne son format (extension)."""
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(nom)[1].lower(), delete=False) as fichier: fichier.write(contenu)
     try:
-        sample = file.read(2048).decode('utf-8')
-        dialect = csv.Sniffer().sniff(sample)
-        file.seek(0)
-        return dialect.delimiter
-    except Exception:
-        file.seek(0)
-        return ','
-
-def check_fp2e_details_radio(row):
+        return ParcCompteurs.lire(fichier.name)
+    finally:
+        os.unlink(fichier.name)
+
+# Contrôle géographique facultatif : les profils sont complétés par les règles de cohérence GPS / commune.
+with st.sidebar:
+    st.subheader("Contrôle géographique")
+    fichier_communes = st.file_uploader("Référentiel des communes (CSV)", type=['csv'], key="uploader_communes", help="Colonnes commune, latitude, longitude et, facultativement, lat_min, lat_max, lon_min, lon_max.")
+    seuil_km = st.number_input("Distance maximale à la commune (km)", min_value=0.5, value=SEUIL_KM_DEFAUT, step=0.5)
+    # Parc de compteurs facultatif : compteurs absents du parc, marque, diamètre et type différents du parc.
+    st.subheader("Parc de compteurs")
+    fichier_parc = st.file_uploader("Parc de compteurs (CSV, Parquet ou SQLite)", type=['csv', 'parquet', 'db', 'sqlite', 'sqlite3'], key="uploader_parc", help="Colonne 'Numéro de compteur' et, facultativement, Marque, Diametre, Type Compteur (table 'compteurs' d'une base SQLite).")
+    # Contrôles statistiques facultatifs : valeurs atypiques par Marque × Commune, en famille d'anomalies à part.
+    st.subheader("Contrôles statistiques")
+    statistiques_actives = st.checkbox("Signaler les valeurs atypiques (Marque × Commune)", key="statistiques", help="Année de fabrication ou type de compteur surreprésentés, coordonnées GPS éloignées du centre de la commune (score z robuste).")
+    seuil_z = st.number_input("Score z robuste minimal", min_value=1.0, value=SEUIL_Z_DEFAUT, step=0.5, disabled=not statistiques_actives)
+    # Historique des campagnes : les résultats enregistrés alimentent l'onglet Historique.
+    st.subheader("Historique des campagnes")
+    date_campagne = st.date_input("Date de la campagne", value=date.today(), key="date_campagne", help="Les contrôles enregistrés à une même date forment une campagne de l'historique.")
+    nom_campagne = st.text_input("Nom de la campagne", key="nom_campagne", placeholder="Nom du fichier par défaut", help="Campagne de l'historique et, en mode delta, campagne dont l'exécution précédente sert de référence.")
+cle_geo = None
+if fichier_communes:
+    controle_geo = ControleGeo(referentiel_communes(fichier_communes.getvalue()), seuil_km); cle_geo = (empreinte(fichier_communes.getvalue()), seuil_km)
+    PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE = (avec_controle_geo(profil, controle_geo) for profil in (PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE))
+if fichier_parc:
+    try:
+        controle_parc = ControleParc(parc_compteurs(fichier_parc.getvalue(), fichier_parc.name))
+    except (ColonnesManquantesError, ValueError, pd.errors.DatabaseError) as e:
+        st.sidebar.error(f"Parc de compteurs illisible : {e}")
+    else:
+        cle_geo = (cle_geo, controle_parc.empreinte)
+        PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE = (avec_controle_parc(profil, controle_parc) for profil in (PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE))
+if statistiques_actives:
+    controle_statistique = ControleStatistique(seuil_z=seuil_z); cle_geo = (cle_geo, controle_statistique)
+    PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE = (avec_controle_statistique(profil, controle_statistique) for profil in (PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE))
+
+ResultatsControle = namedtuple('ResultatsControle', 'anomalies_df anomaly_counter journal delta summary_df explorateur rapport parquet corrige')
+TAILLE_RAPPORT_MEMOIRE = 8 * 1024 * 1024  # au-delà, un rapport à télécharger est écrit sur disque
+TYPES_FICHIERS = ['csv', 'xlsx', 'parquet', 'feather']
+LIBELLES_ETAPES = {
+    None: "Démarrage", 'lecture': "Lecture du fichier", 'normalisation': "Normalisation", 'partage': "Répartition sur les processus",
+    'controles': "Application des règles", 'doublons': "Recherche des doublons", 'statistiques': "Contrôles statistiques", 'assemblage': "Assemblage des résultats",
+    'rapport': "Export du rapport",
+}
+
+def campagne_de(uploaded_file):
+    """Campagne d'un fichier téléversé (mode delta, historique) : le nom saisi dans la barre latérale, à défaut le nom du fichier."""
+    return nom_campagne or os.path.splitext(uploaded_file.name)[0]
+
+def controle_a_soumettre(profil, df, uploaded_file, sonde, colonnes, mode_flux, mode_delta):
+    """Fonction `controle(journal)` de la tâche de fond : ses données sont liées ici, le script pouvant être réexécuté entre-temps."""
+    if mode_flux:
+        fichier = io.BytesIO(uploaded_file.getvalue())  # flux propre à la tâche : l'aperçu relit le fichier téléversé à chaque réexécution
+        return lambda journal: executer_controles_par_blocs(fichier, profil, sonde.delimiteur, dtype=profil.dtype_lecture, usecols=colonnes_a_lire(profil, colonnes), journal=journal, encodage=sonde.encodage)
+    if mode_delta:
+        campagne = campagne_de(uploaded_file)  # chaque campagne a son propre état : une session ne sert pas de référence à une autre
+        return lambda journal: executer_controles_delta(df, profil, MagasinResultats(), campagne, journal)
+    return lambda journal: executer_controles_parallele(df, profil, journal=journal)
+
+class RapportTemporaire:
     """
-    Vérifie les détails FP2E et retourne les anomalies ET les corrections.
-    Retour: (liste_anomalies, dict_corrections)
+    Rapport écrit par `ecrire(fichier)` dans un fichier temporaire (en mémoire jusqu'à TAILLE_RAPPORT_MEMOIRE octets, sur
+    disque au-delà) ; l'instance est la fonction qui en lit le contenu, appelée au clic (téléchargement différé).
+    Avec `differe`, le rapport n'est écrit qu'au premier clic : rien n'est calculé s'il n'est jamais téléchargé, puis
+    `apres_ecriture()` éventuel est appelé (le cache remesure le résultat qui le contient).
+    `sys.getsizeof` donne la taille du fichier temporaire (budget du cache) et `close()` le supprime (éviction du cache) ;
+    un rapport fermé est réécrit au clic suivant.
     """
-    anomalies = []
-    corrections = {}
-    try:
-        compteur = str(row['Numéro de compteur']).strip()
-        annee_fabrication_val = str(row['Année de fabrication']).strip()
-        diametre_val = row['Diametre']
-        
-        fp2e_regex = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'
-        if not re.match(fp2e_regex, compteur):
-            return [], {}
-
-        annee_compteur = compteur[1:3]
-        lettre_diam = compteur[4].upper()
-        
-        if annee_fabrication_val == '' or not annee_fabrication_val.isdigit() or annee_compteur != annee_fabrication_val.zfill(2):
-            anomalies.append('L\'année de millésime n\'est pas conforme')
-            corrections['annee'] = annee_compteur
-
-        fp2e_map = {'A': 15, 'U': 15, 'V': 15, 'B': 20, 'C': 25, 'D': 30, 'E': 40, 'F': 50, 'G': [60, 65], 'H': 80, 'I': 100, 'J': 125, 'K': 150}
-        expected_diametres = fp2e_map.get(lettre_diam, [])
-        if not isinstance(expected_diametres, list): expected_diametres = [expected_diametres]
-
-        if pd.isna(diametre_val) or diametre_val not in expected_diametres:
-            anomalies.append('Le diamètre n\'est pas conforme')
-            if lettre_diam == 'G':
-                corrections['diametre'] = '60'
-            elif expected_diametres:
-                corrections['diametre'] = str(expected_diametres[0])
-            
-    except (TypeError, ValueError, IndexError):
-        anomalies.append('Le numéro de compteur n\'est pas conforme')
-    
-    return anomalies, corrections
-
-def check_data_radio(df):
-    """Vérifie les données du DataFrame pour détecter les anomalies."""
-    df_with_anomalies = df.copy()
-    
-    # Initialisation des nouvelles colonnes
-    df_with_anomalies['Correction Année'] = ''
-    df_with_anomalies['Correction Diamètre'] = ''
-    df_with_anomalies['Correction Type Compteur'] = ''
-    df_with_anomalies['Correction Marque'] = ''
-    df_with_anomalies['Correction Numéro de Tête'] = ''
-    df_with_anomalies['Correction Protocole Radio'] = ''
-
-    if 'Type Compteur' not in df_with_anomalies.columns:
-        st.error("La colonne 'Type Compteur' est manquante dans votre fichier.")
-        st.stop()
-
-    df_with_anomalies['Année de fabrication'] = df_with_anomalies['Année de fabrication'].astype(str).replace('nan', '', regex=False).apply(lambda x: str(int(float(x))) if x.replace('.', '', 1).isdigit() and x != '' else x).str.slice(-2).str.zfill(2)
-    required_columns = ['Protocole Radio', 'Marque', 'Numéro de tête', 'Numéro de compteur', 'Latitude', 'Longitude', 'Commune', 'Année de fabrication', 'Diametre', 'Mode de relève', 'Type Compteur']
-    if not all(col in df_with_anomalies.columns for col in required_columns):
-        missing_columns = [col for col in required_columns if col not in df_with_anomalies.columns]; st.error(f"Colonnes requises manquantes : {', '.join(missing_columns)}"); st.stop()
-    df_with_anomalies['Anomalie'] = ''
-    df_with_anomalies['Anomalie Détaillée FP2E'] = ''
-    for col in ['Numéro de compteur', 'Numéro de tête', 'Marque', 'Protocole Radio', 'Mode de relève', 'Type Compteur']: df_with_anomalies[col] = df_with_anomalies[col].astype(str).replace('nan', '', regex=False)
-    df_with_anomalies['Latitude'] = pd.to_numeric(df_with_anomalies['Latitude'], errors='coerce'); df_with_anomalies['Longitude'] = pd.to_numeric(df_with_anomalies['Longitude'], errors='coerce')
-    is_kamstrup = df_with_anomalies['Marque'].str.upper() == 'KAMSTRUP'; is_sappel = df_with_anomalies['Marque'].str.upper().isin(['SAPPEL (C)', 'SAPPEL (H)']); is_itron = df_with_anomalies['Marque'].str.upper() == 'ITRON'; annee_fabrication_num = pd.to_numeric(df_with_anomalies['Année de fabrication'], errors='coerce'); df_with_anomalies['Diametre'] = pd.to_numeric(df_with_anomalies['Diametre'], errors='coerce')
-    
-    kamstrup_protocole_incorrect = is_kamstrup & (df_with_anomalies['Protocole Radio'].str.upper() != 'WMS')
-    df_with_anomalies.loc[kamstrup_protocole_incorrect, 'Anomalie'] += 'KAMSTRUP: Protocole ≠ WMS / '
-    df_with_anomalies.loc[kamstrup_protocole_incorrect, 'Correction Protocole Radio'] = 'WMS'
-    
-    sappel_protocole_incorrect_wms = is_sappel & (annee_fabrication_num <= 22) & (df_with_anomalies['Protocole Radio'].str.upper() != 'WMS')
-    df_with_anomalies.loc[sappel_protocole_incorrect_wms, 'Anomalie'] += 'SAPPEL: Protocole ≠ WMS (année <= 22) / '
-    df_with_anomalies.loc[sappel_protocole_incorrect_wms, 'Correction Protocole Radio'] = 'WMS'
-
-    sappel_protocole_incorrect_oms = is_sappel & (annee_fabrication_num > 22) & (df_with_anomalies['Protocole Radio'].str.upper() != 'OMS')
-    df_with_anomalies.loc[sappel_protocole_incorrect_oms, 'Anomalie'] += 'SAPPEL: Protocole ≠ OMS (année > 22) / '
-    df_with_anomalies.loc[sappel_protocole_incorrect_oms, 'Correction Protocole Radio'] = 'OMS'
-    
-    df_with_anomalies.loc[df_with_anomalies['Marque'].isin(['', 'nan']), 'Anomalie'] += 'Marque manquante / '
-    df_with_anomalies.loc[df_with_anomalies['Numéro de compteur'].isin(['', 'nan']), 'Anomalie'] += 'Numéro de compteur manquant / '
-    df_with_anomalies.loc[df_with_anomalies['Diametre'].isnull(), 'Anomalie'] += 'Diamètre manquant / '
-    df_with_anomalies.loc[df_with_anomalies['Année de fabrication'].isnull(), 'Anomalie'] += 'Année de fabrication manquante / '
-    
-    tete_manquante = df_with_anomalies['Numéro de tête'].isin(['', 'nan'])
-    condition_tete_sappel = tete_manquante & (~is_sappel | (annee_fabrication_num >= 22)) & (df_with_anomalies['Mode de relève'].str.upper() != 'MANUELLE') & (~is_kamstrup)
-    df_with_anomalies.loc[condition_tete_sappel, 'Anomalie'] += 'Numéro de tête manquant / '
-    
-    condition_tete_kamstrup = tete_manquante & is_kamstrup & (df_with_anomalies['Numéro de compteur'].str.match(r'^\d{8}$'))
-    df_with_anomalies.loc[condition_tete_kamstrup, 'Anomalie'] += 'Numéro de tête manquant / '
-    df_with_anomalies.loc[condition_tete_kamstrup, 'Correction Numéro de Tête'] = df_with_anomalies.loc[condition_tete_kamstrup, 'Numéro de compteur']
-
-    df_with_anomalies.loc[df_with_anomalies['Latitude'].isnull() | df_with_anomalies['Longitude'].isnull(), 'Anomalie'] += 'Coordonnées GPS non numériques / '
-    df_with_anomalies.loc[((df_with_anomalies['Latitude'] == 0) | (~df_with_anomalies['Latitude'].between(-90, 90))) | ((df_with_anomalies['Longitude'] == 0) | (~df_with_anomalies['Longitude'].between(-180, 180))), 'Anomalie'] += 'Coordonnées GPS invalides / '
-    
-    kamstrup_valid = is_kamstrup & (~df_with_anomalies['Numéro de tête'].isin(['', 'nan']))
-    df_with_anomalies.loc[is_kamstrup & (df_with_anomalies['Numéro de compteur'].str.len() != 8), 'Anomalie'] += 'KAMSTRUP: Compteur ≠ 8 caractères / '
-    df_with_anomalies.loc[kamstrup_valid & (df_with_anomalies['Numéro de compteur'] != df_with_anomalies['Numéro de tête']), 'Anomalie'] += 'KAMSTRUP: Compteur ≠ Tête / '
-    df_with_anomalies.loc[kamstrup_valid & (~df_with_anomalies['Numéro de compteur'].str.isdigit() | ~df_with_anomalies['Numéro de tête'].str.isdigit()), 'Anomalie'] += 'KAMSTRUP: Compteur ou Tête non numérique / '
-    df_with_anomalies.loc[is_kamstrup & (~df_with_anomalies['Diametre'].between(15, 80)), 'Anomalie'] += 'KAMSTRUP: Diamètre hors plage / '
-    df_with_anomalies.loc[is_sappel & (df_with_anomalies['Numéro de tête'].astype(str).str.upper().str.startswith('DME')) & (df_with_anomalies['Numéro de tête'].str.len() != 15), 'Anomalie'] += 'SAPPEL: Tête DME ≠ 15 caractères / '
-    df_with_anomalies.loc[is_sappel & (df_with_anomalies['Mode de relève'].str.upper() != 'MANUELLE') & (~df_with_anomalies['Numéro de compteur'].str.startswith(('C', 'H'))), 'Anomalie'] += 'SAPPEL: Compteur ne commence pas par C ou H / '
-    
-    compteur_starts_C = df_with_anomalies['Numéro de compteur'].str.startswith('C'); marque_not_sappel_C = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (C)'
-    df_with_anomalies.loc[is_sappel & compteur_starts_C & marque_not_sappel_C, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (C) / '; df_with_anomalies.loc[is_sappel & compteur_starts_C & marque_not_sappel_C, 'Correction Marque'] = 'SAPPEL (C)'
-    compteur_starts_H = df_with_anomalies['Numéro de compteur'].str.startswith('H'); marque_not_sappel_H = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (H)'
-    df_with_anomalies.loc[is_sappel & compteur_starts_H & marque_not_sappel_H, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (H) / '; df_with_anomalies.loc[is_sappel & compteur_starts_H & marque_not_sappel_H, 'Correction Marque'] = 'SAPPEL (H)'
-    
-    df_with_anomalies.loc[is_itron & (df_with_anomalies['Mode de relève'].str.upper() != 'MANUELLE') & (~df_with_anomalies['Numéro de compteur'].str.startswith(('I', 'D'))), 'Anomalie'] += 'ITRON: Compteur ne commence pas par I ou D / '
-    
-    is_brand_ok = is_sappel | is_itron; is_len_ok = df_with_anomalies['Numéro de compteur'].str.len() == 11
-    starts_with_letter = df_with_anomalies['Numéro de compteur'].str[0].str.isalpha(); fourth_is_letter = df_with_anomalies['Numéro de compteur'].str[3].str.isalpha()
-    condition_type_compteur = is_brand_ok & is_len_ok & starts_with_letter & fourth_is_letter
-    rows_to_check = df_with_anomalies[condition_type_compteur].copy()
-    if not rows_to_check.empty:
-        sappel_rows = rows_to_check[rows_to_check['Marque'].str.upper().isin(['SAPPEL (C)', 'SAPPEL (H)'])]
-        if not sappel_rows.empty:
-            correct_type_sappel = sappel_rows['Numéro de compteur'].str[0] + sappel_rows['Numéro de compteur'].str[3]
-            incorrect_mask_sappel = sappel_rows['Type Compteur'] != correct_type_sappel
-            incorrect_indices_sappel = sappel_rows[incorrect_mask_sappel].index
-            if not incorrect_indices_sappel.empty:
-                df_with_anomalies.loc[incorrect_indices_sappel, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_sappel, 'Correction Type Compteur'] = correct_type_sappel[incorrect_mask_sappel]
-        
-        itron_rows = rows_to_check[rows_to_check['Marque'].str.upper() == 'ITRON']
-        if not itron_rows.empty:
-            correct_type_itron = 'I' + itron_rows['Numéro de compteur'].str[3]
-            incorrect_mask_itron = itron_rows['Type Compteur'] != correct_type_itron
-            incorrect_indices_itron = itron_rows[incorrect_mask_itron].index
-            if not incorrect_indices_itron.empty:
-                df_with_anomalies.loc[incorrect_indices_itron, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_itron, 'Correction Type Compteur'] = correct_type_itron[incorrect_mask_itron]
-
-    fp2e_regex = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'; sappel_non_manuelle_fp2e = is_sappel & (df_with_anomalies['Mode de relève'].str.upper() != 'MANUELLE'); manuelle_format_ok = (df_with_anomalies['Mode de relève'].str.upper() == 'MANUELLE') & (df_with_anomalies['Numéro de compteur'].str.match(fp2e_regex, na=False));
-    fp2e_check_condition = sappel_non_manuelle_fp2e | manuelle_format_ok
-    fp2e_results = df_with_anomalies[fp2e_check_condition].apply(check_fp2e_details_radio, axis=1)
-    for index, result in fp2e_results.items():
-        anomalies, corrections = result
-        if anomalies: df_with_anomalies.loc[index, 'Anomalie'] += ' / '.join(anomalies) + ' / '
-        if 'annee' in corrections: df_with_anomalies.loc[index, 'Correction Année'] = corrections['annee']
-        if 'diametre' in corrections: df_with_anomalies.loc[index, 'Correction Diamètre'] = corrections['diametre']
-
-    df_with_anomalies['Anomalie'] = df_with_anomalies['Anomalie'].str.strip().str.rstrip(' /')
-    anomalies_df = df_with_anomalies[(df_with_anomalies['Anomalie'] != '') | (df_with_anomalies['Correction Année'] != '') | (df_with_anomalies['Correction Diamètre'] != '') | (df_with_anomalies['Correction Type Compteur'] != '') | (df_with_anomalies['Correction Marque'] != '') | (df_with_anomalies['Correction Numéro de Tête'] != '') | (df_with_anomalies['Correction Protocole Radio'] != '')].copy()
-    anomalies_df.reset_index(inplace=True); anomalies_df.rename(columns={'index': 'Index original'}, inplace=True)
-    
-    try:
-        cols = list(anomalies_df.columns); cols.remove('Correction Année'); cols.remove('Correction Diamètre'); cols.remove('Correction Type Compteur'); cols.remove('Correction Marque'); cols.remove('Correction Numéro de Tête'); cols.remove('Correction Protocole Radio')
-        pos_annee = cols.index('Année de fabrication') + 1; cols.insert(pos_annee, 'Correction Année')
-        pos_diametre = cols.index('Diametre') + 1; cols.insert(pos_diametre, 'Correction Diamètre')
-        pos_type = cols.index('Type Compteur') + 1; cols.insert(pos_type, 'Correction Type Compteur')
-        pos_marque = cols.index('Marque') + 1; cols.insert(pos_marque, 'Correction Marque')
-        pos_tete = cols.index('Numéro de tête') + 1; cols.insert(pos_tete, 'Correction Numéro de Tête')
-        pos_protocole = cols.index('Protocole Radio') + 1; cols.insert(pos_protocole, 'Correction Protocole Radio')
-        anomalies_df = anomalies_df[cols]
-    except ValueError: pass
-
-    return anomalies_df, anomalies_df['Anomalie'].str.split(' / ').explode().value_counts()
+    def __init__(self, ecrire, differe=False, apres_ecriture=None):
+        self.ecrire, self.apres_ecriture = ecrire, apres_ecriture
+        self._fichier, self._taille, self._verrou = None, 0, threading.Lock()
+        if not differe: self._ecrire()
+
+    def _ecrire(self):
+        self._fichier = tempfile.SpooledTemporaryFile(max_size=TAILLE_RAPPORT_MEMOIRE); self.ecrire(self._fichier)
+        self._taille = self._fichier.seek(0, io.SEEK_END)
+
+    def __call__(self):
+        with self._verrou:  # un même rapport peut être téléchargé par plusieurs sessions
+            ecrit = self._fichier is None
+            if ecrit: self._ecrire()
+            self._fichier.seek(0); contenu = self._fichier.read()
+        if ecrit and self.apres_ecriture is not None: self.apres_ecriture()
+        return contenu
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._taille
+
+    def close(self):
+        with self._verrou:
+            if self._fichier is not None: self._fichier.close()
+            self._fichier, self._taille = None, 0
+
+def traitement_en_fond(uploaded_file, profil, controle, durees_lecture, sonde, sep_rapport, cle):
+    """
+    Tâche de fond complète : contrôles, récapitulatif, rapport (xlsx pour un xlsx, CSV compressé en gzip pour un CSV)
+    et rapport Parquet ; le fichier corrigé n'est écrit qu'au premier téléchargement, dans un fichier temporaire.
+    Le résultat est aussi mis en cache : un travail oublié puis resoumis ne recalcule rien.
+    Retour: fonction `executer(journal)` retournant un ResultatsControle
+    """
+    source = io.BytesIO(uploaded_file.getvalue()); source.name = uploaded_file.name
+    def executer(journal):
+        journal.etapes.update(durees_lecture)
+        resultat = controle(journal); delta = resultat if isinstance(resultat, ResultatDelta) else None
+        anomalies_df, anomaly_counter = (delta.anomalies_df, delta.anomaly_counter) if delta is not None else resultat
+        if anomalies_df.empty: return ResultatsControle(anomalies_df, anomaly_counter, journal, delta, None, None, None, None, None)
+        index_anomalies = IndexAnomalies(anomalies_df, profil); summary_df = create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type=profil.nom, index=index_anomalies, profil=profil)
+        with journal.etape('rapport'):
+            if sonde.excel:
+                tampon = io.BytesIO(); ecrire_rapport_excel(anomalies_df, summary_df, colonnes_par_anomalie(profil), tampon, index=index_anomalies); rapport = tampon.getvalue()
+            elif sonde.csv: rapport = RapportTemporaire(lambda fichier: ecrire_rapport_csv(anomalies_df, fichier, sep_rapport, compression='gzip'))
+            else: rapport = None  # export Parquet/Feather : le rapport Parquet suffit
+            parquet = RapportTemporaire(lambda fichier: ecrire_rapport_parquet(anomalies_df, fichier))
+        corrige = RapportTemporaire(lambda fichier: ecrire_fichier_corrige(source, anomalies_df, profil, fichier, sonde), differe=True, apres_ecriture=lambda: cache.reevaluer(cle + ('resultats',)))
+        return ResultatsControle(anomalies_df, anomaly_counter, journal, delta, summary_df, ExplorateurAnomalies(anomalies_df, index_anomalies), rapport, parquet, corrige)
+    return lambda journal: cache.obtenir(cle + ('resultats',), lambda: executer(journal))
+
+@st.fragment(run_every=1.0)
+def afficher_avancement(identifiant):
+    """Avancement d'un travail en cours, rafraîchi chaque seconde ; la page entière est réexécutée quand il se termine."""
+    travail = travaux.obtenir(identifiant)
+    if travail is None or travail.termine: st.rerun(scope="app")
+    etape, fraction = travail.avancement()
+    libelle = LIBELLES_ETAPES.get(etape, etape) if etape is not None or fraction == 0 else "Finalisation"
+    st.progress(fraction, text=f"{libelle}… ({travail.duree():.0f} s)")
+
+def resultats_travail(nom, cle):
+    """
+    Résultats du travail de l'onglet `nom` s'il porte sur `cle` et est terminé (son exception est relevée s'il a échoué) ;
+    pendant son exécution, affiche son avancement et retourne None.
+    """
+    travail = travaux.obtenir(st.session_state.get(f"travail_{nom}"))
+    if travail is None or travail.cle != cle: return None
+    if not travail.termine:
+        afficher_avancement(travail.identifiant); return None
+    return travail.resultat
 
-# #############################################################################
-# --- CODE POUR L'APPLICATION 2 : TÉLÉRELÈVE ---
-# #############################################################################
+def explorer_anomalies(resultats, nom):
+    """
+    Récapitulatif, dont la sélection de lignes filtre les types d'anomalie, puis lignes du rapport page par page :
+    filtres, tri et pagination sont appliqués côté serveur, seule la page affichée est envoyée au navigateur.
+    """
+    explorateur, summary_df = resultats.explorateur, resultats.summary_df
+    st.subheader("Récapitulatif des anomalies")
+    choix = st.dataframe(summary_df, on_select="rerun", selection_mode="multi-row", key=f"recap_{nom}")
+    types = list(summary_df["Type d'anomalie"].iloc[choix.selection.rows])
+
+    st.subheader("Lignes en anomalie" + (f" : {', '.join(types)}" if types else ""))
+    colonne_marque, colonne_commune, colonne_tri, colonne_ordre, colonne_taille = st.columns([3, 3, 3, 2, 1])
+    filtres = {col: zone.multiselect(col, explorateur.valeurs(col), key=f"filtre_{col}_{nom}") for zone, col in zip((colonne_marque, colonne_commune), COLONNES_FILTRES) if explorateur.valeurs(col)}
+    tri = colonne_tri.selectbox("Trier par", [None, *explorateur.anomalies_df.columns], format_func=lambda col: "Ordre du fichier" if col is None else col, key=f"tri_{nom}")
+    croissant = colonne_ordre.radio("Ordre", ["Croissant", "Décroissant"], horizontal=True, key=f"ordre_{nom}") == "Croissant"
+    taille_page = colonne_taille.selectbox("Lignes", [50, TAILLE_PAGE_DEFAUT, 500], index=1, key=f"taille_page_{nom}")
+
+    positions = explorateur.selection(types, filtres, tri, croissant); nombre_pages = explorateur.nombre_pages(positions, taille_page)
+    if st.session_state.get(f"page_{nom}", 1) > nombre_pages: st.session_state[f"page_{nom}"] = 1  # la sélection a rétréci
+    numero = st.number_input(f"Page (sur {nombre_pages})", min_value=1, max_value=nombre_pages, value=1, key=f"page_{nom}")
+    st.caption(f"{len(positions)} lignes retenues sur {len(explorateur)} — les téléchargements contiennent le rapport complet.")
+    st.dataframe(explorateur.page(positions, numero - 1, taille_page))
+
+def bouton_rapport_parquet(resultats, nom, fichier):
+    st.download_button(label="📥 Télécharger le rapport (Parquet)", data=resultats.parquet, file_name=f'{fichier}.parquet', mime='application/vnd.apache.parquet', key=f"parquet_{nom}", on_click="ignore", help="Rapport complet au format Parquet, compact et typé, lisible par pandas, Spark ou DuckDB.")
+
+def bouton_fichier_corrige(uploaded_file, resultats, nom):
+    """Téléchargement de l'export complet, corrections proposées appliquées (même format et délimiteur)."""
+    base, _, extension = uploaded_file.name.rpartition('.')
+    st.download_button(label="📥 Télécharger le fichier corrigé", data=resultats.corrige, file_name=f'{base}_corrige.{extension}', mime=uploaded_file.type, key=f"corrige_{nom}", on_click="ignore", help="Export complet avec les corrections proposées appliquées et la colonne « Corrections appliquées ».")
+
+def afficher_delta(resultat):
+    lignes = resultat.lignes
+    st.subheader("Évolution depuis la campagne précédente")
+    st.caption(f"{lignes['recontrolees']} lignes recontrôlées sur {lignes['total']} : {lignes['nouvelles']} nouvelles, {lignes['modifiees']} modifiées, {lignes['supprimees']} supprimées depuis la campagne précédente.")
+    st.dataframe(resultat.evolution, hide_index=True)
+    if len(resultat.historique) > 1: st.line_chart(resultat.historique.set_index('date')[['lignes_en_anomalie']])
+
+def afficher_journal(journal, nom):
+    with st.expander("Rapport d'exécution : durées des étapes et mesures par règle"):
+        st.dataframe(pd.DataFrame(list(journal.etapes.items()), columns=["Étape", "Durée (s)"]), hide_index=True)
+        st.dataframe(journal.tableau_regles(), hide_index=True)
+        st.download_button(label="📥 Journal d'exécution (JSON)", data=journal.en_json(indent=2), file_name=f'journal_{nom}.json', mime='application/json', key=f"journal_{nom}")
+
+def bouton_historique(resultats, profil, uploaded_file, df, sonde, mode_flux, nom):
+    """
+    Enregistre les résultats dans l'historique des campagnes (date et nom de la barre latérale) ; en mode
+    flux, seule la colonne Commune est relue pour compter les lignes par commune.
+    """
+    if not st.button("🗂️ Enregistrer dans l'historique", key=f"historique_{nom}", help="Ajoute les anomalies et leur décompte à l'historique des campagnes ; réenregistrer le même fichier à la même date remplace l'enregistrement précédent."): return
+    effectifs = effectifs_csv(io.BytesIO(uploaded_file.getvalue()), sonde) if mode_flux else effectifs_communes(df)
+    historique.enregistrer(resultats.anomalies_df, resultats.anomaly_counter, profil, campagne_de(uploaded_file), date_campagne, uploaded_file.name, effectifs, duree_s=sum(resultats.journal.etapes.values()))
+    st.success(f"Contrôle enregistré dans l'historique (campagne du {date_campagne:%d/%m/%Y}).")
+
+def afficher_historique():
+    """Requêtes sur l'historique des campagnes : exécutions, compteurs signalés de campagne en campagne, taux d'anomalie par commune."""
+    nom_profil = st.selectbox("Profil", ['radio', 'tele', 'manuelle'], format_func={'radio': "Radiorelève", 'tele': "Télérelève", 'manuelle': "Manuelle"}.get, key="historique_profil")
+    executions = historique.executions(nom_profil)
+    if executions.empty:
+        st.info("Aucun contrôle enregistré pour ce profil : utilisez « Enregistrer dans l'historique » après un contrôle."); return
+    st.subheader("Contrôles enregistrés"); st.dataframe(executions.drop(columns=['id', 'profil']), hide_index=True)
+
+    st.subheader("Compteurs signalés sur plusieurs campagnes consécutives")
+    colonne_nombre, colonne_type, colonne_en_cours = st.columns([1, 3, 1])
+    campagnes = colonne_nombre.number_input("Campagnes consécutives", min_value=1, value=CAMPAGNES_CONSECUTIVES_DEFAUT, key="historique_campagnes")
+    evolution = historique.evolution_types(nom_profil)
+    type_anomalie = colonne_type.selectbox("Type d'anomalie", [None, *evolution.columns], format_func=lambda nom: "Tous types" if nom is None else nom, key="historique_type")
+    en_cours = colonne_en_cours.checkbox("Jusqu'à la dernière campagne", key="historique_en_cours")
+    recurrents = historique.compteurs_recurrents(nom_profil, campagnes, type_anomalie, en_cours)
+    st.caption(f"{len(recurrents)} compteurs."); st.dataframe(recurrents, hide_index=True)
+    st.download_button(label="📥 Télécharger (CSV)", data=recurrents.to_csv(index=False).encode('utf-8'), file_name=f'compteurs_recurrents_{nom_profil}.csv', mime='text/csv', key="historique_recurrents")
+
+    st.subheader("Taux d'anomalie par commune")
+    taux = historique.taux_par_commune(nom_profil, type_anomalie)
+    plus_touchees = taux.groupby("Commune")["Lignes en anomalie"].sum().nlargest(5).index.tolist()
+    communes = st.multiselect("Communes", sorted(taux["Commune"].unique()), default=plus_touchees, key="historique_communes", help="Par défaut, les cinq communes les plus signalées.")
+    taux = taux[taux["Commune"].isin(communes)]
+    if not taux.empty: st.line_chart(taux.pivot(index="Date de campagne", columns="Commune", values="Taux d'anomalie"))
+    st.dataframe(taux, hide_index=True)
+
+    st.subheader("Nombre de cas par type d'anomalie")
+    if len(evolution) > 1: st.line_chart(evolution)
+    st.dataframe(evolution)
+
+def sonder_fichier(uploaded_file, profil, cle):
+    """
+    Sonde mise en cache : encodage, délimiteur et colonnes tirés de l'en-tête et d'un échantillon. Un fichier sans
+    les colonnes requises est rejeté (ColonnesManquantesError) avant toute lecture complète.
+    """
+    return cache.obtenir(cle + ('sonde',), lambda: sonder_export(uploaded_file, profil))
 
-def get_csv_delimiter_tele(file):
-    try:
-        sample = file.read(2048).decode('utf-8'); dialect = csv.Sniffer().sniff(sample); file.seek(0); return dialect.delimiter
-    except Exception:
-        file.seek(0); return ','
+def lire_fichier(uploaded_file, profil, cle, colonnes_conservees, sonde):
+    """Lecture mise en cache (`cle` inclut le choix de colonnes) ; retourne (df, délimiteur, durées de la lecture réelle)."""
+    def lire():
+        durees = {}; df, sep = lire_export(uploaded_file, profil, colonnes_conservees, durees, sonde)
+        return df, sep, durees
+    return cache.obtenir(cle + ('lecture',), lire)
 
-def check_fp2e_details_tele(row):
-    anomalies, corrections = [], {}
-    try:
-        compteur = str(row['Numéro de compteur']).strip(); annee_fabrication_val = str(row['Année de fabrication']).strip(); diametre_val = row['Diametre']
-        fp2e_regex = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'
-        if not re.match(fp2e_regex, compteur):
-            anomalies.append('Format de compteur non FP2E'); return anomalies, corrections
-        annee_compteur = compteur[1:3]; lettre_diam = compteur[4].upper()
-        if not annee_fabrication_val or not annee_fabrication_val.isdigit() or annee_compteur != annee_fabrication_val.zfill(2):
-            anomalies.append('Année millésime non conforme FP2E'); corrections['annee'] = annee_compteur
-        fp2e_map = {'A': 15, 'U': 15, 'V': 15, 'B': 20, 'C': 25, 'D': 30, 'E': 40, 'F': 50, 'G': [60, 65], 'H': 80, 'I': 100, 'J': 125, 'K': 150}
-        expected_diametres = fp2e_map.get(lettre_diam, []);
-        if not isinstance(expected_diametres, list): expected_diametres = [expected_diametres]
-        if pd.isna(diametre_val) or diametre_val not in expected_diametres:
-            anomalies.append('Diamètre non conforme FP2E')
-            if lettre_diam == 'G': corrections['diametre'] = '60'
-            elif expected_diametres: corrections['diametre'] = str(expected_diametres[0])
-    except (TypeError, ValueError, IndexError):
-        anomalies.append('Erreur de format interne')
-    return anomalies, corrections
-
-def check_data_tele(df):
-    df_with_anomalies = df.copy()
-    df_with_anomalies['Correction Année'] = ''; df_with_anomalies['Correction Diamètre'] = ''; df_with_anomalies['Correction Type Compteur'] = ''; df_with_anomalies['Correction Marque'] = ''; df_with_anomalies['Correction Numéro de Tête'] = ''; df_with_anomalies['Correction Protocole Radio'] = ''
-    
-    if 'Type Compteur' not in df_with_anomalies.columns:
-        st.error("La colonne 'Type Compteur' est manquante dans votre fichier."); st.stop()
-
-    df_with_anomalies['Année de fabrication'] = df_with_anomalies['Année de fabrication'].astype(str).replace('nan', '', regex=False).apply(lambda x: str(int(float(x))) if x.replace('.', '', 1).isdigit() and x != '' else x).str.slice(-2).str.zfill(2)
-    required_columns = ['Protocole Radio', 'Marque', 'Numéro de compteur', 'Numéro de tête', 'Latitude', 'Longitude', 'Année de fabrication', 'Diametre', 'Traité', 'Mode de relève', 'Type Compteur']
-    if not all(col in df_with_anomalies.columns for col in required_columns):
-        missing = [col for col in required_columns if col not in df_with_anomalies.columns]; st.error(f"Colonnes requises manquantes : {', '.join(missing)}"); st.stop()
-    df_with_anomalies['Anomalie'] = ''
-    for col in ['Numéro de compteur', 'Numéro de tête', 'Marque', 'Protocole Radio', 'Traité', 'Mode de relève', 'Type Compteur']: df_with_anomalies[col] = df_with_anomalies[col].astype(str).replace('nan', '', regex=False)
-    df_with_anomalies['Latitude'] = pd.to_numeric(df_with_anomalies['Latitude'], errors='coerce'); df_with_anomalies['Longitude'] = pd.to_numeric(df_with_anomalies['Longitude'], errors='coerce'); df_with_anomalies['Diametre'] = pd.to_numeric(df_with_anomalies['Diametre'], errors='coerce')
-    is_kamstrup = df_with_anomalies['Marque'].str.upper() == 'KAMSTRUP'; is_sappel = df_with_anomalies['Marque'].str.upper().isin(['SAPPEL (C)', 'SAPPEL (H)', 'SAPPEL(C)']); is_itron = df_with_anomalies['Marque'].str.upper() == 'ITRON'; is_kaifa = df_with_anomalies['Marque'].str.upper() == 'KAIFA'; is_mode_manuelle = df_with_anomalies['Mode de relève'].str.upper() == 'MANUELLE'; annee_fabrication_num = pd.to_numeric(df_with_anomalies['Année de fabrication'], errors='coerce')
-    
-    traite_lra_condition = df_with_anomalies['Traité'].str.startswith(('903', '863'), na=False)
-    protocole_incorrect_lra = (~is_mode_manuelle) & traite_lra_condition & (df_with_anomalies['Protocole Radio'].str.upper() != 'LRA')
-    df_with_anomalies.loc[protocole_incorrect_lra, 'Anomalie'] += 'Protocole incorrect (devrait être LRA) / '
-    df_with_anomalies.loc[protocole_incorrect_lra, 'Correction Protocole Radio'] = 'LRA'
-    protocole_incorrect_sgx = (~is_mode_manuelle) & (~traite_lra_condition) & (df_with_anomalies['Protocole Radio'].str.upper() != 'SGX')
-    df_with_anomalies.loc[protocole_incorrect_sgx, 'Anomalie'] += 'Protocole incorrect (devrait être SGX) / '
-    df_with_anomalies.loc[protocole_incorrect_sgx, 'Correction Protocole Radio'] = 'SGX'
-
-    df_with_anomalies.loc[df_with_anomalies['Marque'].isin(['', 'nan']), 'Anomalie'] += 'Marque manquante / '; df_with_anomalies.loc[df_with_anomalies['Numéro de compteur'].isin(['', 'nan']), 'Anomalie'] += 'Numéro de compteur manquant / '; df_with_anomalies.loc[df_with_anomalies['Diametre'].isnull(), 'Anomalie'] += 'Diamètre manquant / '; df_with_anomalies.loc[annee_fabrication_num.isnull(), 'Anomalie'] += 'Année de fabrication manquante / '
-    df_with_anomalies.loc[df_with_anomalies['Numéro de tête'].isin(['', 'nan']) & (~is_kamstrup) & (~is_kaifa) & (~is_mode_manuelle), 'Anomalie'] += 'Numéro de tête manquant / '
-    df_with_anomalies.loc[df_with_anomalies['Latitude'].isnull() | df_with_anomalies['Longitude'].isnull(), 'Anomalie'] += 'Coordonnées GPS non numériques / '; df_with_anomalies.loc[((df_with_anomalies['Latitude'] == 0) | (~df_with_anomalies['Latitude'].between(-90, 90))) | ((df_with_anomalies['Longitude'] == 0) | (~df_with_anomalies['Longitude'].between(-180, 180))), 'Anomalie'] += 'Coordonnées GPS invalides / '
-    kamstrup_valid = is_kamstrup & (~df_with_anomalies['Numéro de tête'].isin(['', 'nan'])); df_with_anomalies.loc[is_kamstrup & (df_with_anomalies['Numéro de compteur'].str.len() != 8), 'Anomalie'] += 'KAMSTRUP: Compteur ≠ 8 caractères / '; df_with_anomalies.loc[kamstrup_valid & (df_with_anomalies['Numéro de compteur'] != df_with_anomalies['Numéro de tête']), 'Anomalie'] += 'KAMSTRUP: Compteur ≠ Tête / '; df_with_anomalies.loc[kamstrup_valid & (~df_with_anomalies['Numéro de compteur'].str.isdigit() | ~df_with_anomalies['Numéro de tête'].str.isdigit()), 'Anomalie'] += 'KAMSTRUP: Compteur ou Tête non numérique / '; df_with_anomalies.loc[is_kamstrup & (~df_with_anomalies['Diametre'].between(15, 80)), 'Anomalie'] += 'KAMSTRUP: Diamètre hors de la plage [15, 80] / '
-    df_with_anomalies.loc[is_sappel & (~df_with_anomalies['Numéro de tête'].isin(['', 'nan'])) & (df_with_anomalies['Numéro de tête'].str.len() != 16), 'Anomalie'] += 'SAPPEL: Tête ≠ 16 caractères / ';
-    
-    compteur_starts_C = df_with_anomalies['Numéro de compteur'].str.startswith('C'); marque_not_sappel_C = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (C)'
-    df_with_anomalies.loc[is_sappel & compteur_starts_C & marque_not_sappel_C, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (C) / '; df_with_anomalies.loc[is_sappel & compteur_starts_C & marque_not_sappel_C, 'Correction Marque'] = 'SAPPEL (C)'
-    compteur_starts_H = df_with_anomalies['Numéro de compteur'].str.startswith('H'); marque_not_sappel_H = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (H)'
-    df_with_anomalies.loc[is_sappel & compteur_starts_H & marque_not_sappel_H, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (H) / '; df_with_anomalies.loc[is_sappel & compteur_starts_H & marque_not_sappel_H, 'Correction Marque'] = 'SAPPEL (H)'
-
-    df_with_anomalies.loc[is_itron & (~df_with_anomalies['Numéro de tête'].isin(['', 'nan'])) & (df_with_anomalies['Numéro de tête'].str.len() != 8), 'Anomalie'] += 'ITRON: Tête ≠ 8 caractères / '
-    
-    is_brand_ok = is_sappel | is_itron; is_len_ok = df_with_anomalies['Numéro de compteur'].str.len() == 11
-    starts_with_letter = df_with_anomalies['Numéro de compteur'].str[0].str.isalpha(); fourth_is_letter = df_with_anomalies['Numéro de compteur'].str[3].str.isalpha()
-    condition_type_compteur = is_brand_ok & is_len_ok & starts_with_letter & fourth_is_letter
-    rows_to_check = df_with_anomalies[condition_type_compteur].copy()
-    if not rows_to_check.empty:
-        sappel_rows = rows_to_check[rows_to_check['Marque'].str.upper().isin(['SAPPEL (C)', 'SAPPEL (H)', 'SAPPEL(C)'])]
-        if not sappel_rows.empty:
-            correct_type_sappel = sappel_rows['Numéro de compteur'].str[0] + sappel_rows['Numéro de compteur'].str[3]
-            incorrect_mask_sappel = sappel_rows['Type Compteur'] != correct_type_sappel
-            incorrect_indices_sappel = sappel_rows[incorrect_mask_sappel].index
-            if not incorrect_indices_sappel.empty:
-                df_with_anomalies.loc[incorrect_indices_sappel, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_sappel, 'Correction Type Compteur'] = correct_type_sappel[incorrect_mask_sappel]
-        
-        itron_rows = rows_to_check[rows_to_check['Marque'].str.upper() == 'ITRON']
-        if not itron_rows.empty:
-            correct_type_itron = 'I' + itron_rows['Numéro de compteur'].str[3]
-            incorrect_mask_itron = itron_rows['Type Compteur'] != correct_type_itron
-            incorrect_indices_itron = itron_rows[incorrect_mask_itron].index
-            if not incorrect_indices_itron.empty:
-                df_with_anomalies.loc[incorrect_indices_itron, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_itron, 'Correction Type Compteur'] = correct_type_itron[incorrect_mask_itron]
-    
-    fp2e_regex = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'; sappel_itron_non_manuelle = (is_sappel | is_itron) & (df_with_anomalies['Mode de relève'].str.upper() != 'MANUELLE'); manuelle_format_ok = (df_with_anomalies['Mode de relève'].str.upper() == 'MANUELLE') & (df_with_anomalies['Numéro de compteur'].str.match(fp2e_regex, na=False)); fp2e_check_condition = sappel_itron_non_manuelle | manuelle_format_ok; fp2e_results = df_with_anomalies[fp2e_check_condition].apply(check_fp2e_details_tele, axis=1)
-    for index, result in fp2e_results.items():
-        anomalies, corrections = result
-        if anomalies: df_with_anomalies.loc[index, 'Anomalie'] += ' / '.join(anomalies) + ' / '
-        if 'annee' in corrections: df_with_anomalies.loc[index, 'Correction Année'] = corrections['annee']
-        if 'diametre' in corrections: df_with_anomalies.loc[index, 'Correction Diamètre'] = corrections['diametre']
-    is_fp2e_compliant = df_with_anomalies['Numéro de compteur'].str.match(fp2e_regex, na=False)
-    df_with_anomalies.loc[is_mode_manuelle & is_itron & is_fp2e_compliant & (~df_with_anomalies['Numéro de compteur'].str.lower().str.startswith(('i', 'd'), na=False)), 'Anomalie'] += 'ITRON manuel: doit commencer par "I" ou "D" / '
-    df_with_anomalies.loc[is_mode_manuelle & is_sappel & is_fp2e_compliant & (~df_with_anomalies['Numéro de compteur'].str.lower().str.startswith(('c', 'h'), na=False)), 'Anomalie'] += 'SAPPEL manuel: doit commencer par "C" ou "H" / '
-    df_with_anomalies['Anomalie'] = df_with_anomalies['Anomalie'].str.strip().str.rstrip(' /'); anomalies_df = df_with_anomalies[(df_with_anomalies['Anomalie'] != '') | (df_with_anomalies['Correction Année'] != '') | (df_with_anomalies['Correction Diamètre'] != '')| (df_with_anomalies['Correction Type Compteur'] != '') | (df_with_anomalies['Correction Marque'] != '') | (df_with_anomalies['Correction Numéro de Tête'] != '') | (df_with_anomalies['Correction Protocole Radio'] != '')].copy(); anomalies_df.reset_index(inplace=True); anomalies_df.rename(columns={'index': 'Index original'}, inplace=True)
-    
-    try:
-        cols = list(anomalies_df.columns); cols.remove('Correction Année'); cols.remove('Correction Diamètre'); cols.remove('Correction Type Compteur'); cols.remove('Correction Marque'); cols.remove('Correction Numéro de Tête'); cols.remove('Correction Protocole Radio')
-        pos_annee = cols.index('Année de fabrication') + 1; cols.insert(pos_annee, 'Correction Année')
-        pos_diametre = cols.index('Diametre') + 1; cols.insert(pos_diametre, 'Correction Diamètre')
-        pos_type = cols.index('Type Compteur') + 1; cols.insert(pos_type, 'Correction Type Compteur')
-        pos_marque = cols.index('Marque') + 1; cols.insert(pos_marque, 'Correction Marque')
-        pos_tete = cols.index('Numéro de tête') + 1; cols.insert(pos_tete, 'Correction Numéro de Tête')
-        pos_protocole = cols.index('Protocole Radio') + 1; cols.insert(pos_protocole, 'Correction Protocole Radio')
-        anomalies_df = anomalies_df[cols]
-    except ValueError: pass
-
-    return anomalies_df, anomalies_df['Anomalie'].str.split(' / ').explode().value_counts()
+def choisir_colonnes(sonde, profil, nom):
+    """Option de lecture rapide : colonnes requises + colonnes choisies par l'utilisateur (None = toutes les colonnes)."""
+    if not st.checkbox("Lecture rapide : uniquement les colonnes contrôlées", key=f"rapide_{nom}"): return None
+    return st.multiselect("Colonnes supplémentaires à conserver dans le rapport", [col for col in sonde.colonnes if col not in profil.colonnes_requises], key=f"garder_{nom}")
 
 def afficher_resume_anomalies_tele(anomaly_counter):
     if not anomaly_counter.empty:
         st.subheader("Récapitulatif des anomalies"); st.dataframe(pd.DataFrame(anomaly_counter).reset_index().rename(columns={"index": "Type d'anomalie", 0: "Nombre de cas"}))
 
-def create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type="radio"):
-    summary_data = []
-    correction_map = {}
-
-    if tab_type == "radio":
-        correction_map = {
-            'L\'année de millésime n\'est pas conforme': 'Correction Année', 'Le diamètre n\'est pas conforme': 'Correction Diamètre',
-            'Incohérence Type Compteur': 'Correction Type Compteur', 'SAPPEL: Incohérence Marque/Compteur (C)': 'Correction Marque',
-            'SAPPEL: Incohérence Marque/Compteur (H)': 'Correction Marque', 'Numéro de tête manquant': 'Correction Numéro de Tête',
-            'KAMSTRUP: Protocole ≠ WMS': 'Correction Protocole Radio', 'SAPPEL: Protocole ≠ OMS (année > 22)': 'Correction Protocole Radio',
-            'SAPPEL: Protocole ≠ WMS (année <= 22)': 'Correction Protocole Radio'
-        }
-    elif tab_type == "tele":
-        correction_map = {
-            'Année millésime non conforme FP2E': 'Correction Année', 'Diamètre non conforme FP2E': 'Correction Diamètre',
-            'Incohérence Type Compteur': 'Correction Type Compteur', 'SAPPEL: Incohérence Marque/Compteur (C)': 'Correction Marque',
-            'SAPPEL: Incohérence Marque/Compteur (H)': 'Correction Marque',
-            'Protocole incorrect (devrait être LRA)': 'Correction Protocole Radio',
-            'Protocole incorrect (devrait être SGX)': 'Correction Protocole Radio'
-        }
-    elif tab_type == "manuelle":
-        correction_map = {
-            'L\'année de millésime n\'est pas conforme': 'Correction Année',
-            'Le diamètre n\'est pas conforme': 'Correction Diamètre',
-            'SAPPEL: Incohérence Marque/Compteur (C)': 'Correction Marque',
-            'SAPPEL: Incohérence Marque/Compteur (H)': 'Correction Marque',
-            'ITRON: Incohérence Marque/Compteur': 'Correction Marque',
-            'Incohérence Type Compteur': 'Correction Type Compteur'
-        }
-
-
-    for anomaly_type, count in anomaly_counter.items():
-        correction_col = correction_map.get(anomaly_type)
-        corrections_count = 0
-        if correction_col:
-            corrections_count = anomalies_df[anomalies_df['Anomalie'].str.contains(re.escape(anomaly_type), na=False) & (anomalies_df[correction_col] != '')].shape[0]
-        summary_data.append([anomaly_type, count, corrections_count])
-
-    summary_df = pd.DataFrame(summary_data, columns=["Type d'anomalie", "Nombre de cas", "Corrections Proposées"])
-    return summary_df
-    
-def check_data_manuelle(df):
-    """Vérifie les données du DataFrame pour l'onglet Manuelle."""
-    required_cols = ['Latitude', 'Longitude', 'Numéro de compteur', 'Marque', 'Année de fabrication', 'Diametre', 'Type Compteur']
-    if not all(col in df.columns for col in required_cols):
-        missing = [col for col in required_cols if col not in df.columns]; st.error(f"Colonnes requises manquantes : {', '.join(missing)}"); st.stop()
-        
-    df_with_anomalies = df.copy()
-    df_with_anomalies['Anomalie'] = ''
-    df_with_anomalies['Correction Année'] = ''
-    df_with_anomalies['Correction Diamètre'] = ''
-    df_with_anomalies['Correction Marque'] = ''
-    df_with_anomalies['Correction Type Compteur'] = ''
-
-    df_with_anomalies['Année de fabrication'] = df_with_anomalies['Année de fabrication'].astype(str).replace('nan', '', regex=False).apply(lambda x: str(int(float(x))) if x.replace('.', '', 1).isdigit() and x != '' else x).str.slice(-2).str.zfill(2)
-    df_with_anomalies['Latitude'] = pd.to_numeric(df_with_anomalies['Latitude'], errors='coerce')
-    df_with_anomalies['Longitude'] = pd.to_numeric(df_with_anomalies['Longitude'], errors='coerce')
-    df_with_anomalies['Diametre'] = pd.to_numeric(df_with_anomalies['Diametre'], errors='coerce')
-
-    df_with_anomalies.loc[df_with_anomalies['Latitude'].isnull() | df_with_anomalies['Longitude'].isnull(), 'Anomalie'] += 'Coordonnées GPS non numériques / '
-    coord_invalid = ((df_with_anomalies['Latitude'] == 0) | (~df_with_anomalies['Latitude'].between(-90, 90))) | ((df_with_anomalies['Longitude'] == 0) | (~df_with_anomalies['Longitude'].between(-180, 180)))
-    df_with_anomalies.loc[coord_invalid, 'Anomalie'] += 'Coordonnées GPS invalides / '
-
-    is_sappel = df_with_anomalies['Marque'].str.upper().isin(['SAPPEL (C)', 'SAPPEL (H)']); is_itron = df_with_anomalies['Marque'].str.upper() == 'ITRON'
-    fp2e_regex = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'
-    has_fp2e_format = df_with_anomalies['Numéro de compteur'].str.match(fp2e_regex, na=False)
-    
-    df_with_anomalies.loc[(is_sappel | is_itron) & (~has_fp2e_format), 'Anomalie'] += 'Compteur non-FP2E pour SAPPEL/ITRON / '
-
-    compteur_starts_C = df_with_anomalies['Numéro de compteur'].str.startswith('C'); marque_not_sappel_C = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (C)'
-    df_with_anomalies.loc[has_fp2e_format & compteur_starts_C & marque_not_sappel_C, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (C) / '; df_with_anomalies.loc[has_fp2e_format & compteur_starts_C & marque_not_sappel_C, 'Correction Marque'] = 'SAPPEL (C)'
-    
-    compteur_starts_H = df_with_anomalies['Numéro de compteur'].str.startswith('H'); marque_not_sappel_H = df_with_anomalies['Marque'].str.upper() != 'SAPPEL (H)'
-    df_with_anomalies.loc[has_fp2e_format & compteur_starts_H & marque_not_sappel_H, 'Anomalie'] += 'SAPPEL: Incohérence Marque/Compteur (H) / '; df_with_anomalies.loc[has_fp2e_format & compteur_starts_H & marque_not_sappel_H, 'Correction Marque'] = 'SAPPEL (H)'
-
-    compteur_starts_ID = df_with_anomalies['Numéro de compteur'].str.startswith(('I', 'D')); marque_not_itron = df_with_anomalies['Marque'].str.upper() != 'ITRON'
-    df_with_anomalies.loc[has_fp2e_format & compteur_starts_ID & marque_not_itron, 'Anomalie'] += 'ITRON: Incohérence Marque/Compteur / '; df_with_anomalies.loc[has_fp2e_format & compteur_starts_ID & marque_not_itron, 'Correction Marque'] = 'ITRON'
-
-    fp2e_results = df_with_anomalies[has_fp2e_format].apply(check_fp2e_details_radio, axis=1)
-    for index, result in fp2e_results.items():
-        anomalies, corrections = result
-        if anomalies: df_with_anomalies.loc[index, 'Anomalie'] += ' / '.join(anomalies) + ' / '
-        if 'annee' in corrections: df_with_anomalies.loc[index, 'Correction Année'] = corrections['annee']
-        if 'diametre' in corrections: df_with_anomalies.loc[index, 'Correction Diamètre'] = corrections['diametre']
-        
-    starts_with_key_letter = df_with_anomalies['Numéro de compteur'].str.startswith(('C', 'H', 'I', 'D'))
-    condition_type_compteur = has_fp2e_format & starts_with_key_letter
-    rows_to_check = df_with_anomalies[condition_type_compteur].copy()
-    if not rows_to_check.empty:
-        sappel_mask = rows_to_check['Numéro de compteur'].str.startswith(('C', 'H'))
-        sappel_rows = rows_to_check[sappel_mask]
-        if not sappel_rows.empty:
-            correct_type_sappel = sappel_rows['Numéro de compteur'].str[0] + sappel_rows['Numéro de compteur'].str[3]
-            incorrect_mask_sappel = sappel_rows['Type Compteur'] != correct_type_sappel
-            incorrect_indices_sappel = sappel_rows[incorrect_mask_sappel].index
-            if not incorrect_indices_sappel.empty:
-                df_with_anomalies.loc[incorrect_indices_sappel, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_sappel, 'Correction Type Compteur'] = correct_type_sappel[incorrect_mask_sappel]
-        
-        itron_mask = rows_to_check['Numéro de compteur'].str.startswith(('I', 'D'))
-        itron_rows = rows_to_check[itron_mask]
-        if not itron_rows.empty:
-            correct_type_itron = 'I' + itron_rows['Numéro de compteur'].str[3]
-            incorrect_mask_itron = itron_rows['Type Compteur'] != correct_type_itron
-            incorrect_indices_itron = itron_rows[incorrect_mask_itron].index
-            if not incorrect_indices_itron.empty:
-                df_with_anomalies.loc[incorrect_indices_itron, 'Anomalie'] += 'Incohérence Type Compteur / '; df_with_anomalies.loc[incorrect_indices_itron, 'Correction Type Compteur'] = correct_type_itron[incorrect_mask_itron]
-
-    df_with_anomalies['Anomalie'] = df_with_anomalies['Anomalie'].str.strip().str.rstrip(' /')
-    anomalies_df = df_with_anomalies[(df_with_anomalies['Anomalie'] != '') | (df_with_anomalies['Correction Année'] != '') | (df_with_anomalies['Correction Diamètre'] != '') | (df_with_anomalies['Correction Marque'] != '') | (df_with_anomalies['Correction Type Compteur'] != '')].copy()
-    
-    if not anomalies_df.empty:
-        anomalies_df.reset_index(inplace=True); anomalies_df.rename(columns={'index': 'Index original'}, inplace=True)
-        try:
-            cols = list(anomalies_df.columns); cols.remove('Correction Année'); cols.remove('Correction Diamètre'); cols.remove('Correction Marque'); cols.remove('Correction Type Compteur')
-            pos_annee = cols.index('Année de fabrication') + 1; cols.insert(pos_annee, 'Correction Année')
-            pos_diametre = cols.index('Diametre') + 1; cols.insert(pos_diametre, 'Correction Diamètre')
-            pos_marque = cols.index('Marque') + 1; cols.insert(pos_marque, 'Correction Marque')
-            pos_type = cols.index('Type Compteur') + 1; cols.insert(pos_type, 'Correction Type Compteur')
-            anomalies_df = anomalies_df[cols]
-        except ValueError: pass
-    
-    anomaly_counter = anomalies_df['Anomalie'].str.split(' / ').explode().value_counts()
-    return anomalies_df, anomaly_counter
-
 # #############################################################################
 # --- CRÉATION DES ONGLETS ET INTERFACE UTILISATEUR ---
 # #############################################################################
 
-tab1, tab2, tab3 = st.tabs(["📊 Contrôle Radiorelève", "📡 Contrôle Télérelève", "✍️ Controle manuelle"])
+tab1, tab2, tab3, tab4 = st.tabs(["📊 Contrôle Radiorelève", "📡 Contrôle Télérelève", "✍️ Controle manuelle", "🗂️ Historique"])
 
 # --- ONGLET 1 : RADIORELÈVE (INTERFACE UTILISATEUR) ---
 with tab1:
     st.header("Contrôle des données de Radiorelève")
     st.markdown("Veuillez téléverser votre fichier pour lancer les contrôles.")
-    uploaded_file_radio = st.file_uploader("Choisissez un fichier (Radiorelève)", type=['csv', 'xlsx'], key="uploader_radio")
+    uploaded_file_radio = st.file_uploader("Choisissez un fichier (Radiorelève)", type=TYPES_FICHIERS, key="uploader_radio")
     if uploaded_file_radio:
         st.success("Fichier chargé avec succès !");
         try:
-            df = pd.read_excel(uploaded_file_radio, dtype=str) if uploaded_file_radio.name.endswith('xlsx') else pd.read_csv(uploaded_file_radio, sep=get_csv_delimiter_radio(uploaded_file_radio), dtype=str)
-            df = df.iloc[:-2].copy()
+            cle_radio = (empreinte(uploaded_file_radio.getvalue()), PROFIL_RADIO.nom, cle_geo)
+            sonde_radio = sonder_fichier(uploaded_file_radio, PROFIL_RADIO, cle_radio); sep_radio = sonde_radio.delimiteur
+            mode_flux_radio = sonde_radio.csv and st.checkbox("Mode flux : contrôler le CSV par blocs (fichiers volumineux)", key="flux_radio")
+            mode_delta_radio = not mode_flux_radio and st.checkbox("Mode delta : ne recontrôler que les lignes modifiées depuis la campagne précédente", key="delta_radio", help="Référence : la dernière exécution de la campagne nommée dans la barre latérale (à défaut, du même nom de fichier).")
+            colonnes_radio = choisir_colonnes(sonde_radio, PROFIL_RADIO, "radio"); cle_radio += (None if colonnes_radio is None else tuple(colonnes_radio),)
+            if mode_flux_radio:
+                uploaded_file_radio.seek(0); df = pd.read_csv(uploaded_file_radio, sep=sep_radio, encoding=sonde_radio.encodage, dtype=str, nrows=5, usecols=colonnes_a_lire(PROFIL_RADIO, colonnes_radio)); uploaded_file_radio.seek(0); durees_radio = {}
+            else:
+                df, sep_radio, durees_radio = lire_fichier(uploaded_file_radio, PROFIL_RADIO, cle_radio, colonnes_radio, sonde_radio); st.caption(f"Lecture du fichier : {durees_radio['lecture']:.2f} s" + (f" (moteur xlsx : {MOTEUR_EXCEL})" if sonde_radio.excel else ""))
             st.subheader("Aperçu des 5 premières lignes"); st.dataframe(df.head())
-            if st.button("Lancer les contrôles (Radiorelève)", key="button_radio"):
-                with st.spinner("Contrôles en cours..."): anomalies_df, anomaly_counter = check_data_radio(df)
+            cle_radio += ('flux' if mode_flux_radio else ('delta', campagne_de(uploaded_file_radio)) if mode_delta_radio else 'complet',)
+            if st.button("Lancer les contrôles (Radiorelève)", key="button_radio"):  # tâche de fond : les réexécutions du script se rattachent au même travail
+                controle_radio = controle_a_soumettre(PROFIL_RADIO, df, uploaded_file_radio, sonde_radio, colonnes_radio, mode_flux_radio, mode_delta_radio)
+                st.session_state["travail_radio"] = travaux.soumettre(cle_radio, PROFIL_RADIO, traitement_en_fond(uploaded_file_radio, PROFIL_RADIO, controle_radio, durees_radio, sonde_radio, sep_radio, cle_radio)).identifiant
+            resultats_radio = resultats_travail("radio", cle_radio)
+            if resultats_radio is not None:
+                anomalies_df = resultats_radio.anomalies_df
                 if not anomalies_df.empty:
-                    st.error(f"Anomalies et/ou corrections détectées : {len(anomalies_df)} lignes concernées."); anomalies_df_display = anomalies_df.drop(columns=['Anomalie Détaillée FP2E'], errors='ignore'); st.dataframe(anomalies_df_display); 
-                    summary_df = create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type="radio")
-                    st.subheader("Récapitulatif des anomalies"); st.dataframe(summary_df)
-                    anomaly_columns_map = {"KAMSTRUP: Protocole ≠ WMS": ['Protocole Radio'], "SAPPEL: Protocole ≠ OMS (année > 22)": ['Protocole Radio'], "SAPPEL: Protocole ≠ WMS (année <= 22)": ['Protocole Radio'], "Marque manquante": ['Marque'], "Numéro de compteur manquant": ['Numéro de compteur'], "Numéro de tête manquant": ['Numéro de tête'], "Coordonnées GPS non numériques": ['Latitude', 'Longitude'], "Coordonnées GPS invalides": ['Latitude', 'Longitude'], "Diamètre manquant": ['Diametre'], "Année de fabrication manquante": ['Année de fabrication'], "KAMSTRUP: Compteur ≠ 8 caractères": ['Numéro de compteur'], "KAMSTRUP: Compteur ≠ Tête": ['Numéro de compteur', 'Numéro de tête'], "KAMSTRUP: Compteur ou Tête non numérique": ['Numéro de compteur', 'Numéro de tête'], "KAMSTRUP: Diamètre hors plage": ['Diametre'], "SAPPEL: Tête DME ≠ 15 caractères": ['Numéro de tête'], "SAPPEL: Compteur ne commence pas par C ou H": ['Numéro de compteur'], "SAPPEL: Incohérence Marque/Compteur (C)": ['Marque'], "SAPPEL: Incohérence Marque/Compteur (H)": ['Marque'], "ITRON: Compteur ne commence pas par I ou D": ['Numéro de compteur'], "Le numéro de compteur n'est pas conforme": ['Numéro de compteur'], "Le diamètre n'est pas conforme": ['Diametre'], "L'année de millésime n'est pas conforme": ['Année de fabrication'], "Incohérence Type Compteur": ['Type Compteur']}
-                    if uploaded_file_radio.name.endswith('csv'): st.download_button(label="📥 Télécharger le rapport en CSV", data=anomalies_df_display.to_csv(index=False, sep=get_csv_delimiter_radio(uploaded_file_radio)).encode('utf-8'), file_name='anomalies_radioreleve.csv', mime='text/csv')
-                    elif uploaded_file_radio.name.endswith('xlsx'):
-                        excel_buffer = io.BytesIO(); wb = Workbook();
-                        if "Sheet" in wb.sheetnames: wb.remove(wb["Sheet"])
-                        ws_summary = wb.create_sheet(title="Récapitulatif", index=0); ws_all_anomalies = wb.create_sheet(title="Toutes_Anomalies", index=1)
-                        for r in dataframe_to_rows(anomalies_df_display, index=False, header=True): ws_all_anomalies.append(r)
-                        header_font = Font(bold=True); red_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                        for cell in ws_all_anomalies[1]: cell.font = header_font
-                        for row_num_all, df_row in enumerate(anomalies_df.iterrows()):
-                            for anomaly in str(df_row[1]['Anomalie']).split(' / '):
-                                if anomaly.strip() in anomaly_columns_map:
-                                    for col_name in anomaly_columns_map[anomaly.strip()]:
-                                        try: ws_all_anomalies.cell(row=row_num_all + 2, column=list(anomalies_df_display.columns).index(col_name) + 1).fill = red_fill
-                                        except ValueError: pass
-                        for col in ws_all_anomalies.columns: ws_all_anomalies.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        ws_summary['A1'] = "Récapitulatif des anomalies"; ws_summary['A1'].font = Font(bold=True, size=16); ws_summary.append([]); 
-                        for r_idx, row_data in enumerate(dataframe_to_rows(summary_df, index=False, header=True)): ws_summary.append(row_data)
-                        for cell in ws_summary[3]: cell.font = header_font
-                        created_sheet_names = {"Récapitulatif", "Toutes_Anomalies"}
-                        link_row = ws_summary.max_row + 2; ws_summary.cell(row=link_row, column=1, value="Toutes les anomalies").hyperlink = f"#Toutes_Anomalies!A1"; ws_summary.cell(row=link_row, column=1).font = Font(underline="single", color="0563C1"); ws_summary.cell(row=link_row, column=2, value=len(anomalies_df))
-                        for idx, (anomaly_type, count, corrections) in enumerate(summary_df.values):
-                            current_row_num = 4 + idx; sheet_name = re.sub(r'[\\/?*\[\]:()\'"<>|]', '', anomaly_type[:28]).replace(' ', '_').strip(); original_sheet_name = sheet_name; s_counter = 1
-                            while sheet_name in created_sheet_names: sheet_name = f"{original_sheet_name[:28]}_{s_counter}"; s_counter += 1
-                            created_sheet_names.add(sheet_name)
-                            summary_cell = ws_summary.cell(row=current_row_num, column=1); summary_cell.hyperlink = f"#'{sheet_name}'!A1"; summary_cell.font = Font(underline="single", color="0563C1")
-                            ws_detail = wb.create_sheet(title=sheet_name); filtered_df = anomalies_df[anomalies_df['Anomalie'].str.contains(re.escape(anomaly_type), regex=True)]; filtered_df_display = filtered_df.drop(columns=['Anomalie Détaillée FP2E'], errors='ignore')
-                            for r in dataframe_to_rows(filtered_df_display, index=False, header=True): ws_detail.append(r)
-                            for cell in ws_detail[1]: cell.font = header_font
-                            for row_num_detail, df_row_detail in enumerate(filtered_df.iterrows()):
-                                for anomaly in str(df_row_detail[1]['Anomalie']).split(' / '):
-                                    if anomaly.strip() in anomaly_columns_map:
-                                        for col_name in anomaly_columns_map[anomaly.strip()]:
-                                            try: ws_detail.cell(row=row_num_detail + 2, column=list(filtered_df_display.columns).index(col_name) + 1).fill = red_fill
-                                            except ValueError: pass
-                            for col in ws_detail.columns: ws_detail.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        wb.save(excel_buffer); st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=excel_buffer, file_name='anomalies_radioreleve.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    st.error(f"Anomalies et/ou corrections détectées : {len(anomalies_df)} lignes concernées."); explorer_anomalies(resultats_radio, "radio")
+                    if sonde_radio.csv: st.download_button(label="📥 Télécharger le rapport en CSV (gzip)", data=resultats_radio.rapport, file_name='anomalies_radioreleve.csv.gz', mime='application/gzip', on_click="ignore")
+                    elif sonde_radio.excel: st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=resultats_radio.rapport, file_name='anomalies_radioreleve.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    bouton_rapport_parquet(resultats_radio, "radio", 'anomalies_radioreleve')
+                    bouton_fichier_corrige(uploaded_file_radio, resultats_radio, "radio")
                 else: st.success("✅ Aucune anomalie détectée.")
+                if resultats_radio.delta is not None: afficher_delta(resultats_radio.delta)
+                bouton_historique(resultats_radio, PROFIL_RADIO, uploaded_file_radio, df, sonde_radio, mode_flux_radio, "radio")
+                afficher_journal(resultats_radio.journal, "radio")
+        except ColonnesManquantesError as e: st.error(str(e))
         except Exception as e: st.error(f"Une erreur est survenue : {e}")
 
 # --- ONGLET 2 : TÉLÉRELÈVE (INTERFACE UTILISATEUR) ---
 with tab2:
     st.header("Contrôle des données de Télérelève")
     st.markdown("Veuillez téléverser votre fichier pour lancer les contrôles.")
-    uploaded_file_tele = st.file_uploader("Choisissez un fichier (Télérelève)", type=['csv', 'xlsx'], key="uploader_tele")
+    uploaded_file_tele = st.file_uploader("Choisissez un fichier (Télérelève)", type=TYPES_FICHIERS, key="uploader_tele")
     if uploaded_file_tele:
         st.success("Fichier chargé avec succès !");
         try:
-            df = pd.read_excel(uploaded_file_tele, dtype=str) if uploaded_file_tele.name.endswith('xlsx') else pd.read_csv(uploaded_file_tele, sep=get_csv_delimiter_tele(uploaded_file_tele), dtype=str)
-            df = df.iloc[:-2].copy()
+            cle_tele = (empreinte(uploaded_file_tele.getvalue()), PROFIL_TELE.nom, cle_geo)
+            sonde_tele = sonder_fichier(uploaded_file_tele, PROFIL_TELE, cle_tele); sep_tele = sonde_tele.delimiteur
+            mode_flux_tele = sonde_tele.csv and st.checkbox("Mode flux : contrôler le CSV par blocs (fichiers volumineux)", key="flux_tele")
+            mode_delta_tele = not mode_flux_tele and st.checkbox("Mode delta : ne recontrôler que les lignes modifiées depuis la campagne précédente", key="delta_tele", help="Référence : la dernière exécution de la campagne nommée dans la barre latérale (à défaut, du même nom de fichier).")
+            colonnes_tele = choisir_colonnes(sonde_tele, PROFIL_TELE, "tele"); cle_tele += (None if colonnes_tele is None else tuple(colonnes_tele),)
+            if mode_flux_tele:
+                uploaded_file_tele.seek(0); df = pd.read_csv(uploaded_file_tele, sep=sep_tele, encoding=sonde_tele.encodage, dtype=str, nrows=5, usecols=colonnes_a_lire(PROFIL_TELE, colonnes_tele)); uploaded_file_tele.seek(0); durees_tele = {}
+            else:
+                df, sep_tele, durees_tele = lire_fichier(uploaded_file_tele, PROFIL_TELE, cle_tele, colonnes_tele, sonde_tele); st.caption(f"Lecture du fichier : {durees_tele['lecture']:.2f} s" + (f" (moteur xlsx : {MOTEUR_EXCEL})" if sonde_tele.excel else ""))
             st.subheader("Aperçu des 5 premières lignes"); st.dataframe(df.head())
-            if st.button("Lancer les contrôles (Télérelève)", key="button_tele"):
-                with st.spinner("Contrôles en cours..."): anomalies_df, anomaly_counter = check_data_tele(df)
+            cle_tele += ('flux' if mode_flux_tele else ('delta', campagne_de(uploaded_file_tele)) if mode_delta_tele else 'complet',)
+            if st.button("Lancer les contrôles (Télérelève)", key="button_tele"):  # tâche de fond : les réexécutions du script se rattachent au même travail
+                controle_tele = controle_a_soumettre(PROFIL_TELE, df, uploaded_file_tele, sonde_tele, colonnes_tele, mode_flux_tele, mode_delta_tele)
+                st.session_state["travail_tele"] = travaux.soumettre(cle_tele, PROFIL_TELE, traitement_en_fond(uploaded_file_tele, PROFIL_TELE, controle_tele, durees_tele, sonde_tele, sep_tele, cle_tele)).identifiant
+            resultats_tele = resultats_travail("tele", cle_tele)
+            if resultats_tele is not None:
+                anomalies_df = resultats_tele.anomalies_df
                 if not anomalies_df.empty:
-                    st.error(f"Anomalies et/ou corrections détectées : {len(anomalies_df)} lignes concernées."); anomalies_df_display = anomalies_df.drop(columns=['Anomalie Détaillée FP2E'], errors='ignore'); st.dataframe(anomalies_df_display); 
-                    summary_df = create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type="tele")
-                    st.subheader("Récapitulatif des anomalies"); st.dataframe(summary_df)
-                    anomaly_columns_map = {"Protocole incorrect (devrait être LRA)": ['Protocole Radio'], "Protocole incorrect (devrait être SGX)": ['Protocole Radio'], "Marque manquante": ['Marque'],"Numéro de compteur manquant": ['Numéro de compteur'],"Numéro de tête manquant": ['Numéro de tête'],"Coordonnées GPS non numériques": ['Latitude', 'Longitude'],"Coordonnées GPS invalides": ['Latitude', 'Longitude'],"Diamètre manquant": ['Diametre'],"Année de fabrication manquante": ['Année de fabrication'],"KAMSTRUP: Compteur ≠ 8 caractères": ['Numéro de compteur'],"KAMSTRUP: Compteur ≠ Tête": ['Numéro de compteur', 'Numéro de tête'],"KAMSTRUP: Compteur ou Tête non numérique": ['Numéro de compteur', 'Numéro de tête'],"KAMSTRUP: Diamètre hors de la plage [15, 80]": ['Diametre'],"SAPPEL: Tête ≠ 16 caractères": ['Numéro de tête'],"SAPPEL: Incohérence Marque/Compteur (C)": ['Marque'],"SAPPEL: Incohérence Marque/Compteur (H)": ['Marque'],"ITRON: Tête ≠ 8 caractères": ['Numéro de tête'],"ITRON manuel: doit commencer par \"I\" ou \"D\"": ['Numéro de compteur'],"SAPPEL manuel: doit commencer par \"C\" ou \"H\"": ['Numéro de compteur'],"Format de compteur non FP2E": ['Numéro de compteur'],"Année millésime non conforme FP2E": ['Année de fabrication'],"Diamètre non conforme FP2E": ['Diametre'], "Incohérence Type Compteur": ['Type Compteur']}
-                    if uploaded_file_tele.name.endswith('csv'): st.download_button(label="📥 Télécharger le rapport en CSV", data=anomalies_df_display.to_csv(index=False, sep=get_csv_delimiter_tele(uploaded_file_tele)).encode('utf-8'), file_name='anomalies_telerelève.csv', mime='text/csv')
-                    elif uploaded_file_tele.name.endswith('xlsx'):
-                        excel_buffer = io.BytesIO(); wb = Workbook();
-                        if "Sheet" in wb.sheetnames: wb.remove(wb["Sheet"])
-                        ws_summary = wb.create_sheet(title="Récapitulatif", index=0); ws_all_anomalies = wb.create_sheet(title="Toutes_Anomalies", index=1)
-                        for r in dataframe_to_rows(anomalies_df_display, index=False, header=True): ws_all_anomalies.append(r)
-                        header_font = Font(bold=True); red_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                        for cell in ws_all_anomalies[1]: cell.font = header_font
-                        for row_num_all, df_row in enumerate(anomalies_df.iterrows()):
-                            for anomaly in str(df_row[1]['Anomalie']).split(' / '):
-                                if anomaly.strip() in anomaly_columns_map:
-                                    for col_name in anomaly_columns_map[anomaly.strip()]:
-                                        try: ws_all_anomalies.cell(row=row_num_all + 2, column=list(anomalies_df_display.columns).index(col_name) + 1).fill = red_fill
-                                        except ValueError: pass
-                        for col in ws_all_anomalies.columns: ws_all_anomalies.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        ws_summary['A1'] = "Récapitulatif des anomalies"; ws_summary['A1'].font = Font(bold=True, size=16); ws_summary.append([]); 
-                        for r in dataframe_to_rows(summary_df, index=False, header=True): ws_summary.append(r)
-                        for cell in ws_summary[3]: cell.font = header_font
-                        created_sheet_names = {"Récapitulatif", "Toutes_Anomalies"}
-                        link_row = ws_summary.max_row + 2; ws_summary.cell(row=link_row, column=1, value="Toutes les anomalies").hyperlink = f"#'Toutes_Anomalies'!A1"; ws_summary.cell(row=link_row, column=1).font = Font(underline="single", color="0563C1"); ws_summary.cell(row=link_row, column=2, value=len(anomalies_df))
-                        for idx, (anomaly_type, count, corrections) in enumerate(summary_df.values):
-                            current_row_num = 4 + idx
-                            sheet_name = re.sub(r'[\\/?*\[\]:()\'"<>|]', '', anomaly_type).replace(' ', '_').replace('.', '').replace(':', '_').strip(); sheet_name = sheet_name[:31].rstrip('_').strip(); original_sheet_name = sheet_name; s_counter = 1
-                            while sheet_name in created_sheet_names: sheet_name = f"{original_sheet_name[:28]}_{s_counter}"; s_counter += 1
-                            created_sheet_names.add(sheet_name)
-                            summary_cell = ws_summary.cell(row=current_row_num, column=1)
-                            summary_cell.hyperlink = f"#'{sheet_name}'!A1"
-                            summary_cell.font = Font(underline="single", color="0563C1")
-                            ws_detail = wb.create_sheet(title=sheet_name); filtered_df = anomalies_df[anomalies_df['Anomalie'].str.contains(re.escape(anomaly_type), regex=True)]; filtered_df_display = filtered_df.drop(columns=['Anomalie Détaillée FP2E'], errors='ignore')
-                            for r in dataframe_to_rows(filtered_df_display, index=False, header=True): ws_detail.append(r)
-                            for cell in ws_detail[1]: cell.font = header_font
-                            for row_num_detail, df_row_detail in enumerate(filtered_df.iterrows()):
-                                for anomaly in str(df_row_detail[1]['Anomalie']).split(' / '):
-                                    if anomaly.strip() in anomaly_columns_map:
-                                        for col_name in anomaly_columns_map[anomaly.strip()]:
-                                            try: ws_detail.cell(row=row_num_detail + 2, column=list(filtered_df_display.columns).index(col_name) + 1).fill = red_fill
-                                            except ValueError: pass
-                            for col in ws_detail.columns: ws_detail.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        wb.save(excel_buffer); st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=excel_buffer, file_name='anomalies_telerelève.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    st.error(f"Anomalies et/ou corrections détectées : {len(anomalies_df)} lignes concernées."); explorer_anomalies(resultats_tele, "tele")
+                    if sonde_tele.csv: st.download_button(label="📥 Télécharger le rapport en CSV (gzip)", data=resultats_tele.rapport, file_name='anomalies_telerelève.csv.gz', mime='application/gzip', on_click="ignore")
+                    elif sonde_tele.excel: st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=resultats_tele.rapport, file_name='anomalies_telerelève.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    bouton_rapport_parquet(resultats_tele, "tele", 'anomalies_telerelève')
+                    bouton_fichier_corrige(uploaded_file_tele, resultats_tele, "tele")
                 else: st.success("✅ Aucune anomalie détectée.")
+                if resultats_tele.delta is not None: afficher_delta(resultats_tele.delta)
+                bouton_historique(resultats_tele, PROFIL_TELE, uploaded_file_tele, df, sonde_tele, mode_flux_tele, "tele")
+                afficher_journal(resultats_tele.journal, "tele")
+        except ColonnesManquantesError as e: st.error(str(e))
         except Exception as e: st.error(f"Une erreur est survenue : {e}")
 
 # --- ONGLET 3 : CONTROLE MANUELLE ---
 with tab3:
     st.header("Contrôle des données manuelles")
     st.markdown("Veuillez téléverser votre fichier pour lancer les contrôles.")
-    uploaded_file_manuelle = st.file_uploader("Choisissez un fichier (Manuelle)", type=['csv', 'xlsx'], key="uploader_manuelle")
+    uploaded_file_manuelle = st.file_uploader("Choisissez un fichier (Manuelle)", type=TYPES_FICHIERS, key="uploader_manuelle")
 
     if uploaded_file_manuelle:
         st.success("Fichier chargé avec succès !")
         try:
-            file_extension = uploaded_file_manuelle.name.split('.')[-1]
-            dtype_mapping = {'Numéro de branchement': str, 'Abonnement': str}
-            if file_extension == 'csv':
-                df = pd.read_csv(uploaded_file_manuelle, sep=get_csv_delimiter_radio(uploaded_file_manuelle), dtype=dtype_mapping)
+            cle_manuelle = (empreinte(uploaded_file_manuelle.getvalue()), PROFIL_MANUELLE.nom, cle_geo)
+            sonde_manuelle = sonder_fichier(uploaded_file_manuelle, PROFIL_MANUELLE, cle_manuelle)
+            sep_manuelle = sonde_manuelle.delimiteur
+            mode_flux_manuelle = sonde_manuelle.csv and st.checkbox("Mode flux : contrôler le CSV par blocs (fichiers volumineux)", key="flux_manuelle")
+            colonnes_manuelle = choisir_colonnes(sonde_manuelle, PROFIL_MANUELLE, "manuelle"); cle_manuelle += (None if colonnes_manuelle is None else tuple(colonnes_manuelle),)
+            if mode_flux_manuelle:
+                uploaded_file_manuelle.seek(0)
+                df = pd.read_csv(uploaded_file_manuelle, sep=sep_manuelle, encoding=sonde_manuelle.encodage, dtype=PROFIL_MANUELLE.dtype_lecture, nrows=5, usecols=colonnes_a_lire(PROFIL_MANUELLE, colonnes_manuelle))
+                uploaded_file_manuelle.seek(0)
+                durees_manuelle = {}
             else:
-                df = pd.read_excel(uploaded_file_manuelle, dtype=dtype_mapping)
-            
-            df = df.iloc[:-2].copy()
+                df, sep_manuelle, durees_manuelle = lire_fichier(uploaded_file_manuelle, PROFIL_MANUELLE, cle_manuelle, colonnes_manuelle, sonde_manuelle)
+                st.caption(f"Lecture du fichier : {durees_manuelle['lecture']:.2f} s" + (f" (moteur xlsx : {MOTEUR_EXCEL})" if sonde_manuelle.excel else ""))
+
             st.subheader("Aperçu des 5 premières lignes")
             st.dataframe(df.head())
 
+            cle_manuelle += ('flux' if mode_flux_manuelle else 'complet',)
             if st.button("Lancer les contrôles (Manuelle)", key="button_manuelle"):
-                with st.spinner("Contrôles en cours..."):
-                    anomalies_df, anomaly_counter = check_data_manuelle(df)
-                
+                controle_manuelle = controle_a_soumettre(PROFIL_MANUELLE, df, uploaded_file_manuelle, sonde_manuelle, colonnes_manuelle, mode_flux_manuelle, False)
+                traitement = traitement_en_fond(uploaded_file_manuelle, PROFIL_MANUELLE, controle_manuelle, durees_manuelle, sonde_manuelle, ',', cle_manuelle)
+                st.session_state["travail_manuelle"] = travaux.soumettre(cle_manuelle, PROFIL_MANUELLE, traitement).identifiant
+
+            resultats_manuelle = resultats_travail("manuelle", cle_manuelle)
+            if resultats_manuelle is not None:
+                anomalies_df = resultats_manuelle.anomalies_df
                 if not anomalies_df.empty:
                     st.error(f"Anomalies et/ou corrections détectées : {len(anomalies_df)} lignes concernées.")
-                    st.dataframe(anomalies_df)
-                    summary_df = create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type="manuelle")
-                    st.subheader("Récapitulatif des anomalies"); st.dataframe(summary_df)
-
-                    anomaly_columns_map_manuelle = {
-                        "Coordonnées GPS non numériques": ['Latitude', 'Longitude'],
-                        "Coordonnées GPS invalides": ['Latitude', 'Longitude'],
-                        "L'année de millésime n'est pas conforme": ['Année de fabrication'],
-                        "Le diamètre n'est pas conforme": ['Diametre'],
-                        "Compteur non-FP2E pour SAPPEL/ITRON": ['Numéro de compteur'],
-                        "SAPPEL: Incohérence Marque/Compteur (C)": ['Marque'],
-                        "SAPPEL: Incohérence Marque/Compteur (H)": ['Marque'],
-                        "ITRON: Incohérence Marque/Compteur": ['Marque'],
-                        "Incohérence Type Compteur": ['Type Compteur']
-                    }
-                    
-                    if file_extension == 'csv':
-                        st.download_button(label="📥 Télécharger le rapport en CSV", data=anomalies_df.to_csv(index=False).encode('utf-8'), file_name='anomalies_manuelle.csv', mime='text/csv')
-                    elif file_extension == 'xlsx':
-                        excel_buffer = io.BytesIO(); wb = Workbook();
-                        if "Sheet" in wb.sheetnames: wb.remove(wb["Sheet"])
-                        ws_summary = wb.create_sheet(title="Récapitulatif", index=0); ws_all_anomalies = wb.create_sheet(title="Toutes_Anomalies", index=1)
-                        for r in dataframe_to_rows(anomalies_df, index=False, header=True): ws_all_anomalies.append(r)
-                        header_font = Font(bold=True); red_fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
-                        for cell in ws_all_anomalies[1]: cell.font = header_font
-                        for row_num_all, df_row in enumerate(anomalies_df.iterrows()):
-                            for anomaly in str(df_row[1]['Anomalie']).split(' / '):
-                                if anomaly.strip() in anomaly_columns_map_manuelle:
-                                    for col_name in anomaly_columns_map_manuelle[anomaly.strip()]:
-                                        try: ws_all_anomalies.cell(row=row_num_all + 2, column=list(anomalies_df.columns).index(col_name) + 1).fill = red_fill
-                                        except ValueError: pass
-                        for col in ws_all_anomalies.columns: ws_all_anomalies.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        ws_summary['A1'] = "Récapitulatif des anomalies"; ws_summary['A1'].font = Font(bold=True, size=16); ws_summary.append([]); 
-                        for r_idx, row_data in enumerate(dataframe_to_rows(summary_df, index=False, header=True)):
-                            ws_summary.append(row_data)
-                        for cell in ws_summary[3]: cell.font = header_font
-                        created_sheet_names = {"Récapitulatif", "Toutes_Anomalies"}
-                        link_row = ws_summary.max_row + 2; ws_summary.cell(row=link_row, column=1, value="Toutes les anomalies").hyperlink = f"#'Toutes_Anomalies'!A1"; ws_summary.cell(row=link_row, column=1).font = Font(underline="single", color="0563C1"); ws_summary.cell(row=link_row, column=2, value=len(anomalies_df))
-                        for idx, (anomaly_type, count, corrections) in enumerate(summary_df.values):
-                            current_row_num = 4 + idx
-                            sheet_name = re.sub(r'[\\/?*\[\]:()\'"<>|]', '', anomaly_type).replace(' ', '_').replace('.', '').replace(':', '_').strip(); sheet_name = sheet_name[:31].rstrip('_').strip(); original_sheet_name = sheet_name; s_counter = 1
-                            while sheet_name in created_sheet_names: sheet_name = f"{original_sheet_name[:28]}_{s_counter}"; s_counter += 1
-                            created_sheet_names.add(sheet_name)
-                            summary_cell = ws_summary.cell(row=current_row_num, column=1)
-                            summary_cell.hyperlink = f"#'{sheet_name}'!A1"
-                            summary_cell.font = Font(underline="single", color="0563C1")
-                            ws_detail = wb.create_sheet(title=sheet_name); filtered_df = anomalies_df[anomalies_df['Anomalie'].str.contains(re.escape(anomaly_type), regex=True)]
-                            for r in dataframe_to_rows(filtered_df, index=False, header=True): ws_detail.append(r)
-                            for cell in ws_detail[1]: cell.font = header_font
-                            for row_num_detail, df_row_detail in enumerate(filtered_df.iterrows()):
-                                for anomaly in str(df_row_detail[1]['Anomalie']).split(' / '):
-                                    if anomaly.strip() in anomaly_columns_map_manuelle:
-                                        for col_name in anomaly_columns_map_manuelle[anomaly.strip()]:
-                                            try: ws_detail.cell(row=row_num_detail + 2, column=list(filtered_df.columns).index(col_name) + 1).fill = red_fill
-                                            except ValueError: pass
-                            for col in ws_detail.columns: ws_detail.column_dimensions[get_column_letter(col[0].column)].width = max(len(str(cell.value)) for cell in col if cell.value) + 2
-                        wb.save(excel_buffer); st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=excel_buffer, file_name='anomalies_manuelle.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    explorer_anomalies(resultats_manuelle, "manuelle")
+
+                    if sonde_manuelle.csv:
+                        st.download_button(label="📥 Télécharger le rapport en CSV (gzip)", data=resultats_manuelle.rapport, file_name='anomalies_manuelle.csv.gz', mime='application/gzip', on_click="ignore")
+                    elif sonde_manuelle.excel:
+                        st.download_button(label="📥 Télécharger le rapport (.xlsx)", data=resultats_manuelle.rapport, file_name='anomalies_manuelle.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                    bouton_rapport_parquet(resultats_manuelle, "manuelle", 'anomalies_manuelle')
+                    bouton_fichier_corrige(uploaded_file_manuelle, resultats_manuelle, "manuelle")
 
                 else:
                     st.success("✅ Aucune anomalie détectée.")
+                bouton_historique(resultats_manuelle, PROFIL_MANUELLE, uploaded_file_manuelle, df, sonde_manuelle, mode_flux_manuelle, "manuelle")
+                afficher_journal(resultats_manuelle.journal, "manuelle")
 
+        except ColonnesManquantesError as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"Une erreur est survenue lors du traitement du fichier : {e}")
+
+# --- ONGLET 4 : HISTORIQUE DES CAMPAGNES ---
+with tab4:
+    st.header("Historique des campagnes")
+    st.markdown("Tendances des contrôles enregistrés, sans relire les exports.")
+    try:
+        afficher_historique()
+    except Exception as e:
+        st.error(f"Historique illisible : {e}")
@@ -0,0 +1 @@
+"""Banc d'essai et générateur d'exports synthétiques (hors paquet installé)."""
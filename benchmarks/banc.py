@@ -0,0 +1,135 @@
+"""
+Banc d'essai des contrôles : lecture, contrôles, récapitulatif et rapport xlsx chronométrés
+séparément, avec le pic mémoire (RSS) après chaque étape, sur des exports synthétiques.
+
+    python -m benchmarks.banc --tailles 10000 100000 1000000 5000000 --sortie resultats.json
+    python -m benchmarks.banc --tailles 100000 --reference resultats.json
+
+Chaque cas est exécuté dans un processus neuf pour que le pic mémoire ne dépende pas des cas
+précédents. Les résultats (JSON) portent la version du code pour comparer deux versions.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from controle_anomalies import (
+    MOTEUR_EXCEL, PROFILS, IndexAnomalies, colonnes_par_anomalie, create_summary_with_corrections,
+    ecrire_rapport_excel, executer_controles, lire_export,
+)
+from controle_anomalies.rapport import xlsxwriter
+
+from .generateur import ecrire_export, generer_export
+
+try:
+    import resource
+except ImportError:  # Windows : pas de mesure du pic mémoire
+    resource = None
+
+TAILLES_DEFAUT = (10_000, 100_000, 1_000_000, 5_000_000)
+LIGNES_MAX_XLSX = 1_048_573  # une feuille Excel : 1 048 576 lignes, moins l'en-tête et le pied de fichier
+TYPE_EXPORT = {'radio': 'radio', 'tele': 'tele', 'manuelle': 'radio'}
+
+
+def memoire_max_mo():
+    """Pic de mémoire résidente du processus depuis son démarrage, en Mo."""
+    if resource is None:
+        return None
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pic / (2**20 if sys.platform == 'darwin' else 2**10), 1)  # octets sous macOS, Ko sous Linux
+
+def mesurer(chemin, nom_profil, sortie_rapport=None):
+    """Exécute un cas (dans un processus neuf) et retourne les durées et pics mémoire de chaque étape."""
+    profil = PROFILS[nom_profil]; durees, memoire = {}, {'depart': memoire_max_mo()}
+    def etape(nom, fonction):
+        debut = time.perf_counter(); resultat = fonction()
+        durees[nom] = round(time.perf_counter() - debut, 4); memoire[nom] = memoire_max_mo()
+        return resultat
+
+    df, _ = etape('lecture', lambda: lire_export(chemin, profil))
+    anomalies_df, anomaly_counter = etape('controles', lambda: executer_controles(df, profil))
+    index = etape('index', lambda: IndexAnomalies(anomalies_df, profil))
+    summary_df = etape('recapitulatif', lambda: create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type=nom_profil, index=index))
+    if sortie_rapport is not None and 0 < len(anomalies_df) <= LIGNES_MAX_XLSX:
+        etape('rapport', lambda: ecrire_rapport_excel(anomalies_df, summary_df, colonnes_par_anomalie(profil), sortie_rapport, index=index))
+    return {'lignes_en_anomalie': len(anomalies_df), 'types_anomalie': len(anomaly_counter), 'durees_s': durees, 'memoire_max_mo': memoire}
+
+def preparer_export(dossier, lignes, type_export, format_fichier, graine):
+    chemin = Path(dossier) / f"export_{type_export}_{lignes}.{format_fichier}"
+    if not chemin.exists():
+        ecrire_export(generer_export(lignes, graine, type_export=type_export), chemin)
+    return chemin
+
+def version_code():
+    """Commit git courant (avec '+modifié' si l'arbre de travail diffère), ou None hors dépôt."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+        modifie = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+        return commit + ('+modifié' if modifie else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environnement():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'), 'version': version_code(), 'python': platform.python_version(),
+        'pandas': pd.__version__, 'plateforme': platform.platform(), 'moteur_excel': MOTEUR_EXCEL,
+        'ecriture_xlsx': 'xlsxwriter' if xlsxwriter is not None else 'openpyxl',
+    }
+
+def comparer(resultats, reference):
+    """Affiche le rapport des durées (actuel / référence) des cas présents dans les deux fichiers."""
+    cle = lambda r: (r['profil'], r['lignes'], r['format'])
+    anciens = {cle(r): r for r in reference['resultats']}
+    print(f"\nComparaison avec {reference['environnement'].get('version')} ({reference['environnement'].get('date')}) :")
+    for resultat in resultats:
+        ancien = anciens.get(cle(resultat))
+        if ancien is None: continue
+        ratios = ', '.join(f"{etape} x{duree / ancien['durees_s'][etape]:.2f}" for etape, duree in resultat['durees_s'].items() if ancien['durees_s'].get(etape))
+        print(f"    {resultat['profil']:<9} {resultat['lignes']:>9} {resultat['format']:<4}  {ratios}")
+
+def construire_parser():
+    parser = argparse.ArgumentParser(description="Banc d'essai des contrôles sur des exports synthétiques.")
+    parser.add_argument('--tailles', type=int, nargs='+', default=list(TAILLES_DEFAUT), help="Nombres de lignes (défaut : 10k 100k 1M 5M).")
+    parser.add_argument('--profils', nargs='+', choices=sorted(PROFILS), default=sorted(PROFILS))
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv'], help="Formats d'export lus (xlsx limité à une feuille Excel).")
+    parser.add_argument('--sans-rapport', action='store_true', help="Ne mesure pas la génération du rapport xlsx.")
+    parser.add_argument('--graine', type=int, default=0)
+    parser.add_argument('--dossier', help="Dossier des exports générés (réutilisés d'une exécution à l'autre) ; temporaire par défaut.")
+    parser.add_argument('--sortie', default='resultats_banc.json', help="Fichier JSON des résultats.")
+    parser.add_argument('--reference', help="Résultats JSON d'une version précédente à comparer.")
+    return parser
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    with tempfile.TemporaryDirectory() as temporaire:
+        dossier = Path(args.dossier or temporaire); dossier.mkdir(parents=True, exist_ok=True)
+        resultats = []
+        for lignes in args.tailles:
+            for format_fichier in args.formats:
+                if format_fichier == 'xlsx' and lignes > LIGNES_MAX_XLSX: continue
+                for nom_profil in args.profils:
+                    chemin = preparer_export(dossier, lignes, TYPE_EXPORT[nom_profil], format_fichier, args.graine)
+                    sortie_rapport = None if args.sans_rapport else Path(temporaire) / 'rapport.xlsx'
+                    with ProcessPoolExecutor(max_workers=1) as pool:
+                        mesure = pool.submit(mesurer, chemin, nom_profil, sortie_rapport).result()
+                    resultat = {'profil': nom_profil, 'lignes': lignes, 'format': format_fichier, **mesure}
+                    resultats.append(resultat)
+                    print(f"{nom_profil:<9} {lignes:>9} {format_fichier:<4} " + ', '.join(f"{etape} {duree:.2f} s" for etape, duree in resultat['durees_s'].items()) + f"  (pic {max(filter(None, resultat['memoire_max_mo'].values()), default=0)} Mo)", flush=True)
+
+    rapport = {'environnement': environnement(), 'resultats': resultats}
+    Path(args.sortie).write_text(json.dumps(rapport, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"Résultats : {args.sortie}")
+    if args.reference:
+        comparer(resultats, json.loads(Path(args.reference).read_text(encoding='utf-8')))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Générateur d'exports de compteurs synthétiques, vectorisé (de l'ordre de 10 s par million de lignes).
+
+Les exports mêlent des compteurs KAMSTRUP, SAPPEL, ITRON et KAIFA, des numéros FP2E valides ou
+cassés, des millésimes et diamètres plus ou moins cohérents, des coordonnées GPS proches de la
+commune (quelques-unes inversées ou déplacées) et des valeurs 'Traité' variées, dans les proportions
+d'un export réel où la plupart des lignes sont correctes.
+
+    python -m benchmarks.generateur 100000 export.csv --referentiel communes.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+MARQUES = np.array(['KAMSTRUP', 'SAPPEL (C)', 'SAPPEL (H)', 'ITRON', 'KAIFA', 'Kamstrup', 'Sappel (C)', 'SAPPEL(C)', 'Itron', '', 'DIEHL'], dtype=object)
+POIDS_MARQUES = [0.25, 0.2, 0.15, 0.2, 0.08, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02]
+# Lettre de diamètre FP2E -> diamètre attendu
+DIAMETRES = {'A': '15', 'U': '15', 'V': '15', 'B': '20', 'C': '25', 'D': '30', 'E': '40', 'F': '50', 'G': '60', 'H': '80', 'I': '100', 'J': '125', 'K': '150'}
+# Commune -> centroïde (latitude, longitude) ; la commune vide reçoit des coordonnées quelconques.
+CENTROIDES = {'LYON': (45.758, 4.835), 'RENNES': (48.112, -1.68), 'BREST': (48.39, -4.486), 'NANTES': (47.218, -1.554), 'LILLE': (50.629, 3.057), 'DIJON': (47.322, 5.041), 'NICE': (43.71, 7.262), 'TOURS': (47.394, 0.685)}
+COMMUNES = np.array([*CENTROIDES, ''], dtype=object)
+MAJUSCULES = np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype='S1')
+CHIFFRES = np.frombuffer(b'0123456789', dtype='S1')
+
+
+def _choix(rng, valeurs, n, poids=None):
+    return np.asarray(valeurs, dtype=object)[rng.choice(len(valeurs), size=n, p=poids)]
+
+def _chiffres(rng, n, longueur):
+    """n chaînes de `longueur` chiffres."""
+    return rng.choice(CHIFFRES, size=(n, longueur)).view(f'S{longueur}').ravel().astype(str).astype(object)
+
+def _assembler(*parties):
+    """Concatène des tableaux de chaînes élément par élément."""
+    resultat = parties[0].astype(object)
+    for partie in parties[1:]: resultat = resultat + partie.astype(object)
+    return resultat
+
+def _proportion(rng, n, p):
+    return rng.random(n) < p
+
+def generer_export(n, graine=0, taux_erreur=0.05, type_export='radio'):
+    """
+    DataFrame de `n` lignes au format des exports Radiorelève/Télérelève (colonnes en texte).
+    `taux_erreur` règle la proportion de chaque type de valeur cassée ; `type_export` ('radio' ou
+    'tele') choisit les protocoles attendus (WMS/OMS selon le millésime, ou LRA/SGX selon 'Traité').
+    """
+    rng = np.random.default_rng(graine)
+    marque = _choix(rng, MARQUES, n, POIDS_MARQUES)
+    marque_maj = pd.Series(marque).str.upper().str.replace('SAPPEL(C)', 'SAPPEL (C)', regex=False).to_numpy()
+    kamstrup, itron = marque_maj == 'KAMSTRUP', marque_maj == 'ITRON'
+    sappel_c, sappel_h = marque_maj == 'SAPPEL (C)', marque_maj == 'SAPPEL (H)'
+
+    # Numéros FP2E : lettre fabricant, millésime, lettre, lettre de diamètre, 6 chiffres
+    annee = rng.integers(5, 26, size=n)
+    lettre_fabricant = np.where(sappel_c, 'C', np.where(sappel_h, 'H', np.where(itron, _choix(rng, ['I', 'D'], n), _choix(rng, ['C', 'H', 'I', 'D'], n))))
+    lettre_diametre = _choix(rng, list(DIAMETRES), n, [0.4, 0.02, 0.02, 0.25, 0.1, 0.05, 0.05, 0.04, 0.03, 0.01, 0.01, 0.01, 0.01])
+    millesime = pd.Series(annee).astype(str).str.zfill(2).to_numpy(dtype=object)
+    compteur = _assembler(lettre_fabricant, millesime, _choix(rng, MAJUSCULES.astype(str), n), lettre_diametre, _chiffres(rng, n, 6))
+    compteur = np.where(kamstrup, _chiffres(rng, n, 8), compteur)
+    premiere, quatrieme = pd.Series(compteur).str[0:1].to_numpy(dtype=object), pd.Series(compteur).str[3:4].to_numpy(dtype=object)
+    type_compteur = np.where(itron, 'I' + quatrieme, premiere + quatrieme)
+    type_compteur = np.where(_proportion(rng, n, taux_erreur), _choix(rng, ['CA', 'HB', 'IA', ''], n), type_compteur)
+    # Numéros cassés : longueur aléatoire, minuscules, espace parasite, vide
+    casse = _proportion(rng, n, taux_erreur)
+    compteur = np.where(casse, _chiffres(rng, n, 7), compteur)
+    compteur = np.where(_proportion(rng, n, taux_erreur / 4), pd.Series(compteur).str.lower().to_numpy(), compteur)
+    compteur = np.where(_proportion(rng, n, taux_erreur / 4), ' ' + compteur.astype(object), compteur)
+    compteur = np.where(_proportion(rng, n, taux_erreur / 4), '', compteur)
+
+    # Numéro de tête : identique au compteur (KAMSTRUP), 16 caractères (SAPPEL), 8 (ITRON), DME... (KAIFA)
+    tete = np.where(kamstrup, compteur, np.where(sappel_c | sappel_h, _chiffres(rng, n, 16), np.where(itron, _chiffres(rng, n, 8), _assembler(np.full(n, 'DME', dtype=object), _chiffres(rng, n, 12)))))
+    tete = np.where(_proportion(rng, n, taux_erreur), _chiffres(rng, n, 10), tete)
+    tete = np.where(_proportion(rng, n, taux_erreur), '', tete)
+
+    annee_fabrication = np.where(_proportion(rng, n, 0.5), '20' + millesime, millesime)
+    annee_fabrication = np.where(_proportion(rng, n, taux_erreur), pd.Series(rng.integers(5, 26, size=n)).astype(str).radd('20').to_numpy(), annee_fabrication)
+    annee_fabrication = np.where(_proportion(rng, n, taux_erreur / 2), '', annee_fabrication)
+
+    diametre = pd.Series(lettre_diametre).map(DIAMETRES).to_numpy(dtype=object)
+    diametre = np.where(_proportion(rng, n, taux_erreur), _choix(rng, ['15', '20', '30', '40', '100', '150', 'x'], n), diametre)
+    diametre = np.where(_proportion(rng, n, taux_erreur / 2), '', diametre)
+
+    commune = _choix(rng, COMMUNES, n)
+    centre_lat = pd.Series(commune).map(lambda nom: CENTROIDES.get(nom, (np.nan, np.nan))[0]).to_numpy(dtype=float)
+    centre_lon = pd.Series(commune).map(lambda nom: CENTROIDES.get(nom, (np.nan, np.nan))[1]).to_numpy(dtype=float)
+    lat = np.where(np.isnan(centre_lat), rng.uniform(42, 51, size=n), centre_lat + rng.uniform(-0.04, 0.04, size=n))
+    lon = np.where(np.isnan(centre_lon), rng.uniform(-5, 8, size=n), centre_lon + rng.uniform(-0.04, 0.04, size=n))
+    deplace, inverse = _proportion(rng, n, taux_erreur / 5), _proportion(rng, n, taux_erreur / 5)
+    lat, lon = np.where(deplace, rng.uniform(42, 51, size=n), lat), np.where(deplace, rng.uniform(-5, 8, size=n), lon)
+    lat, lon = np.where(inverse, lon, lat), np.where(inverse, lat, lon)
+    latitude = pd.Series(lat).round(5).astype(str).to_numpy(dtype=object)
+    longitude = pd.Series(lon).round(5).astype(str).to_numpy(dtype=object)
+    latitude = np.where(_proportion(rng, n, taux_erreur), _choix(rng, ['0', '95', 'abc', ''], n), latitude)
+    longitude = np.where(_proportion(rng, n, taux_erreur), _choix(rng, ['0', '190', 'x', ''], n), longitude)
+
+    traite = np.where(_proportion(rng, n, 0.5), _assembler(_choix(rng, ['903', '863'], n), _chiffres(rng, n, 3)), _chiffres(rng, n, 6))
+    traite = np.where(_proportion(rng, n, taux_erreur), '', traite)
+    if type_export == 'tele':
+        protocole = np.where(pd.Series(traite).str.startswith(('903', '863')).to_numpy(), 'LRA', 'SGX')
+    else:
+        protocole = np.where(kamstrup | (annee <= 22), 'WMS', 'OMS')
+    protocole = np.where(_proportion(rng, n, taux_erreur), _choix(rng, ['wms', 'OMS', 'LRA', 'SGX', ''], n), protocole)
+    mode = _choix(rng, ['Radio', 'Télérelève', 'Manuelle', 'MANUELLE', ''], n, [0.6, 0.3, 0.05, 0.03, 0.02])
+
+    return pd.DataFrame({
+        'Protocole Radio': protocole, 'Marque': marque, 'Numéro de tête': tete, 'Numéro de compteur': compteur,
+        'Latitude': latitude, 'Longitude': longitude, 'Commune': commune, 'Année de fabrication': annee_fabrication,
+        'Diametre': diametre, 'Mode de relève': mode, 'Type Compteur': type_compteur, 'Traité': traite,
+        'Numéro de branchement': pd.RangeIndex(n).astype(str).to_numpy(dtype=object), 'Abonnement': 'A' + pd.RangeIndex(n).astype(str).to_numpy(dtype=object),
+    })
+
+def ecrire_export(df, chemin, sep=';'):
+    """Écrit l'export (CSV ou xlsx selon l'extension) avec les deux lignes de pied de fichier des exports réels."""
+    pied = pd.DataFrame([{df.columns[0]: 'Total'}, {df.columns[0]: f'{len(df)} lignes'}], columns=df.columns)
+    complet = pd.concat([df, pied], ignore_index=True)
+    if str(chemin).lower().endswith('.xlsx'):
+        complet.to_excel(chemin, index=False)
+    else:
+        complet.to_csv(chemin, index=False, sep=sep)
+
+def ecrire_referentiel(chemin):
+    """Écrit le référentiel des communes des exports synthétiques (centroïde et emprise de ±0,05°), pour le contrôle géographique."""
+    communes = pd.DataFrame([{'commune': nom.title(), 'latitude': lat, 'longitude': lon} for nom, (lat, lon) in CENTROIDES.items()])
+    communes = communes.assign(lat_min=communes['latitude'] - 0.05, lat_max=communes['latitude'] + 0.05, lon_min=communes['longitude'] - 0.05, lon_max=communes['longitude'] + 0.05)
+    communes.to_csv(chemin, index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère un export de compteurs synthétique.")
+    parser.add_argument('lignes', type=int)
+    parser.add_argument('sortie', help="Fichier .csv ou .xlsx")
+    parser.add_argument('--graine', type=int, default=0)
+    parser.add_argument('--taux-erreur', type=float, default=0.05)
+    parser.add_argument('--type', choices=['radio', 'tele'], default='radio', help="Protocoles attendus (défaut : radio).")
+    parser.add_argument('--referentiel', help="Écrit aussi le référentiel des communes (CSV) dans ce fichier.")
+    args = parser.parse_args(argv)
+    ecrire_export(generer_export(args.lignes, args.graine, args.taux_erreur, args.type), args.sortie)
+    if args.referentiel: ecrire_referentiel(args.referentiel)
+
+if __name__ == '__main__':
+    main()
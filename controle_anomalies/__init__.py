@@ -0,0 +1,18 @@
+"""Contrôle des exports de compteurs (Radiorelève, Télérelève, Manuelle), utilisable sans Streamlit."""
+from .cache import CacheResultats, empreinte
+from .correction import COLONNE_AUDIT, ecrire_fichier_corrige
+from .delta import MagasinResultats, ResultatDelta, executer_controles_delta
+from .explorateur import ExplorateurAnomalies
+from .geo import ControleGeo, ReferentielCommunes
+from .journal import JournalExecution, format_prometheus
+from .lecture import MOTEUR_EXCEL, SondeExport, colonnes_a_lire, colonnes_export, detecter_delimiteur, lire_export, sonder_export
+from .moteur import (
+    ColonnesManquantesError, IndexAnomalies, Profil, Regle, RegleDoublons, RegleStatistique, RegistreAnomalies,
+    colonnes_par_anomalie, corrections_par_anomalie, executer_controles, executer_controles_par_blocs,
+)
+from .parallele import executer_controles_parallele
+from .parc import ControleParc, ParcCompteurs
+from .rapport import create_summary_with_corrections, ecrire_rapport_csv, ecrire_rapport_excel, ecrire_rapport_parquet
+from .regles import PROFIL_MANUELLE, PROFIL_RADIO, PROFIL_TELE, PROFILS, avec_controle_geo, avec_controle_parc, avec_controle_statistique, check_data_manuelle, check_data_radio, check_data_tele
+from .statistiques import ControleStatistique
+from .travaux import GestionnaireTravaux, Travail
@@ -0,0 +1,102 @@
+"""
+Cache LRU borné en mémoire pour les lectures, contrôles et rapports, indexé par l'empreinte
+du fichier téléversé : une réexécution Streamlit (clic, téléchargement) ne relit ni ne
+recontrôle un fichier déjà traité. Une seule instance peut être partagée par tout le serveur.
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+TAILLE_CACHE_DEFAUT = 512 * 1024 * 1024  # octets
+
+
+def empreinte(contenu):
+    """Empreinte SHA-256 du contenu d'un fichier (bytes)."""
+    return hashlib.sha256(contenu).hexdigest()
+
+def taille_objet(valeur):
+    """
+    Estimation de l'empreinte mémoire d'une valeur mise en cache (DataFrame, Series, bytes ou tuple de ceux-ci) ;
+    tout autre objet est mesuré par `sys.getsizeof`, que ceux qui détiennent un fichier temporaire redéfinissent (`__sizeof__`).
+    """
+    if isinstance(valeur, pd.DataFrame):
+        return int(valeur.memory_usage(index=True, deep=True).sum())
+    if isinstance(valeur, pd.Series):
+        return int(valeur.memory_usage(index=True, deep=True))
+    if isinstance(valeur, (bytes, bytearray, memoryview)):
+        return len(valeur)
+    if isinstance(valeur, (tuple, list)):
+        return sum(taille_objet(v) for v in valeur)
+    return sys.getsizeof(valeur)
+
+def fermer(valeur):
+    """Libère les ressources d'une valeur sortie du cache : `close()` de chaque objet qui en a un, y compris dans un tuple."""
+    if isinstance(valeur, (tuple, list)):
+        for v in valeur: fermer(v)
+    elif callable(getattr(valeur, 'close', None)):
+        valeur.close()
+
+class CacheResultats:
+    """
+    Cache LRU dont la taille totale (estimée par `taille_objet`) ne dépasse pas `taille_max` octets.
+    Les valeurs renvoyées sont partagées : l'appelant ne doit pas les modifier en place. Une valeur évincée,
+    remplacée ou vidée est fermée (`fermer`) : ses fichiers temporaires sont supprimés.
+    """
+    def __init__(self, taille_max=TAILLE_CACHE_DEFAUT):
+        self.taille_max = taille_max
+        self.taille = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def __contains__(self, cle):
+        return cle in self._entrees
+
+    def obtenir(self, cle, calcul):
+        """Retourne la valeur associée à `cle`, en l'obtenant par `calcul()` si elle n'est pas en cache."""
+        with self._verrou:
+            if cle in self._entrees:
+                self._entrees.move_to_end(cle)
+                return self._entrees[cle][0]
+        valeur = calcul()  # hors verrou : un contrôle long ne bloque pas les autres sessions
+        self.ajouter(cle, valeur)
+        return valeur
+
+    def ajouter(self, cle, valeur):
+        taille = taille_objet(valeur); sorties = []
+        with self._verrou:
+            if cle in self._entrees:
+                ancienne, taille_ancienne = self._entrees.pop(cle); self.taille -= taille_ancienne
+                if ancienne is not valeur: sorties.append(ancienne)
+            if taille > self.taille_max:
+                sorties.append(valeur)  # trop volumineux pour être conservé
+            else:
+                self._entrees[cle] = (valeur, taille); self.taille += taille
+                sorties.extend(self._evincer())
+        for sortie in sorties: fermer(sortie)  # hors verrou
+
+    def reevaluer(self, cle):
+        """Remesure la valeur associée à `cle` après qu'elle a grossi (rapport écrit au premier téléchargement), puis évince si besoin."""
+        with self._verrou:
+            if cle not in self._entrees: return
+            valeur, taille = self._entrees[cle]; nouvelle = taille_objet(valeur)
+            self._entrees[cle] = (valeur, nouvelle); self.taille += nouvelle - taille
+            sorties = self._evincer()
+        for sortie in sorties: fermer(sortie)
+
+    def _evincer(self):
+        """Retire les entrées les moins récemment utilisées jusqu'à repasser sous `taille_max` ; retourne leurs valeurs (verrou tenu)."""
+        sorties = []
+        while self.taille > self.taille_max:
+            _, (valeur, taille_evincee) = self._entrees.popitem(last=False); self.taille -= taille_evincee; sorties.append(valeur)
+        return sorties
+
+    def vider(self):
+        with self._verrou:
+            sorties = [valeur for valeur, _ in self._entrees.values()]; self._entrees.clear(); self.taille = 0
+        for sortie in sorties: fermer(sortie)
@@ -0,0 +1,213 @@
+"""
+Point d'entrée en ligne de commande, sans Streamlit :
+
+    controle-anomalies radio export.csv -o rapport.xlsx
+    controle-anomalies tele exports/ -o rapports/ --jobs 4
+    controle-anomalies tele export.parquet -o rapport.csv.gz
+    controle-anomalies radio exports/ --historique --date-campagne 2026-09-30
+"""
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from .correction import ecrire_fichier_corrige
+from .delta import DOSSIER_MAGASIN_DEFAUT, MagasinResultats, executer_controles_delta
+from .geo import SEUIL_KM_DEFAUT, ControleGeo, ReferentielCommunes
+from .historique import FICHIER_HISTORIQUE_DEFAUT, HistoriqueAnomalies, date_iso, effectifs_communes, effectifs_csv
+from .journal import JournalExecution, format_prometheus
+from .lecture import FORMATS_COLONNAIRES, colonnes_a_lire, lire_export, sonder_export
+from .moteur import TAILLE_BLOC_DEFAUT, ColonnesManquantesError, IndexAnomalies, colonnes_par_anomalie, executer_controles_par_blocs
+from .parallele import executer_controles_parallele
+from .parc import TABLE_DEFAUT, ControleParc, ParcCompteurs
+from .rapport import create_summary_with_corrections, ecrire_rapport_csv, ecrire_rapport_excel, ecrire_rapport_parquet
+from .regles import PROFILS, avec_controle_geo, avec_controle_parc, avec_controle_statistique
+from .statistiques import SEUIL_Z_DEFAUT, ControleStatistique
+
+EXTENSIONS_ACCEPTEES = ('.csv', '.xlsx', *FORMATS_COLONNAIRES)
+
+
+def lister_fichiers(entrees):
+    """Développe les dossiers en la liste triée des exports (CSV, XLSX, Parquet, Feather) qu'ils contiennent."""
+    fichiers = []
+    for entree in map(Path, entrees):
+        if entree.is_dir():
+            fichiers.extend(sorted(f for f in entree.iterdir() if f.suffix.lower() in EXTENSIONS_ACCEPTEES))
+        else:
+            fichiers.append(entree)
+    return fichiers
+
+def controler_fichier(chemin, profil, taille_bloc=None, colonnes_conservees=None, journal=None, processus=None, effectifs=None):
+    """
+    Contrôle un export. Avec `taille_bloc`, un CSV est lu bloc par bloc ; avec `colonnes_conservees`,
+    seules les colonnes requises et celles-ci sont lues. Lu en entier, un gros export est contrôlé sur
+    `processus` processus (par défaut, le nombre de cœurs). L'export est d'abord sondé : un fichier sans
+    les colonnes requises est rejeté sans être lu. Le `journal` éventuel (JournalExecution) reçoit la
+    durée de chaque étape et les mesures de chaque règle. Le dict `effectifs` éventuel reçoit le nombre
+    de lignes par commune (historique des campagnes).
+    Retour: (anomalies_df, anomaly_counter, SondeExport)
+    """
+    journal = journal if journal is not None else JournalExecution(profil)
+    with journal.etape('sonde'): sonde = sonder_export(chemin, profil)
+    if taille_bloc and sonde.csv:
+        if effectifs is not None: effectifs.update(effectifs_csv(chemin, sonde))  # seule la colonne Commune est relue
+        with open(chemin, 'rb') as fichier:
+            return (*executer_controles_par_blocs(fichier, profil, sonde.delimiteur, dtype=profil.dtype_lecture, taille_bloc=taille_bloc, usecols=colonnes_a_lire(profil, colonnes_conservees), journal=journal, encodage=sonde.encodage), sonde)
+    df, _ = lire_export(chemin, profil, colonnes_conservees, journal.etapes, sonde)
+    if effectifs is not None: effectifs.update(effectifs_communes(df))
+    return (*executer_controles_parallele(df, profil, processus, journal), sonde)
+
+def ecrire_rapport(anomalies_df, anomaly_counter, profil, sortie, sep=None):
+    """Écrit le rapport au format déduit de l'extension de `sortie` : .xlsx, .parquet ou CSV (compressé si .gz ou .zip)."""
+    index = IndexAnomalies(anomalies_df, profil)
+    summary_df = create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type=profil.nom, index=index, profil=profil)
+    if Path(sortie).suffix.lower() == '.xlsx':
+        ecrire_rapport_excel(anomalies_df, summary_df, colonnes_par_anomalie(profil), sortie, index=index)
+    elif Path(sortie).suffix.lower() == '.parquet':
+        ecrire_rapport_parquet(anomalies_df, sortie)
+    else:
+        ecrire_rapport_csv(anomalies_df, sortie, sep=sep or ',')
+    return summary_df
+
+def traiter_fichier(chemin, nom_profil, sortie, taille_bloc=None, colonnes_conservees=None, delta=None, campagne=None, geo=None, processus=None, corrige=None, parc=None, statistique=None, historique=None, date_campagne=None, nom_campagne=None):
+    """
+    Contrôle un fichier et écrit son rapport. Exécuté dans un processus du pool pour les lots.
+    Avec `corrige` (chemin), l'export complet est aussi réécrit, corrections proposées appliquées.
+    Avec `delta` (dossier du magasin), seules les lignes modifiées depuis la campagne précédente sont recontrôlées.
+    Avec `geo` (ControleGeo), les coordonnées GPS sont aussi confrontées à la commune déclarée.
+    Avec `parc` (ControleParc), les compteurs sont rapprochés du parc de compteurs.
+    Avec `statistique` (ControleStatistique), les valeurs atypiques par Marque × Commune sont signalées.
+    Avec `historique` (chemin de la base), les résultats sont ajoutés à l'historique des campagnes, sous le
+    nom `nom_campagne` (par défaut, le nom du fichier) et à la date `date_campagne` (par défaut, celle du fichier) ;
+    `campagne` ne désigne que l'état du mode delta.
+    Un fichier en échec (colonnes manquantes, fichier illisible ou corrompu, écriture impossible) renvoie
+    {'fichier', 'erreur'} au lieu de lever : les autres fichiers du lot sont traités.
+    """
+    try:
+        return _traiter_fichier(chemin, nom_profil, sortie, taille_bloc, colonnes_conservees, delta, campagne, geo, processus, corrige, parc, statistique, historique, date_campagne, nom_campagne)
+    except ColonnesManquantesError as e:
+        return {'fichier': str(chemin), 'erreur': str(e)}
+    except Exception as e:  # xlsx tronqué (BadZipFile), encodage, disque plein... : l'erreur reste propre à ce fichier
+        return {'fichier': str(chemin), 'erreur': f"{type(e).__name__} : {e}"}
+
+def _traiter_fichier(chemin, nom_profil, sortie, taille_bloc, colonnes_conservees, delta, campagne, geo, processus, corrige, parc, statistique, historique, date_campagne, nom_campagne):
+    profil = PROFILS[nom_profil] if geo is None else avec_controle_geo(PROFILS[nom_profil], geo)
+    profil = profil if parc is None else avec_controle_parc(profil, parc)
+    profil = profil if statistique is None else avec_controle_statistique(profil, statistique); journal = JournalExecution(profil); resultat_delta = None
+    effectifs = {} if historique is not None else None
+    if delta is not None:
+        with journal.etape('sonde'): sonde = sonder_export(chemin, profil)
+        df, _ = lire_export(chemin, profil, colonnes_conservees, journal.etapes, sonde)
+        if effectifs is not None: effectifs.update(effectifs_communes(df))
+        resultat_delta = executer_controles_delta(df, profil, MagasinResultats(delta), campagne, journal)
+        anomalies_df, anomaly_counter = resultat_delta.anomalies_df, resultat_delta.anomaly_counter
+    else:
+        anomalies_df, anomaly_counter, sonde = controler_fichier(chemin, profil, taille_bloc, colonnes_conservees, journal, processus, effectifs)
+    if sortie is not None and not anomalies_df.empty:
+        with journal.etape('rapport'): ecrire_rapport(anomalies_df, anomaly_counter, profil, sortie, sonde.delimiteur)
+    if corrige is not None:
+        with journal.etape('correction'): corrections = ecrire_fichier_corrige(chemin, anomalies_df, profil, corrige, sonde, taille_bloc or TAILLE_BLOC_DEFAUT)
+    if historique is not None:
+        date_campagne = date_iso(date_campagne or date.fromtimestamp(Path(chemin).stat().st_mtime))
+        with journal.etape('historique'): HistoriqueAnomalies(historique).enregistrer(anomalies_df, anomaly_counter, profil, nom_campagne or Path(chemin).stem, date_campagne, chemin, effectifs, duree_s=sum(journal.etapes.values()))
+    resultat = {'fichier': str(chemin), 'lignes_en_anomalie': len(anomalies_df), 'anomalies': anomaly_counter.to_dict(), 'rapport': str(sortie) if sortie is not None and not anomalies_df.empty else None, 'execution': journal.en_dict()}
+    if corrige is not None:
+        resultat['corrige'] = {'fichier': str(corrige), 'corrections': corrections.to_dict()}
+    if historique is not None:
+        resultat['historique'] = {'base': str(historique), 'date_campagne': date_campagne}
+    if resultat_delta is not None:
+        resultat['delta'] = {'lignes': resultat_delta.lignes, 'evolution': resultat_delta.evolution.to_dict(orient='records')}
+    return resultat
+
+def sortie_pour(chemin, args, plusieurs):
+    if args.output is None:
+        return None
+    if not plusieurs:
+        return Path(args.output)
+    return Path(args.output) / f"{chemin.stem}_anomalies.{args.format}"
+
+def corrige_pour(chemin, args, plusieurs):
+    if args.corrige is None:
+        return None
+    if not plusieurs:
+        return Path(args.corrige)
+    return Path(args.corrige) / f"{chemin.stem}_corrige{chemin.suffix}"
+
+def afficher_resultat(resultat):
+    if 'erreur' in resultat:
+        print(f"{resultat['fichier']} : ERREUR — {resultat['erreur']}", file=sys.stderr)
+        return
+    print(f"{resultat['fichier']} : {resultat['lignes_en_anomalie']} lignes en anomalie" + (f" -> {resultat['rapport']}" if resultat['rapport'] else ''))
+    print("    durées : " + ', '.join(f"{etape} {duree:.2f} s" for etape, duree in resultat['execution']['etapes_s'].items()))
+    if 'delta' in resultat:
+        lignes = resultat['delta']['lignes']
+        print(f"    delta : {lignes['recontrolees']} lignes recontrôlées sur {lignes['total']} ({lignes['nouvelles']} nouvelles, {lignes['modifiees']} modifiées, {lignes['supprimees']} supprimées)")
+    if 'historique' in resultat:
+        print(f"    historique : campagne du {resultat['historique']['date_campagne']} -> {resultat['historique']['base']}")
+    if 'corrige' in resultat:
+        print(f"    fichier corrigé : {sum(resultat['corrige']['corrections'].values())} valeurs corrigées -> {resultat['corrige']['fichier']}")
+    evolution = {e["Type d'anomalie"]: e for e in resultat.get('delta', {}).get('evolution', [])}
+    for anomaly_type, count in resultat['anomalies'].items():
+        print(f"    {count:>8}  {anomaly_type}" + (f"  (+{evolution[anomaly_type]['Nouvelles']} / -{evolution[anomaly_type]['Résolues']})" if anomaly_type in evolution else ''))
+
+def construire_parser():
+    parser = argparse.ArgumentParser(prog='controle-anomalies', description="Contrôle des exports de compteurs sans interface Streamlit.")
+    parser.add_argument('profil', choices=sorted(PROFILS), help="Type de contrôle.")
+    parser.add_argument('entrees', nargs='+', help="Fichiers CSV/XLSX ou dossiers d'exports.")
+    parser.add_argument('-o', '--output', help="Rapport de sortie (.xlsx, .parquet, .csv, .csv.gz ou .csv.zip) pour un fichier, dossier de sortie pour plusieurs.")
+    parser.add_argument('--format', choices=['xlsx', 'parquet', 'csv', 'csv.gz', 'csv.zip'], default='xlsx', help="Format des rapports quand --output est un dossier (défaut : xlsx).")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Nombre de processus pour traiter plusieurs fichiers (défaut : nombre de cœurs).")
+    parser.add_argument('-p', '--processus', type=int, default=None, help="Processus pour contrôler un gros fichier lu en entier (défaut : nombre de cœurs ; 1 = séquentiel). Les petits fichiers restent séquentiels.")
+    parser.add_argument('--taille-bloc', type=int, default=None, help="Lit les CSV par blocs de N lignes (mémoire bornée).")
+    parser.add_argument('--colonnes-requises', action='store_true', help="Ne lit que les colonnes requises par le contrôle (lecture xlsx bien plus rapide).")
+    parser.add_argument('--delta', nargs='?', const=DOSSIER_MAGASIN_DEFAUT, metavar='DOSSIER', help=f"Mode incrémental : ne recontrôle que les lignes modifiées depuis la campagne précédente, dont l'état est gardé dans DOSSIER (défaut : {DOSSIER_MAGASIN_DEFAUT}). Plusieurs fichiers sont traités dans l'ordre, comme des campagnes successives.")
+    parser.add_argument('--campagne', help="Avec --delta, nom de la campagne dont l'état sert de référence (défaut : le profil).")
+    parser.add_argument('--historique', nargs='?', const=FICHIER_HISTORIQUE_DEFAUT, metavar='BASE', help=f"Ajoute les résultats à l'historique des campagnes, base SQLite interrogée par controle-anomalies-historique (défaut : {FICHIER_HISTORIQUE_DEFAUT}).")
+    parser.add_argument('--date-campagne', metavar='AAAA-MM-JJ', type=date_iso, help="Avec --historique, date de la campagne (défaut : date de modification de chaque fichier).")
+    parser.add_argument('--nom-campagne', metavar='NOM', help="Avec --historique, nom de la campagne (défaut : le nom de chaque fichier) ; indépendant de --campagne.")
+    parser.add_argument('--communes', metavar='FICHIER', help="Référentiel des communes (CSV : commune, latitude, longitude et, facultativement, lat_min, lat_max, lon_min, lon_max) : signale les coordonnées GPS éloignées de la commune déclarée ou inversées.")
+    parser.add_argument('--seuil-km', type=float, default=SEUIL_KM_DEFAUT, help=f"Avec --communes, distance maximale tolérée à la commune (défaut : {SEUIL_KM_DEFAUT:g} km).")
+    parser.add_argument('--parc', metavar='FICHIER', help="Parc de compteurs (CSV, Parquet ou base SQLite, colonne 'Numéro de compteur' et, facultativement, Marque, Diametre, Type Compteur) : signale les compteurs absents du parc et les caractéristiques qui en diffèrent.")
+    parser.add_argument('--table-parc', default=TABLE_DEFAUT, metavar='TABLE', help=f"Avec --parc sur une base SQLite, table des compteurs (défaut : {TABLE_DEFAUT}).")
+    parser.add_argument('--statistiques', action='store_true', help="Signale aussi les valeurs statistiquement atypiques par Marque × Commune : année de fabrication ou type de compteur surreprésentés, coordonnées GPS éloignées du centre de la commune.")
+    parser.add_argument('--seuil-z', type=float, default=SEUIL_Z_DEFAUT, help=f"Avec --statistiques, score z robuste à partir duquel une valeur est atypique (défaut : {SEUIL_Z_DEFAUT:g}).")
+    parser.add_argument('--corrige', metavar='CHEMIN', help="Écrit aussi l'export complet, dans son format, avec les corrections proposées appliquées et une colonne d'audit (fichier pour un export, dossier pour plusieurs).")
+    parser.add_argument('--journal', metavar='FICHIER', help="Écrit le journal d'exécution (durées des étapes, mesures par règle) en JSON.")
+    parser.add_argument('--prometheus', metavar='FICHIER', help="Écrit les mêmes mesures au format texte Prometheus (.prom).")
+    parser.add_argument('--garder', action='append', default=[], metavar='COLONNE', help="Avec --colonnes-requises, colonne supplémentaire à conserver dans le rapport (répétable).")
+    return parser
+
+def main(argv=None):
+    parser = construire_parser(); args = parser.parse_args(argv)
+    if args.delta and args.taille_bloc: parser.error("--delta et --taille-bloc sont incompatibles : le mode delta lit l'export complet.")
+    fichiers = lister_fichiers(args.entrees)
+    if not fichiers:
+        print("Aucun export CSV, XLSX, Parquet ou Feather à contrôler.", file=sys.stderr)
+        return 2
+    plusieurs = len(fichiers) > 1 or any(Path(e).is_dir() for e in args.entrees)
+    if plusieurs and args.output: Path(args.output).mkdir(parents=True, exist_ok=True)
+    if plusieurs and args.corrige: Path(args.corrige).mkdir(parents=True, exist_ok=True)
+    colonnes_conservees = args.garder if args.colonnes_requises else None
+    geo = ControleGeo(ReferentielCommunes.lire(args.communes), args.seuil_km) if args.communes else None  # chargé une fois, transmis aux processus
+    parc = ControleParc(ParcCompteurs.lire(args.parc, args.table_parc)) if args.parc else None  # idem : indexé une fois pour tous les fichiers
+    statistique = ControleStatistique(seuil_z=args.seuil_z) if args.statistiques else None
+    sequentiel = len(fichiers) == 1 or args.jobs == 1 or args.delta  # en mode delta, chaque fichier part de l'état laissé par le précédent
+    processus = args.processus if sequentiel else 1  # fichiers déjà répartis sur les cœurs : pas de second niveau de processus
+    taches = [(chemin, args.profil, sortie_pour(chemin, args, plusieurs), args.taille_bloc, colonnes_conservees, args.delta, args.campagne, geo, processus, corrige_pour(chemin, args, plusieurs), parc, statistique, args.historique, args.date_campagne, args.nom_campagne) for chemin in fichiers]
+
+    if sequentiel:
+        resultats = [traiter_fichier(*tache) for tache in taches]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            resultats = list(pool.map(traiter_fichier, *zip(*taches)))
+
+    for resultat in resultats: afficher_resultat(resultat)
+    journaux = {r['fichier']: r['execution'] for r in resultats if 'execution' in r}
+    if args.journal: Path(args.journal).write_text(json.dumps(journaux, ensure_ascii=False, indent=2), encoding='utf-8')
+    if args.prometheus: Path(args.prometheus).write_text(format_prometheus(journaux), encoding='utf-8')
+    return 1 if any('erreur' in r for r in resultats) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
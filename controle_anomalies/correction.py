@@ -0,0 +1,191 @@
+"""
+Export corrigé : l'export d'origine complet, réécrit dans son format et avec son délimiteur, les
+corrections proposées par les contrôles étant appliquées et tracées dans une colonne d'audit.
+L'export est relu et réécrit bloc par bloc : seules les corrections (quelques lignes du rapport)
+et le bloc en cours sont en mémoire (xlsx lu ligne à ligne en lecture seule, Parquet/Feather lu par
+lots d'enregistrements Arrow).
+"""
+import io
+from contextlib import nullcontext
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from pandas.api.types import is_numeric_dtype
+
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter est optionnel : openpyxl en mode write_only sert de repli
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from pyarrow import ipc
+except ImportError:  # un export Parquet/Feather n'a pu être lu sans pyarrow
+    pa = None
+
+from .lecture import sonder_export
+from .moteur import CORRECTIONS_SOURCES, TAILLE_BLOC_DEFAUT
+
+COLONNE_AUDIT = 'Corrections appliquées'
+COMPRESSION_COLONNAIRE = 'zstd'
+
+
+def corrections_a_appliquer(anomalies_df, profil):
+    """
+    Corrections proposées dans le rapport, par colonne source : Series des nouvelles valeurs indexée
+    par 'Index original' (triée), les corrections vides étant écartées.
+    """
+    corrections = {}
+    for col in profil.corrections:
+        if col not in anomalies_df.columns: continue
+        valeurs = anomalies_df[col].to_numpy(dtype=object)
+        retenues = pd.notna(valeurs) & (valeurs != '')
+        if retenues.any():
+            corrections[CORRECTIONS_SOURCES[col]] = pd.Series(valeurs[retenues], index=anomalies_df['Index original'].to_numpy()[retenues]).sort_index(kind='stable')
+    return corrections
+
+def _textes(valeurs):
+    """Valeurs affichées dans l'audit : vide pour une valeur manquante, sans '.0' pour un nombre entier lu en flottant."""
+    textes = pd.Series(valeurs, dtype=object)
+    return textes.where(textes.notna(), '').astype(str).str.replace(r'^(-?\d+)\.0$', r'\1', regex=True).to_numpy(dtype=object)
+
+def appliquer_corrections(bloc, corrections, fleche='→'):
+    """
+    Applique en place à `bloc` (lignes contiguës de l'export, indexées par leur position) les corrections
+    qui le concernent, par affectation vectorisée colonne par colonne. Une correction identique à la
+    valeur d'origine est ignorée. `fleche` sépare ancienne et nouvelle valeur dans l'audit.
+    Retour: (colonne d'audit « colonne : ancienne → nouvelle », séparées par ' / ', nombre de valeurs corrigées par colonne)
+    """
+    audit = np.full(len(bloc), '', dtype=object); comptes = {}
+    if bloc.empty: return audit, comptes
+    for col, valeurs in corrections.items():
+        if col not in bloc.columns: continue
+        valeurs = valeurs.iloc[valeurs.index.searchsorted(bloc.index[0]):valeurs.index.searchsorted(bloc.index[-1], side='right')]
+        if valeurs.empty: continue
+        positions = bloc.index.get_indexer(valeurs.index)
+        anciennes, nouvelles = _textes(bloc[col].to_numpy(dtype=object)[positions]), _textes(valeurs.to_numpy(dtype=object))
+        modifiees = anciennes != nouvelles
+        if not modifiees.any(): continue
+        positions, nouvelles = positions[modifiees], nouvelles[modifiees]
+        texte = col + ' : ' + anciennes[modifiees] + f' {fleche} ' + nouvelles
+        audit[positions] = np.where(audit[positions] == '', texte, audit[positions] + ' / ' + texte)
+
+        if is_numeric_dtype(bloc[col].dtype):  # export xlsx : une colonne numérique reste numérique si la correction l'est
+            nombres = pd.to_numeric(pd.Series(nouvelles), errors='coerce')
+            if nombres.notna().all(): nouvelles = nombres.to_numpy()
+            else: bloc[col] = bloc[col].astype(object)
+        bloc.iloc[positions, bloc.columns.get_loc(col)] = nouvelles
+        comptes[col] = len(positions)
+    return audit, comptes
+
+def _fin_de_ligne(fichier):
+    debut = fichier.read(2048); fichier.seek(0)
+    return '\r\n' if b'\r\n' in debut else '\n'
+
+def _corriger_csv(source, corrections, destination, sonde, taille_bloc, comptes):
+    with (nullcontext(source) if hasattr(source, 'read') else open(source, 'rb')) as fichier:
+        fichier.seek(0)
+        sep, encodage, fin_de_ligne = sonde.delimiteur, sonde.encodage or 'utf-8', _fin_de_ligne(fichier)
+        # Toutes les valeurs en texte, sans interprétation des vides : les colonnes non corrigées sont réécrites telles quelles
+        blocs = pd.read_csv(fichier, sep=sep, encoding=encodage, dtype=str, keep_default_na=False, chunksize=taille_bloc)
+        if hasattr(destination, 'write'): sortie = io.TextIOWrapper(destination, encoding=encodage, newline='', write_through=True)
+        else: sortie = open(destination, 'w', encoding=encodage, newline='')
+        try:
+            for numero, bloc in enumerate(blocs):
+                audit, comptes_bloc = appliquer_corrections(bloc, corrections, '→' if encodage.startswith('utf') else '->')  # '→' n'existe pas en Windows-1252 / latin-1
+                bloc[COLONNE_AUDIT] = audit
+                bloc.to_csv(sortie, sep=sep, index=False, header=numero == 0, lineterminator=fin_de_ligne)
+                for col, nombre in comptes_bloc.items(): comptes[col] = comptes.get(col, 0) + nombre
+        finally:
+            if hasattr(destination, 'write'): sortie.flush(); sortie.detach()  # le flux de l'appelant reste ouvert
+            else: sortie.close()
+
+def _lignes_excel(source):
+    """
+    En-tête puis lignes de la première feuille d'un xlsx, lues une à une en lecture seule. Comme pour
+    `pd.read_excel`, les lignes vides finales sont écartées (celles du milieu restent, les positions suivent
+    donc 'Index original') et un en-tête vide devient 'Unnamed: i'.
+    """
+    if hasattr(source, 'seek'): source.seek(0)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        lignes = wb.worksheets[0].iter_rows(values_only=True)
+        entete = next(lignes, ())
+        entete = [f'Unnamed: {i}' if nom is None else nom for i, nom in enumerate(entete)]; yield entete
+        vides = 0
+        for ligne in lignes:
+            if all(valeur is None for valeur in ligne): vides += 1; continue
+            for _ in range(vides): yield (None,) * len(entete)
+            vides = 0; yield tuple(ligne[:len(entete)]) + (None,) * (len(entete) - len(ligne))
+    finally:
+        wb.close()
+
+def _blocs_excel(source, corrections, taille_bloc, comptes):
+    """Lignes de l'export xlsx (en-tête en tête), lues et corrigées bloc par bloc."""
+    lignes = _lignes_excel(source); entete = next(lignes)
+    yield list(entete) + [COLONNE_AUDIT]
+    debut = 0
+    while True:
+        paquet = list(islice(lignes, taille_bloc))
+        if not paquet: break
+        bloc = pd.DataFrame(paquet, columns=entete, index=pd.RangeIndex(debut, debut + len(paquet))); debut += len(paquet)
+        audit, comptes_bloc = appliquer_corrections(bloc, corrections)
+        bloc[COLONNE_AUDIT] = audit
+        yield from bloc.astype(object).where(bloc.notna(), None).itertuples(index=False, name=None)
+        for col, nombre in comptes_bloc.items(): comptes[col] = comptes.get(col, 0) + nombre
+
+def _corriger_excel(source, corrections, destination, taille_bloc, comptes):
+    lignes = _blocs_excel(source, corrections, taille_bloc, comptes)
+    if xlsxwriter is not None:
+        wb = xlsxwriter.Workbook(destination, {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy'}); ws = wb.add_worksheet()
+        for r, ligne in enumerate(lignes): ws.write_row(r, 0, ligne)
+        wb.close()
+    else:
+        wb = Workbook(write_only=True); ws = wb.create_sheet()
+        for ligne in lignes: ws.append(ligne)
+        wb.save(destination)
+
+def _lots_colonnaires(source, sonde, taille_bloc):
+    """(schéma Arrow, lots d'au plus `taille_bloc` lignes) d'un export Parquet ou Feather."""
+    if hasattr(source, 'seek'): source.seek(0)
+    if sonde.colonnaire == 'parquet':
+        fichier = pq.ParquetFile(source)
+        return fichier.schema_arrow, fichier.iter_batches(batch_size=taille_bloc)
+    lecteur = ipc.open_file(source if hasattr(source, 'read') else pa.memory_map(str(source)))
+    # Un lot d'enregistrements à la fois (décompressé à la demande), redécoupé en blocs de `taille_bloc` lignes
+    lots = (lot.slice(debut, taille_bloc) for i in range(lecteur.num_record_batches) for lot in [lecteur.get_batch(i)] for debut in range(0, lot.num_rows, taille_bloc))
+    return lecteur.schema, lots
+
+def _corriger_colonnaire(source, corrections, destination, sonde, taille_bloc, comptes):
+    schema, lots = _lots_colonnaires(source, sonde, taille_bloc)
+    index = [name for name in schema.names if name.startswith('__index_level_')]
+    schema = pa.schema([field for field in schema if field.name not in index]).append(pa.field(COLONNE_AUDIT, pa.string()))
+    if sonde.colonnaire == 'parquet': ecrivain = pq.ParquetWriter(destination, schema, compression=COMPRESSION_COLONNAIRE)
+    else: ecrivain = ipc.new_file(destination, schema, options=ipc.IpcWriteOptions(compression=COMPRESSION_COLONNAIRE))
+    with ecrivain:
+        debut = 0
+        for lot in lots:
+            bloc = lot.to_pandas().reset_index(drop=True).drop(columns=index, errors='ignore'); bloc.index += debut; debut += len(bloc)
+            audit, comptes_bloc = appliquer_corrections(bloc, corrections)
+            bloc[COLONNE_AUDIT] = audit
+            ecrivain.write_table(pa.Table.from_pandas(bloc, schema=schema, preserve_index=False))
+            for col, nombre in comptes_bloc.items(): comptes[col] = comptes.get(col, 0) + nombre
+
+def ecrire_fichier_corrige(source, anomalies_df, profil, destination, sonde=None, taille_bloc=TAILLE_BLOC_DEFAUT):
+    """
+    Écrit l'export `source` complet (pied de fichier compris) avec les corrections proposées dans
+    `anomalies_df` appliquées, repérées par leur 'Index original', et la colonne d'audit COLONNE_AUDIT.
+    Un CSV est réécrit avec son délimiteur, son encodage (ceux de la `sonde`, sondés s'ils manquent) et
+    ses fins de ligne, un xlsx en xlsx, un export Parquet/Feather dans son format et avec son schéma.
+    `source` et `destination` sont des chemins ou des flux binaires.
+    Retour: nombre de valeurs corrigées par colonne (Series)
+    """
+    corrections = corrections_a_appliquer(anomalies_df, profil); comptes = {}
+    sonde = sonde if sonde is not None else sonder_export(source)
+    if sonde.excel: _corriger_excel(source, corrections, destination, taille_bloc, comptes)
+    elif sonde.colonnaire is not None: _corriger_colonnaire(source, corrections, destination, sonde, taille_bloc, comptes)
+    else: _corriger_csv(source, corrections, destination, sonde, taille_bloc, comptes)
+    return pd.Series(comptes, dtype='int64', name='corrections')
@@ -0,0 +1,211 @@
+"""
+Contrôle incrémental : seules les lignes nouvelles ou modifiées depuis la campagne précédente sont
+recontrôlées, les autres reprennent le résultat enregistré. Les règles par ligne ne dépendent que de
+la ligne contrôlée ; les règles entre lignes (doublons) et statistiques sont réappliquées sur tout
+l'export à partir de l'empreinte de leurs clés et de leurs variables, enregistrées pour chaque ligne. Le résultat fusionné est donc celui
+d'un contrôle complet.
+
+L'état d'une campagne (empreintes de chaque ligne, anomalies, historique) est gardé dans un dossier local.
+"""
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .journal import JournalExecution
+from .moteur import ColonnesManquantesError, executer_controles, fusionner_doublons
+
+COLONNE_CLE = 'Clé delta'
+DOSSIER_MAGASIN_DEFAUT = '.controle_anomalies'
+VERSION_ETAT = 5
+
+
+def numeros_compteurs(df):
+    """Numéro de compteur de chaque ligne, sans espaces autour ('' si absent)."""
+    return df['Numéro de compteur'].fillna('').astype(str).str.strip()
+
+def cles_lignes(df, empreintes=None):
+    """
+    Clé de chaque ligne : le numéro de compteur et l'empreinte de la ligne ('h:' et l'empreinte sans numéro),
+    suivis du rang d'apparition parmi les copies exactes ('#0', '#1'...). Supprimer l'une des lignes d'un compteur
+    présent plusieurs fois ne change donc pas la clé des autres.
+    """
+    compteur = numeros_compteurs(df)
+    empreinte = pd.Series(empreintes_lignes(df) if empreintes is None else empreintes, index=df.index).astype(str)
+    base = (compteur + '|' + empreinte).where(compteur != '', 'h:' + empreinte)
+    return base + '#' + base.groupby(base).cumcount().astype(str)
+
+def apparier_modifiees(compteurs, nouvelles, compteurs_precedents, disparues):
+    """
+    Lignes modifiées : sans clé connue (`nouvelles`), elles sont appariées, par numéro de compteur et dans l'ordre
+    du fichier, aux lignes de la campagne précédente dont la clé a disparu (`disparues`). Les lignes sans numéro
+    de compteur ne sont pas appariées (nouvelles ou supprimées).
+    Retour: (positions courantes, positions dans la campagne précédente)
+    """
+    courantes = pd.DataFrame({'compteur': compteurs[nouvelles], 'position': np.flatnonzero(nouvelles)})
+    precedentes = pd.DataFrame({'compteur': compteurs_precedents[disparues], 'precedente': np.flatnonzero(disparues)})
+    courantes, precedentes = courantes[courantes['compteur'] != ''], precedentes[precedentes['compteur'] != '']
+    courantes['rang'], precedentes['rang'] = courantes.groupby('compteur').cumcount(), precedentes.groupby('compteur').cumcount()
+    paires = courantes.merge(precedentes, on=['compteur', 'rang'])
+    return paires['position'].to_numpy(), paires['precedente'].to_numpy()
+
+def references(profil):
+    """Empreinte des référentiels du profil (communes et seuil, parc de compteurs), None pour un référentiel absent."""
+    return [None if controle is None else controle.empreinte for controle in (profil.geo, profil.parc)]
+
+def empreintes_lignes(df):
+    """Empreinte 64 bits du contenu de chaque ligne (toutes colonnes)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def compter_anomalies(anomalies_df, profil):
+    """Compteur des types d'anomalie (comme `RegistreAnomalies.compter`), égalités dans l'ordre des règles du profil."""
+    ordre = {nom: position for position, nom in enumerate(dict.fromkeys(regle.nom for regle in profil.toutes_regles))}
+    comptes = anomalies_df['Anomalie'].dropna().str.split(' / ').explode().str.strip()
+    comptes = comptes[comptes != ''].value_counts()
+    cles = sorted(comptes.index, key=lambda nom: (-comptes[nom], ordre.get(nom, len(ordre))))
+    return pd.Series([int(comptes[nom]) for nom in cles], index=pd.Index(cles, name='Anomalie'), name='count', dtype='int64')
+
+def paires_anomalies(anomalies_df):
+    """Couples (clé de ligne, type d'anomalie), une ligne par type signalé."""
+    types = anomalies_df[[COLONNE_CLE, 'Anomalie']].dropna()
+    types = types.assign(Anomalie=types['Anomalie'].str.split(' / ')).explode('Anomalie')
+    return types.assign(Anomalie=types['Anomalie'].str.strip()).drop_duplicates()
+
+class MagasinResultats:
+    """
+    Dossier local contenant l'état de la dernière exécution de chaque campagne (un fichier par campagne et profil).
+    Les contrôles d'une même campagne sont sérialisés dans le processus (`verrou`) : deux travaux simultanés
+    ne partent pas du même état et n'écrasent pas l'un l'autre leur résultat.
+    """
+    _verrous = {}
+    _verrou_verrous = threading.Lock()
+
+    def __init__(self, dossier=None):
+        self.dossier = Path(dossier or os.environ.get('CONTROLE_ANOMALIES_MAGASIN', DOSSIER_MAGASIN_DEFAUT))
+
+    def chemin(self, campagne, profil):
+        return self.dossier / f"{campagne}__{profil.nom}.pkl"
+
+    def verrou(self, campagne, profil):
+        """Verrou propre au fichier d'état de la campagne, partagé par toutes les instances du processus."""
+        with MagasinResultats._verrou_verrous:
+            return MagasinResultats._verrous.setdefault(self.chemin(campagne, profil).resolve(), threading.Lock())
+
+    def charger(self, campagne, profil):
+        chemin = self.chemin(campagne, profil)
+        if not chemin.exists():
+            return None
+        etat = pd.read_pickle(chemin)
+        return etat if etat.get('version') == VERSION_ETAT else None
+
+    def enregistrer(self, campagne, profil, etat):
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        chemin = self.chemin(campagne, profil)
+        # Fichier provisoire au nom unique (deux processus peuvent enregistrer la même campagne), puis remplacement atomique
+        provisoire = tempfile.NamedTemporaryFile(dir=self.dossier, prefix=chemin.stem, suffix='.tmp', delete=False)
+        try:
+            with provisoire: pd.to_pickle({**etat, 'version': VERSION_ETAT}, provisoire)
+            os.replace(provisoire.name, chemin)  # écriture atomique : un état n'est jamais à moitié écrit
+        except BaseException:
+            os.unlink(provisoire.name); raise
+
+@dataclass
+class ResultatDelta:
+    """
+    Résultat d'un contrôle incrémental : le rapport et le compteur (identiques à un contrôle complet),
+    le décompte des lignes par statut, l'évolution de chaque type d'anomalie depuis la campagne
+    précédente et l'historique des campagnes.
+    """
+    anomalies_df: pd.DataFrame
+    anomaly_counter: pd.Series
+    lignes: dict
+    evolution: pd.DataFrame
+    historique: pd.DataFrame
+
+def executer_controles_delta(df, profil, magasin, campagne=None, journal=None):
+    """
+    Contrôle `df` en ne recontrôlant que les lignes nouvelles ou modifiées depuis la dernière exécution
+    de la campagne (par défaut, le nom du profil), puis enregistre le nouvel état.
+    Sans état précédent, ou si les colonnes de l'export, les règles du profil (contrôle géographique
+    activé par exemple) ou le contenu de ses référentiels (parc de compteurs mis à jour) ont changé,
+    toutes les lignes sont contrôlées.
+    Les contrôles d'une même campagne sont exécutés l'un après l'autre (voir `MagasinResultats.verrou`).
+    Retour: ResultatDelta
+    """
+    missing = [col for col in profil.colonnes_requises if col not in df.columns]
+    if missing: raise ColonnesManquantesError(missing)
+    campagne = campagne or profil.nom
+    journal = journal if journal is not None else JournalExecution(profil)
+    with magasin.verrou(campagne, profil): return _controler_delta(df, profil, magasin, campagne, journal)
+
+def _controler_delta(df, profil, magasin, campagne, journal):
+
+    with journal.etape('delta'):
+        precedent = magasin.charger(campagne, profil)
+        regles = [regle.nom for regle in profil.toutes_regles]
+        if precedent is not None and (precedent['colonnes'] != list(df.columns) or precedent['regles'] != regles or precedent['references'] != references(profil)): precedent = None
+        empreintes = empreintes_lignes(df); cles, compteurs = cles_lignes(df, empreintes).to_numpy(), numeros_compteurs(df).to_numpy()
+        if precedent is None:
+            inchangees = np.zeros(len(df), dtype=bool); connues = inchangees; disparues = np.zeros(0, dtype=bool); modifiees = precedentes = np.zeros(0, dtype=np.intp)
+        else:
+            position_precedente = pd.Index(precedent['cles']).get_indexer(cles)  # sans reindex : les empreintes restent en uint64
+            inchangees = (position_precedente >= 0) & (precedent['empreintes'][position_precedente] == empreintes)
+            disparues = ~pd.Index(precedent['cles']).isin(cles[inchangees])
+            modifiees, precedentes = apparier_modifiees(compteurs, ~inchangees, precedent['compteurs'], disparues)
+            connues = inchangees.copy(); connues[modifiees] = True
+
+    a_controler = df[~inchangees]; cles_doublons = {}
+    anomalies_nouvelles, _ = executer_controles(a_controler, profil, journal, cles_doublons=cles_doublons)
+
+    with journal.etape('delta'):
+        anomalies_nouvelles.insert(0, COLONNE_CLE, cles[df.index.get_indexer(anomalies_nouvelles['Index original'])])
+        morceaux = [anomalies_nouvelles]
+        if precedent is not None and inchangees.any():
+            position = pd.Series(np.arange(len(df)), index=cles)
+            reprises = precedent['anomalies'][precedent['anomalies'][COLONNE_CLE].isin(cles[inchangees])].copy()
+            reprises['Index original'] = df.index[position.reindex(reprises[COLONNE_CLE]).to_numpy()]
+            morceaux.append(reprises[anomalies_nouvelles.columns])
+        # Rapport des règles par ligne seules : c'est lui qui est repris à l'exécution suivante.
+        anomalies_lignes = pd.concat(morceaux, ignore_index=True).sort_values('Index original', kind='stable').reset_index(drop=True)
+        empreintes_doublons = {}
+        for cle, recalculees in cles_doublons.items():
+            completes = np.zeros(len(df), dtype=recalculees.dtype); completes[~inchangees] = recalculees
+            if precedent is not None: completes[inchangees] = precedent['doublons'][cle][position_precedente[inchangees]]
+            empreintes_doublons[cle] = completes
+
+    anomalies_df, _ = fusionner_doublons(anomalies_lignes.drop(columns=COLONNE_CLE), compter_anomalies(anomalies_lignes, profil), profil, empreintes_doublons, df.index.to_numpy(), lambda index: df.loc[index], journal)
+
+    with journal.etape('delta'):
+        anomaly_counter = compter_anomalies(anomalies_df, profil)
+        anomalies_df.insert(0, COLONNE_CLE, cles[df.index.get_indexer(anomalies_df['Index original'])])
+        lignes = {
+            'total': len(df), 'recontrolees': int((~inchangees).sum()), 'inchangees': int(inchangees.sum()),
+            'nouvelles': int((~connues).sum()), 'modifiees': len(modifiees), 'supprimees': int(disparues.sum()) - len(modifiees),
+        }
+        paires = paires_anomalies(anomalies_df)
+        avant = None
+        if precedent is not None:  # une ligne modifiée garde ses anomalies persistantes : ses anciens couples prennent sa nouvelle clé
+            avant = precedent['paires']; renommees = pd.Series(cles[modifiees], index=precedent['cles'][precedentes])
+            avant = avant.assign(**{COLONNE_CLE: avant[COLONNE_CLE].map(renommees).fillna(avant[COLONNE_CLE])})
+        evolution = evolution_anomalies(avant, paires)
+        historique = (precedent['historique'] if precedent is not None else []) + [{'date': datetime.now().isoformat(timespec='seconds'), 'lignes': len(df), 'lignes_en_anomalie': len(anomalies_df), **anomaly_counter.to_dict()}]
+        magasin.enregistrer(campagne, profil, {'colonnes': list(df.columns), 'regles': regles, 'references': references(profil), 'cles': cles, 'compteurs': compteurs, 'empreintes': empreintes, 'doublons': empreintes_doublons, 'anomalies': anomalies_lignes, 'paires': paires, 'historique': historique})
+
+    return ResultatDelta(anomalies_df.drop(columns=COLONNE_CLE), anomaly_counter, lignes, evolution, pd.DataFrame(historique))
+
+def evolution_anomalies(avant, apres):
+    """
+    Par type d'anomalie : cas nouveaux, persistants et résolus entre les couples (clé, type) de la
+    campagne précédente (`avant`, None pour une première campagne) et ceux de la campagne courante.
+    """
+    if avant is None: avant = apres.iloc[:0]
+    fusion = avant.merge(apres, how='outer', indicator=True)
+    statuts = fusion['_merge'].map({'right_only': 'Nouvelles', 'both': 'Persistantes', 'left_only': 'Résolues'})
+    evolution = pd.crosstab(fusion['Anomalie'], statuts).reindex(columns=['Nouvelles', 'Persistantes', 'Résolues'], fill_value=0)
+    evolution.index.name = "Type d'anomalie"; evolution.columns.name = None
+    return evolution.sort_values(['Nouvelles', 'Persistantes'], ascending=False, kind='stable').reset_index()
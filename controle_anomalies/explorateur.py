@@ -0,0 +1,64 @@
+"""
+Exploration d'un rapport volumineux page par page : filtres (types d'anomalie, marque, commune) et
+tri sont appliqués côté serveur sur des positions de lignes ; seules les lignes de la page affichée
+sont extraites du rapport.
+"""
+import numpy as np
+import pandas as pd
+
+from .moteur import IndexAnomalies
+
+COLONNES_FILTRES = ('Marque', 'Commune')
+TAILLE_PAGE_DEFAUT = 100
+
+
+class ExplorateurAnomalies:
+    """
+    Vue filtrée et triée d'un rapport. Les colonnes filtrables sont factorisées une fois : un filtre
+    devient une comparaison de codes entiers, et les types d'anomalie sont lus dans l'IndexAnomalies.
+    """
+    def __init__(self, anomalies_df, index=None):
+        self.anomalies_df = anomalies_df
+        self.index = index if index is not None else IndexAnomalies(anomalies_df)
+        self.codes, self.uniques = {}, {}
+        for col in COLONNES_FILTRES:
+            if col in anomalies_df.columns:
+                self.codes[col], self.uniques[col] = pd.factorize(anomalies_df[col].astype(object).where(anomalies_df[col].notna(), ''))
+
+    def __len__(self):
+        return len(self.anomalies_df)
+
+    def valeurs(self, colonne):
+        """Valeurs proposées pour filtrer `colonne` (triées), vide si la colonne n'est pas filtrable."""
+        return sorted(map(str, self.uniques.get(colonne, ())))
+
+    def selection(self, types=(), filtres=None, tri=None, croissant=True):
+        """
+        Positions des lignes portant l'un des `types` d'anomalie (tous si vide) et, pour chaque colonne de
+        `filtres` ({colonne: valeurs}), l'une des valeurs demandées ; triées sur la colonne `tri` (ordre du
+        rapport par défaut, tri stable, valeurs manquantes en dernier).
+        """
+        if types:
+            positions = np.unique(np.concatenate([self.index.positions.get(anomaly_type, np.empty(0, dtype=np.intp)) for anomaly_type in types]))
+        else:
+            positions = np.arange(len(self.anomalies_df))
+        for col, valeurs in (filtres or {}).items():
+            if not valeurs or col not in self.codes: continue
+            retenus = np.flatnonzero(np.isin(np.asarray(self.uniques[col], dtype=object).astype(str), list(map(str, valeurs))))
+            positions = positions[np.isin(self.codes[col][positions], retenus)]
+        if tri is not None:
+            cles = pd.Series(self.anomalies_df[tri].to_numpy()[positions])
+            try:
+                ordre = cles.sort_values(ascending=croissant, kind='stable', na_position='last').index.to_numpy()
+            except TypeError:  # colonne objet mêlant nombres et textes : tri sur le texte
+                ordre = cles.where(cles.isna(), cles.astype(str)).sort_values(ascending=croissant, kind='stable', na_position='last').index.to_numpy()
+            positions = positions[ordre]
+        return positions
+
+    def page(self, positions, numero, taille_page=TAILLE_PAGE_DEFAUT):
+        """Lignes de la page `numero` (à partir de 0) d'une sélection, extraites du rapport."""
+        return self.anomalies_df.iloc[positions[numero * taille_page:(numero + 1) * taille_page]]
+
+    @staticmethod
+    def nombre_pages(positions, taille_page=TAILLE_PAGE_DEFAUT):
+        return max((len(positions) + taille_page - 1) // taille_page, 1)
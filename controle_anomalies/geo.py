@@ -0,0 +1,138 @@
+"""
+Contrôle géographique : cohérence des coordonnées GPS d'un compteur avec sa commune déclarée, à partir
+d'un référentiel local des communes (centroïde et, si elle est connue, emprise) chargé une fois dans une
+grille spatiale. Les distances sont calculées par tableaux numpy, sans géométrie ligne par ligne.
+"""
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .moteur import ColonnesManquantesError
+
+RAYON_TERRE_KM = 6371.0
+SEUIL_KM_DEFAUT = 10.0
+TAILLE_CELLULE = 0.1  # en degrés, soit une dizaine de km
+COLONNES_REFERENTIEL = ('commune', 'latitude', 'longitude')
+# Emprise facultative (rectangle englobant) ; à défaut, la commune est réduite à son centroïde.
+COLONNES_EMPRISE = {'lat_min': 'latitude', 'lat_max': 'latitude', 'lon_min': 'longitude', 'lon_max': 'longitude'}
+VOISINAGE = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+
+def normaliser_noms(noms):
+    """Noms de communes comparables : sans accents ni ponctuation, en majuscules, 'ST' et 'STE' développés."""
+    noms = pd.Series(noms, dtype=object).fillna('').astype(str)
+    noms = noms.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii').str.upper()
+    noms = noms.str.replace(r'[^A-Z0-9]+', ' ', regex=True).str.strip()
+    return noms.str.replace(r'\bSTE\b', 'SAINTE', regex=True).str.replace(r'\bST\b', 'SAINT', regex=True)
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Distance haversine en km, élément par élément."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def _rangs(nombre):
+    """Rang de chaque élément dans son groupe quand des groupes de tailles `nombre` sont mis bout à bout."""
+    return np.arange(nombre.sum()) - np.repeat(np.cumsum(nombre) - nombre, nombre)
+
+class ReferentielCommunes:
+    """
+    Communes de référence, triées par nom normalisé (les homonymes sont contigus) et inscrites dans une
+    grille de cellules de `taille_cellule` degrés : une commune figure dans chaque cellule que couvre son emprise.
+    """
+    def __init__(self, communes, taille_cellule=TAILLE_CELLULE):
+        manquantes = [col for col in COLONNES_REFERENTIEL if col not in communes.columns]
+        if manquantes: raise ColonnesManquantesError(manquantes)
+        communes = communes.assign(nom=normaliser_noms(communes['commune']).to_numpy())
+        for col in ('latitude', 'longitude'): communes[col] = pd.to_numeric(communes[col], errors='coerce')
+        for col, source in COLONNES_EMPRISE.items():
+            communes[col] = pd.to_numeric(communes[col], errors='coerce').fillna(communes[source]) if col in communes.columns else communes[source]
+        communes = communes[communes['latitude'].notna() & communes['longitude'].notna() & (communes['nom'] != '')]
+        self.communes = communes.sort_values('nom', kind='stable').reset_index(drop=True)
+        self.taille_cellule = taille_cellule
+        self.lat, self.lon = self.communes['latitude'].to_numpy(), self.communes['longitude'].to_numpy()
+        self.lat_min, self.lat_max = self.communes['lat_min'].to_numpy(), self.communes['lat_max'].to_numpy()
+        self.lon_min, self.lon_max = self.communes['lon_min'].to_numpy(), self.communes['lon_max'].to_numpy()
+
+        # Homonymes : le nom n° k occupe les lignes debut[k] à debut[k] + nombre[k] - 1
+        self.noms = pd.Index(self.communes['nom'].unique())
+        codes = self.noms.get_indexer(self.communes['nom'])
+        self.debut = np.searchsorted(codes, np.arange(len(self.noms)))
+        self.nombre = np.bincount(codes, minlength=len(self.noms))
+
+        # Grille : couples (cellule, commune) triés par cellule, parcourus par recherche dichotomique
+        x0, x1 = self._cellule(self.lon_min), self._cellule(self.lon_max)
+        y0, y1 = self._cellule(self.lat_min), self._cellule(self.lat_max)
+        largeur = x1 - x0 + 1; nombre = largeur * (y1 - y0 + 1); rang = _rangs(nombre)
+        cles = self._cle(np.repeat(x0, nombre) + rang % np.repeat(largeur, nombre), np.repeat(y0, nombre) + rang // np.repeat(largeur, nombre))
+        ordre = np.argsort(cles, kind='stable')
+        self.cles_grille, self.communes_grille = cles[ordre], np.repeat(np.arange(len(self.communes)), nombre)[ordre]
+        self.empreinte = hashlib.sha256(pd.util.hash_pandas_object(self.communes, index=False).to_numpy().tobytes()).hexdigest()
+
+    @classmethod
+    def lire(cls, source, **options):
+        """Lit un référentiel CSV : colonnes commune, latitude, longitude et, facultativement, lat_min, lat_max, lon_min, lon_max."""
+        return cls(pd.read_csv(source, sep=None, engine='python', dtype={'commune': str}), **options)
+
+    def _cellule(self, degres):
+        return np.floor(np.asarray(degres, dtype=float) / self.taille_cellule).astype(np.int64)
+
+    @staticmethod
+    def _cle(x, y):
+        return x * 1_000_003 + y
+
+    def codes(self, noms):
+        """Position de chaque nom de commune (normalisé ici) dans le référentiel, -1 s'il est inconnu."""
+        return self.noms.get_indexer(normaliser_noms(noms))
+
+    def distance_emprise(self, lat, lon, communes):
+        """Distance (km) de chaque point à l'emprise de la commune correspondante, 0 à l'intérieur."""
+        return distance_km(lat, lon, np.clip(lat, self.lat_min[communes], self.lat_max[communes]), np.clip(lon, self.lon_min[communes], self.lon_max[communes]))
+
+    def distance_commune(self, lat, lon, codes):
+        """
+        Distance (km) de chaque point à la commune de code `codes` (la plus proche de ses homonymes),
+        NaN si la commune est inconnue ou les coordonnées manquantes.
+        """
+        distances = np.full(len(codes), np.nan)
+        points = np.flatnonzero((codes >= 0) & ~np.isnan(lat) & ~np.isnan(lon))
+        if len(points) == 0: return distances
+        nombre = self.nombre[codes[points]]; repetes = np.repeat(points, nombre)
+        ecarts = self.distance_emprise(lat[repetes], lon[repetes], self.debut[codes[repetes]] + _rangs(nombre))
+        distances[points] = np.minimum.reduceat(ecarts, np.cumsum(nombre) - nombre)
+        return distances
+
+    def commune_proche(self, lat, lon):
+        """
+        Nom de la commune la plus proche de chaque point (contenant le point, puis de centroïde le plus
+        proche) parmi celles des 9 cellules voisines ; None si aucune commune n'y est inscrite.
+        """
+        resultat = np.full(len(lat), None, dtype=object)
+        points = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+        if len(points) == 0: return resultat
+        cles = self._cle(self._cellule(lon[points])[:, None] + VOISINAGE[:, 0], self._cellule(lat[points])[:, None] + VOISINAGE[:, 1]).ravel()
+        gauche = np.searchsorted(self.cles_grille, cles, side='left'); nombre = np.searchsorted(self.cles_grille, cles, side='right') - gauche
+        repetes = np.repeat(np.repeat(points, len(VOISINAGE)), nombre)
+        if len(repetes) == 0: return resultat
+        communes = self.communes_grille[np.repeat(gauche, nombre) + _rangs(nombre)]
+        ecart_emprise = self.distance_emprise(lat[repetes], lon[repetes], communes)
+        ecart_centre = distance_km(lat[repetes], lon[repetes], self.lat[communes], self.lon[communes])
+        # Score : négatif à l'intérieur d'une emprise (centroïde le plus proche d'abord), sinon distance à l'emprise
+        score = np.where(ecart_emprise > 0, ecart_emprise, ecart_centre - 2 * np.pi * RAYON_TERRE_KM)
+        debuts = np.flatnonzero(np.r_[True, repetes[1:] != repetes[:-1]])  # les candidats d'un même point sont contigus
+        minimums = np.repeat(np.minimum.reduceat(score, debuts), np.diff(np.r_[debuts, len(score)]))
+        retenus = np.flatnonzero(score == minimums)
+        retenus = retenus[np.r_[True, repetes[retenus][1:] != repetes[retenus][:-1]]]
+        resultat[repetes[retenus]] = self.communes['commune'].to_numpy(dtype=object)[communes[retenus]]
+        return resultat
+
+@dataclass(frozen=True, eq=False)
+class ControleGeo:
+    """Référentiel des communes et distance maximale tolérée (km) entre un compteur et sa commune déclarée."""
+    referentiel: ReferentielCommunes
+    seuil_km: float = SEUIL_KM_DEFAUT
+
+    @property
+    def empreinte(self): return (self.referentiel.empreinte, self.seuil_km)
@@ -0,0 +1,309 @@
+"""
+Historique des campagnes : les résultats de chaque exécution (métadonnées, couples ligne × type
+d'anomalie, décompte par type, nombre de lignes par commune) sont ajoutés à une base SQLite locale,
+indexée par numéro de compteur, type d'anomalie, commune et date de campagne. Les rapports de
+tendance (compteurs signalés sur plusieurs campagnes consécutives, taux d'anomalie par commune dans
+le temps) sont alors des requêtes sur la base, sans relire aucun export.
+
+    controle-anomalies radio export.csv --historique --date-campagne 2026-09-30
+    controle-anomalies-historique recurrents radio --campagnes 3
+    controle-anomalies-historique communes radio --commune LYON -o taux.csv
+
+Une campagne est identifiée par sa date : les exécutions d'un même profil à la même date (plusieurs
+secteurs d'une tournée, par exemple) forment une seule campagne. Réenregistrer le même fichier pour le
+même profil et la même date remplace l'exécution précédente ; le fichier est désigné par son seul nom,
+qu'il vienne de la ligne de commande (chemin) ou de l'interface (fichier téléversé).
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import closing, contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .delta import DOSSIER_MAGASIN_DEFAUT
+from .parc import normaliser_numeros, normaliser_textes
+from .rapport import famille_anomalie
+
+FICHIER_HISTORIQUE_DEFAUT = str(Path(DOSSIER_MAGASIN_DEFAUT) / 'historique.db')
+CAMPAGNES_CONSECUTIVES_DEFAUT = 3
+DELAI_VERROU_S = 60.0  # plusieurs processus du pool peuvent enregistrer en même temps : l'écriture attend son tour
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    id INTEGER PRIMARY KEY,
+    profil TEXT NOT NULL,
+    campagne TEXT NOT NULL,
+    date_campagne TEXT NOT NULL,
+    fichier TEXT NOT NULL,
+    enregistree_le TEXT NOT NULL,
+    lignes INTEGER,
+    lignes_en_anomalie INTEGER NOT NULL,
+    duree_s REAL,
+    UNIQUE (profil, date_campagne, fichier)
+);
+CREATE INDEX IF NOT EXISTS executions_date ON executions (profil, date_campagne);
+CREATE TABLE IF NOT EXISTS anomalies (
+    execution INTEGER NOT NULL REFERENCES executions (id) ON DELETE CASCADE,
+    date_campagne TEXT NOT NULL,
+    ligne INTEGER NOT NULL,
+    numero_compteur TEXT NOT NULL,
+    commune TEXT NOT NULL,
+    marque TEXT NOT NULL,
+    type_anomalie TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS anomalies_compteur ON anomalies (numero_compteur, date_campagne);
+CREATE INDEX IF NOT EXISTS anomalies_type ON anomalies (type_anomalie, date_campagne);
+CREATE INDEX IF NOT EXISTS anomalies_commune ON anomalies (commune, date_campagne);
+CREATE INDEX IF NOT EXISTS anomalies_execution ON anomalies (execution, commune);
+CREATE TABLE IF NOT EXISTS decomptes (
+    execution INTEGER NOT NULL REFERENCES executions (id) ON DELETE CASCADE,
+    type_anomalie TEXT NOT NULL,
+    famille TEXT NOT NULL,
+    nombre INTEGER NOT NULL,
+    PRIMARY KEY (execution, type_anomalie)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS effectifs (
+    execution INTEGER NOT NULL REFERENCES executions (id) ON DELETE CASCADE,
+    commune TEXT NOT NULL,
+    lignes INTEGER NOT NULL,
+    PRIMARY KEY (execution, commune)
+) WITHOUT ROWID;
+"""
+
+# Couples distincts (compteur, date de campagne) signalés pour un profil : les séries de campagnes
+# consécutives en sont tirées par `series_consecutives`.
+REQUETE_SIGNALES = """
+SELECT DISTINCT numero_compteur, date_campagne FROM anomalies
+WHERE numero_compteur != '' AND (:type IS NULL OR type_anomalie = :type) AND execution IN (SELECT id FROM executions WHERE profil = :profil)
+"""
+
+# Types d'anomalie et dernière commune déclarée de chaque série retenue (table temporaire `series`), par l'index des numéros.
+REQUETE_SERIES = """
+SELECT s.numero_compteur,
+       (SELECT GROUP_CONCAT(type_anomalie, ' / ') FROM (
+            SELECT DISTINCT a.type_anomalie FROM anomalies a
+            WHERE a.numero_compteur = s.numero_compteur AND a.date_campagne BETWEEN s.debut AND s.fin
+              AND a.execution IN (SELECT id FROM executions WHERE profil = :profil)
+            ORDER BY a.type_anomalie)) AS types,
+       (SELECT a.commune FROM anomalies a
+        WHERE a.numero_compteur = s.numero_compteur AND a.date_campagne = s.fin AND a.execution IN (SELECT id FROM executions WHERE profil = :profil)
+        LIMIT 1) AS commune
+FROM series s
+"""
+
+# Lignes et lignes signalées par campagne et commune ; une ligne signalée plusieurs fois compte une fois.
+REQUETE_COMMUNES = """
+WITH signalees AS (
+    SELECT execution, commune, COUNT(DISTINCT ligne) AS lignes
+    FROM anomalies WHERE (:type IS NULL OR type_anomalie = :type) GROUP BY execution, commune
+)
+SELECT e.date_campagne AS "Date de campagne", f.commune AS "Commune", SUM(f.lignes) AS "Lignes",
+       SUM(COALESCE(s.lignes, 0)) AS "Lignes en anomalie", 1.0 * SUM(COALESCE(s.lignes, 0)) / SUM(f.lignes) AS "Taux d'anomalie"
+FROM executions e JOIN effectifs f ON f.execution = e.id
+LEFT JOIN signalees s ON s.execution = e.id AND s.commune = f.commune
+WHERE e.profil = :profil {filtre}
+GROUP BY e.date_campagne, f.commune
+ORDER BY f.commune, e.date_campagne
+"""
+
+
+def date_iso(valeur=None):
+    """Date de campagne 'AAAA-MM-JJ' d'une date, d'un horodatage ou d'un texte (aujourd'hui par défaut)."""
+    if valeur is None: return date.today().isoformat()
+    return pd.Timestamp(valeur).date().isoformat()
+
+def effectifs_communes(df):
+    """Nombre de lignes de `df` par commune normalisée (majuscules), '' pour une commune manquante ou une colonne absente."""
+    communes = normaliser_textes(df['Commune']) if 'Commune' in df.columns else np.full(len(df), '', dtype=object)
+    return pd.Series(communes, dtype=object).value_counts()
+
+def effectifs_csv(source, sonde):
+    """
+    `effectifs_communes` d'un export CSV (chemin ou flux) lu en mode bloc : seule la colonne Commune
+    (à défaut, la première colonne) est relue, pied de fichier écarté.
+    """
+    if hasattr(source, 'seek'): source.seek(0)
+    colonne = 'Commune' if 'Commune' in sonde.colonnes else sonde.colonnes[0]
+    return effectifs_communes(pd.read_csv(source, sep=sonde.delimiteur, encoding=sonde.encodage, dtype=str, usecols=[colonne]).iloc[:-2])
+
+def series_consecutives(codes, rangs):
+    """
+    Séries de rangs consécutifs de chaque code, les couples (code, rang) étant distincts : une série
+    commence à chaque changement de code ou saut de rang dans l'ordre (code, rang).
+    Retour: (code, longueur, rang de fin) de chaque série
+    """
+    if len(codes) == 0: return codes, np.zeros(0, dtype=np.int64), rangs
+    ordre = np.lexsort((rangs, codes)); codes, rangs = codes[ordre], rangs[ordre]
+    debuts = np.r_[True, (codes[1:] != codes[:-1]) | (rangs[1:] != rangs[:-1] + 1)]
+    return codes[debuts], np.bincount(np.cumsum(debuts) - 1), rangs[np.r_[debuts[1:], True]]
+
+def paires_historique(anomalies_df):
+    """
+    Couples (ligne, type d'anomalie) du rapport, une ligne par type signalé, avec le numéro de compteur
+    (normalisé comme pour le parc), la commune et la marque (majuscules), '' pour une valeur absente.
+    """
+    vides = np.full(len(anomalies_df), '', dtype=object)
+    paires = pd.DataFrame({
+        'ligne': anomalies_df['Index original'].to_numpy(),
+        'numero_compteur': normaliser_numeros(anomalies_df['Numéro de compteur']).to_numpy(dtype=object) if 'Numéro de compteur' in anomalies_df.columns else vides,
+        'commune': normaliser_textes(anomalies_df['Commune']) if 'Commune' in anomalies_df.columns else vides,
+        'marque': normaliser_textes(anomalies_df['Marque']) if 'Marque' in anomalies_df.columns else vides,
+        'type_anomalie': anomalies_df['Anomalie'].fillna('').str.split(' / '),
+    }).explode('type_anomalie')
+    paires['type_anomalie'] = paires['type_anomalie'].str.strip()
+    return paires[paires['type_anomalie'].notna() & (paires['type_anomalie'] != '')].drop_duplicates(['ligne', 'type_anomalie'])
+
+class HistoriqueAnomalies:
+    """
+    Base SQLite de l'historique des campagnes (créée au besoin ; par défaut, CONTROLE_ANOMALIES_HISTORIQUE
+    ou FICHIER_HISTORIQUE_DEFAUT). Chaque opération ouvre sa propre connexion : une même instance sert
+    plusieurs fils d'exécution (sessions Streamlit), et plusieurs processus peuvent écrire dans la même
+    base (journal WAL, attente du verrou).
+    """
+    def __init__(self, chemin=None):
+        self.chemin = Path(chemin or os.environ.get('CONTROLE_ANOMALIES_HISTORIQUE', FICHIER_HISTORIQUE_DEFAUT))
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        with self.connexion() as connexion:
+            connexion.execute('PRAGMA journal_mode=WAL'); connexion.executescript(SCHEMA)
+
+    @contextmanager
+    def connexion(self):
+        """Connexion dont la transaction est validée à la sortie du bloc (annulée sur exception), puis fermée."""
+        with closing(sqlite3.connect(self.chemin, timeout=DELAI_VERROU_S)) as connexion:
+            connexion.execute('PRAGMA foreign_keys=ON'); connexion.execute('PRAGMA synchronous=NORMAL')  # WAL : une validation n'attend plus le disque
+            with connexion: yield connexion
+
+    def requete(self, sql, parametres=()):
+        with self.connexion() as connexion: return pd.read_sql_query(sql, connexion, params=parametres)
+
+    def enregistrer(self, anomalies_df, anomaly_counter, profil, campagne=None, date_campagne=None, fichier='', effectifs=None, lignes=None, duree_s=None):
+        """
+        Ajoute une exécution : rapport `anomalies_df` (couples ligne × type), compteur `anomaly_counter`,
+        lignes par commune `effectifs` (Series ou dict, voir `effectifs_communes`) et nombre total de `lignes`
+        (par défaut, la somme des effectifs). La campagne porte le nom `campagne` (par défaut, la date) et
+        la date `date_campagne` (par défaut, aujourd'hui) ; une exécution du même `fichier` (comparé sur son nom, sans
+        dossier), profil et date est remplacée.
+        Retour: identifiant de l'exécution
+        """
+        date_campagne = date_iso(date_campagne); campagne = campagne or date_campagne; fichier = Path(fichier).name if fichier else ''
+        effectifs = None if effectifs is None else pd.Series(effectifs, dtype='int64')
+        if lignes is None and effectifs is not None: lignes = int(effectifs.sum())
+        paires = paires_historique(anomalies_df) if not anomalies_df.empty else pd.DataFrame(columns=['ligne', 'numero_compteur', 'commune', 'marque', 'type_anomalie'])
+        with self.connexion() as connexion:
+            connexion.execute('DELETE FROM executions WHERE profil = ? AND date_campagne = ? AND fichier = ?', (profil.nom, date_campagne, fichier))
+            execution = connexion.execute(
+                'INSERT INTO executions (profil, campagne, date_campagne, fichier, enregistree_le, lignes, lignes_en_anomalie, duree_s) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (profil.nom, campagne, date_campagne, fichier, datetime.now().isoformat(timespec='seconds'), lignes, len(anomalies_df), duree_s),
+            ).lastrowid
+            connexion.executemany(
+                'INSERT INTO anomalies (execution, date_campagne, ligne, numero_compteur, commune, marque, type_anomalie) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                zip([execution] * len(paires), [date_campagne] * len(paires), paires['ligne'].astype('int64').tolist(), paires['numero_compteur'].tolist(), paires['commune'].tolist(), paires['marque'].tolist(), paires['type_anomalie'].tolist()),
+            )
+            connexion.executemany('INSERT INTO decomptes VALUES (?, ?, ?, ?)', ((execution, anomaly_type, famille_anomalie(anomaly_type), int(nombre)) for anomaly_type, nombre in anomaly_counter.items()))
+            if effectifs is not None: connexion.executemany('INSERT INTO effectifs VALUES (?, ?, ?)', ((execution, commune, int(nombre)) for commune, nombre in effectifs.items()))
+        return execution
+
+    def executions(self, profil=None):
+        """Exécutions enregistrées (les plus récentes campagnes d'abord), avec leur taux de lignes en anomalie."""
+        return self.requete(
+            'SELECT id, profil, campagne, date_campagne, fichier, enregistree_le, lignes, lignes_en_anomalie, 1.0 * lignes_en_anomalie / lignes AS taux_anomalie, duree_s '
+            'FROM executions WHERE (:profil IS NULL OR profil = :profil) ORDER BY date_campagne DESC, id DESC', {'profil': profil})
+
+    def compteurs_recurrents(self, profil, campagnes=CAMPAGNES_CONSECUTIVES_DEFAUT, type_anomalie=None, en_cours=False):
+        """
+        Compteurs signalés (pour `type_anomalie`, ou pour un type quelconque) sur au moins `campagnes`
+        campagnes consécutives du profil : leur plus longue série (la plus récente à égalité), ses dates,
+        ses types d'anomalie et la dernière commune déclarée. Avec `en_cours`, seules les séries qui vont
+        jusqu'à la dernière campagne. Une campagne sans le compteur signalé interrompt la série.
+        """
+        with self.connexion() as connexion:
+            dates = pd.Index([date_campagne for date_campagne, in connexion.execute('SELECT DISTINCT date_campagne FROM executions WHERE profil = ? ORDER BY date_campagne', (profil,))])
+            signales = pd.read_sql_query(REQUETE_SIGNALES, connexion, params={'profil': profil, 'type': type_anomalie})
+            codes, numeros = pd.factorize(signales['numero_compteur'])
+            code, longueur, fin = series_consecutives(codes, dates.get_indexer(signales['date_campagne']))
+            retenues = (longueur >= campagnes) & (fin == len(dates) - 1 if en_cours else True)
+            series = pd.DataFrame({'code': code[retenues], 'longueur': longueur[retenues], 'fin': fin[retenues]})
+            series = series.sort_values(['longueur', 'fin'], ascending=False, kind='stable').drop_duplicates('code')
+            resultat = pd.DataFrame({
+                "Numéro de compteur": numeros[series['code']], "Campagnes consécutives": series['longueur'].to_numpy(),
+                "Première campagne": dates[series['fin'] - series['longueur'] + 1], "Dernière campagne": dates[series['fin']],
+                "En cours": series['fin'].to_numpy() == len(dates) - 1,
+            })
+            connexion.execute('CREATE TEMP TABLE series (numero_compteur TEXT PRIMARY KEY, debut TEXT, fin TEXT)')
+            connexion.executemany('INSERT INTO series VALUES (?, ?, ?)', resultat.iloc[:, [0, 2, 3]].itertuples(index=False, name=None))
+            details = pd.read_sql_query(REQUETE_SERIES, connexion, params={'profil': profil}).set_index('numero_compteur')
+        resultat["Anomalie"] = details['types'].reindex(resultat["Numéro de compteur"]).to_numpy()
+        resultat["Commune"] = details['commune'].reindex(resultat["Numéro de compteur"]).to_numpy()
+        return resultat.sort_values(["Campagnes consécutives", "Dernière campagne", "Numéro de compteur"], ascending=[False, False, True], ignore_index=True)
+
+    def taux_par_commune(self, profil, type_anomalie=None, communes=None):
+        """Lignes, lignes en anomalie (pour `type_anomalie`, ou tous types) et taux d'anomalie par campagne et commune."""
+        communes = None if communes is None else [str(commune).strip().upper() for commune in communes]
+        parametres = {'profil': profil, 'type': type_anomalie, **{f'commune{i}': commune for i, commune in enumerate(communes or ())}}
+        filtre = '' if not communes else f"AND f.commune IN ({', '.join(f':commune{i}' for i in range(len(communes)))})"
+        return self.requete(REQUETE_COMMUNES.format(filtre=filtre), parametres)
+
+    def evolution_types(self, profil):
+        """Nombre de cas de chaque type d'anomalie par campagne (une ligne par date, une colonne par type)."""
+        decomptes = self.requete(
+            'SELECT e.date_campagne, d.type_anomalie, SUM(d.nombre) AS nombre FROM decomptes d JOIN executions e ON e.id = d.execution '
+            'WHERE e.profil = ? GROUP BY e.date_campagne, d.type_anomalie', (profil,))
+        return decomptes.pivot(index='date_campagne', columns='type_anomalie', values='nombre').fillna(0).astype('int64').rename_axis(index='Date de campagne', columns=None)
+
+    def historique_compteur(self, numero, profil=None):
+        """Anomalies d'un compteur (numéro normalisé) dans toutes les campagnes enregistrées."""
+        numero = normaliser_numeros([numero]).iloc[0]
+        return self.requete(
+            'SELECT e.profil, e.date_campagne, e.campagne, a.commune, a.marque, a.type_anomalie, a.ligne FROM anomalies a JOIN executions e ON e.id = a.execution '
+            "WHERE a.numero_compteur = ? AND a.numero_compteur != '' AND (? IS NULL OR e.profil = ?) ORDER BY e.date_campagne, a.type_anomalie", (numero, profil, profil))
+
+# #############################################################################
+# --- REQUÊTES EN LIGNE DE COMMANDE ---
+# #############################################################################
+
+def construire_parser():
+    parser = argparse.ArgumentParser(prog='controle-anomalies-historique', description="Requêtes sur l'historique des campagnes enregistré par controle-anomalies --historique.")
+    parser.add_argument('--base', default=FICHIER_HISTORIQUE_DEFAUT, metavar='FICHIER', help=f"Base de l'historique (défaut : {FICHIER_HISTORIQUE_DEFAUT}).")
+    parser.add_argument('-o', '--output', metavar='FICHIER', help="Écrit le résultat en CSV (ou en xlsx selon l'extension) au lieu de l'afficher.")
+    requetes = parser.add_subparsers(dest='requete', required=True)
+    executions = requetes.add_parser('executions', help="Exécutions enregistrées.")
+    executions.add_argument('profil', nargs='?', help="Profil (défaut : tous).")
+    recurrents = requetes.add_parser('recurrents', help="Compteurs signalés sur plusieurs campagnes consécutives.")
+    recurrents.add_argument('profil')
+    recurrents.add_argument('--campagnes', type=int, default=CAMPAGNES_CONSECUTIVES_DEFAUT, help=f"Nombre minimal de campagnes consécutives (défaut : {CAMPAGNES_CONSECUTIVES_DEFAUT}).")
+    recurrents.add_argument('--type', dest='type_anomalie', metavar='TYPE', help="Type d'anomalie (défaut : un type quelconque).")
+    recurrents.add_argument('--en-cours', action='store_true', help="Seulement les séries qui vont jusqu'à la dernière campagne.")
+    communes = requetes.add_parser('communes', help="Taux d'anomalie par commune et par campagne.")
+    communes.add_argument('profil')
+    communes.add_argument('--type', dest='type_anomalie', metavar='TYPE', help="Type d'anomalie (défaut : tous types).")
+    communes.add_argument('--commune', action='append', metavar='COMMUNE', help="Commune retenue (répétable ; défaut : toutes).")
+    types = requetes.add_parser('types', help="Nombre de cas de chaque type d'anomalie par campagne.")
+    types.add_argument('profil')
+    compteur = requetes.add_parser('compteur', help="Anomalies d'un compteur dans toutes les campagnes.")
+    compteur.add_argument('numero')
+    compteur.add_argument('--profil')
+    return parser
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    if not Path(args.base).exists():
+        print(f"Aucun historique dans {args.base} (voir controle-anomalies --historique).", file=sys.stderr)
+        return 2
+    historique = HistoriqueAnomalies(args.base)
+    if args.requete == 'executions': resultat = historique.executions(args.profil)
+    elif args.requete == 'recurrents': resultat = historique.compteurs_recurrents(args.profil, args.campagnes, args.type_anomalie, args.en_cours)
+    elif args.requete == 'communes': resultat = historique.taux_par_commune(args.profil, args.type_anomalie, args.commune)
+    elif args.requete == 'types': resultat = historique.evolution_types(args.profil).reset_index()
+    else: resultat = historique.historique_compteur(args.numero, args.profil)
+    if args.output is None: print(resultat.to_string(index=False) if not resultat.empty else "Aucun résultat.")
+    elif Path(args.output).suffix.lower() == '.xlsx': resultat.to_excel(args.output, index=False)
+    else: resultat.to_csv(args.output, index=False)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+"""
+Journal d'exécution d'un contrôle : durée de chaque étape (lecture, normalisation, contrôles,
+assemblage, rapport) et, pour chaque règle, durée, lignes évaluées, lignes signalées et corrections
+produites. Exportable en dict/JSON et au format texte Prometheus.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+PREFIXE_METRIQUES = 'controle_anomalies'
+
+
+class JournalExecution:
+    """
+    Collecte les mesures d'une exécution. En mode bloc, le même journal reçoit les mesures de
+    chaque bloc : durées et compteurs sont cumulés, règle par règle (dans l'ordre du profil).
+    La durée d'une règle comprend le calcul des intermédiaires du Contexte qu'elle utilise en premier.
+    """
+    def __init__(self, profil=None):
+        self.profil = getattr(profil, 'nom', profil)
+        self.etapes = {}
+        self.regles = []
+        self.en_cours = None  # étape en cours, lue par le suivi d'un travail en tâche de fond
+
+    @contextmanager
+    def etape(self, nom):
+        debut = time.perf_counter(); precedente, self.en_cours = self.en_cours, nom
+        try:
+            yield
+        finally:
+            self.etapes[nom] = self.etapes.get(nom, 0.0) + time.perf_counter() - debut; self.en_cours = precedente
+
+    def regle(self, position, nom, duree, evaluees, signalees, corrections):
+        """Enregistre l'exécution de la règle n° `position` du profil (cumulée si elle a déjà été enregistrée)."""
+        if position == len(self.regles):
+            self.regles.append({'regle': nom, 'duree_s': 0.0, 'lignes_evaluees': 0, 'lignes_signalees': 0, 'corrections': 0})
+        mesure = self.regles[position]
+        mesure['duree_s'] += duree; mesure['lignes_evaluees'] += evaluees; mesure['lignes_signalees'] += signalees; mesure['corrections'] += corrections
+
+    def cumuler(self, autre):
+        """Ajoute les mesures d'un autre journal du même profil (celui d'un processus de contrôle parallèle)."""
+        for nom, duree in autre.etapes.items(): self.etapes[nom] = self.etapes.get(nom, 0.0) + duree
+        for position, mesure in enumerate(autre.regles):
+            self.regle(position, mesure['regle'], mesure['duree_s'], mesure['lignes_evaluees'], mesure['lignes_signalees'], mesure['corrections'])
+
+    def tableau_regles(self):
+        """Mesures par règle, les plus lentes en premier."""
+        colonnes = ['regle', 'duree_s', 'lignes_evaluees', 'lignes_signalees', 'corrections']
+        return pd.DataFrame(self.regles, columns=colonnes).sort_values('duree_s', ascending=False, kind='stable')
+
+    def en_dict(self):
+        return {'profil': self.profil, 'etapes_s': {nom: round(duree, 6) for nom, duree in self.etapes.items()}, 'regles': [{**mesure, 'duree_s': round(mesure['duree_s'], 6)} for mesure in self.regles]}
+
+    def en_json(self, **options):
+        return json.dumps(self.en_dict(), ensure_ascii=False, **options)
+
+def _etiquettes(**valeurs):
+    echapper = lambda texte: str(texte).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nom}="{echapper(valeur)}"' for nom, valeur in valeurs.items() if valeur is not None) + '}'
+
+def format_prometheus(journaux):
+    """
+    Métriques au format texte Prometheus (pour le collecteur de fichiers texte de node_exporter)
+    à partir d'un dict {fichier: JournalExecution ou dict de `en_dict()`}.
+    """
+    metriques = {
+        'etape_secondes': ('gauge', "Durée de chaque étape d'un contrôle.", []),
+        'regle_secondes': ('gauge', "Durée d'évaluation de chaque règle.", []),
+        'regle_lignes_evaluees': ('gauge', "Lignes évaluées par chaque règle.", []),
+        'regle_lignes_signalees': ('gauge', "Lignes signalées par chaque règle.", []),
+        'regle_corrections': ('gauge', "Corrections proposées par chaque règle.", []),
+    }
+    for fichier, journal in journaux.items():
+        donnees = journal.en_dict() if isinstance(journal, JournalExecution) else journal
+        for etape, duree in donnees['etapes_s'].items():
+            metriques['etape_secondes'][2].append((_etiquettes(fichier=fichier, profil=donnees['profil'], etape=etape), duree))
+        for position, mesure in enumerate(donnees['regles']):
+            etiquettes = _etiquettes(fichier=fichier, profil=donnees['profil'], position=position, regle=mesure['regle'])
+            metriques['regle_secondes'][2].append((etiquettes, mesure['duree_s']))
+            for champ in ('lignes_evaluees', 'lignes_signalees', 'corrections'):
+                metriques[f'regle_{champ}'][2].append((etiquettes, mesure[champ]))
+    lignes = []
+    for nom, (type_metrique, aide, valeurs) in metriques.items():
+        lignes += [f'# HELP {PREFIXE_METRIQUES}_{nom} {aide}', f'# TYPE {PREFIXE_METRIQUES}_{nom} {type_metrique}']
+        lignes += [f'{PREFIXE_METRIQUES}_{nom}{etiquettes} {valeur}' for etiquettes, valeur in valeurs]
+    return '\n'.join(lignes) + '\n'
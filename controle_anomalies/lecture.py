@@ -0,0 +1,186 @@
+"""
+Lecture des exports (CSV/XLSX, Parquet/Feather). Une sonde lit d'abord l'en-tête et un échantillon
+(le schéma pour un format colonnaire) : encodage et délimiteur sont détectés, les colonnes requises
+vérifiées, et un fichier inutilisable est rejeté avant toute lecture complète.
+"""
+import codecs
+import csv
+import io
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype
+
+from .moteur import ColonnesManquantesError
+from .normalisation import COLONNES_NUMERIQUES
+
+try:
+    import pyarrow.parquet as pq
+    from pyarrow import ipc
+except ImportError:  # sans pyarrow, seuls les exports CSV/XLSX sont lus
+    pq = ipc = None
+
+try:
+    import python_calamine  # noqa: F401 -- lecteur xlsx natif, bien plus rapide qu'openpyxl
+    MOTEUR_EXCEL = 'calamine'
+except ImportError:
+    MOTEUR_EXCEL = 'openpyxl'
+
+TAILLE_ECHANTILLON = 64 * 1024  # octets lus par la sonde
+LIGNES_ECHANTILLON = 50  # lignes de l'échantillon soumises à la détection du délimiteur
+DELIMITEURS = ';,\t|'
+# UTF-8 d'abord (un export Latin-1 y échoue presque toujours dès le premier accent), puis Windows-1252 ;
+# latin-1, qui décode tout octet, sert de dernier recours.
+ENCODAGES = ('utf-8', 'cp1252')
+# Formats colonnaires, par extension : lus sans conversion texte, colonne par colonne.
+FORMATS_COLONNAIRES = {'.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+
+
+@dataclass(frozen=True)
+class SondeExport:
+    """
+    Paramètres de lecture d'un export, déterminés sur son en-tête et un échantillon (délimiteur et encodage :
+    CSV seulement ; `colonnaire` : 'parquet' ou 'feather' pour un export colonnaire, None sinon).
+    """
+    excel: bool
+    colonnes: tuple
+    delimiteur: Optional[str] = None
+    encodage: Optional[str] = None
+    colonnaire: Optional[str] = None
+
+    @property
+    def csv(self): return not self.excel and self.colonnaire is None
+
+def est_excel(source):
+    return str(getattr(source, 'name', source)).lower().endswith('.xlsx')
+
+def format_colonnaire(source):
+    """'parquet' ou 'feather' selon l'extension du fichier, None pour un autre format."""
+    nom = str(getattr(source, 'name', source)).lower()
+    return next((format_ for extension, format_ in FORMATS_COLONNAIRES.items() if nom.endswith(extension)), None)
+
+def _schema_colonnaire(source, format_):
+    """Noms des colonnes d'un export Parquet (métadonnées du pied de fichier) ou Feather (schéma Arrow), sans lire les données."""
+    if pq is None: raise ImportError("La lecture des exports Parquet/Feather nécessite pyarrow.")
+    if hasattr(source, 'seek'): source.seek(0)
+    schema = pq.read_schema(source) if format_ == 'parquet' else ipc.open_file(source).schema
+    if hasattr(source, 'seek'): source.seek(0)
+    return tuple(name for name in schema.names if name != '__index_level_0__')
+
+def _ouvrir(source):
+    return nullcontext(source) if hasattr(source, 'read') else open(source, 'rb')
+
+def _decoder(echantillon):
+    """(encodage, texte) de l'échantillon ; un caractère coupé en fin d'échantillon n'est pas une erreur."""
+    if echantillon.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig', codecs.getincrementaldecoder('utf-8-sig')().decode(echantillon)
+    for encodage in ENCODAGES:
+        try:
+            return encodage, codecs.getincrementaldecoder(encodage)().decode(echantillon)
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1', echantillon.decode('latin-1')
+
+def _delimiteur(texte):
+    """Délimiteur parmi DELIMITEURS : détecté sur les premières lignes, à défaut le plus fréquent de l'en-tête."""
+    lignes = texte.splitlines()[:LIGNES_ECHANTILLON]
+    if len(lignes) > 1 and not texte.endswith(('\n', '\r')): lignes = lignes[:-1]  # dernière ligne tronquée par l'échantillon
+    try:
+        return csv.Sniffer().sniff('\n'.join(lignes), delimiters=DELIMITEURS).delimiter
+    except csv.Error:
+        entete = lignes[0] if lignes else ''
+        return max(DELIMITEURS, key=entete.count) if any(d in entete for d in DELIMITEURS) else ','
+
+def sonder_export(source, profil=None):
+    """
+    Sonde un export (chemin ou fichier binaire) sans le lire entièrement : l'en-tête pour un xlsx, le schéma
+    pour un export Parquet/Feather ; pour un CSV, un échantillon de TAILLE_ECHANTILLON octets dont sont tirés
+    encodage, délimiteur et en-tête.
+    Avec `profil`, une colonne requise absente lève ColonnesManquantesError dès ce stade.
+    Retour: SondeExport
+    """
+    colonnaire = format_colonnaire(source)
+    if colonnaire is not None:
+        sonde = SondeExport(False, _schema_colonnaire(source, colonnaire), colonnaire=colonnaire)
+    elif est_excel(source):
+        sonde = SondeExport(True, tuple(map(str, pd.read_excel(source, nrows=0, engine=MOTEUR_EXCEL).columns)))
+        if hasattr(source, 'seek'): source.seek(0)
+    else:
+        with _ouvrir(source) as fichier:
+            fichier.seek(0); echantillon = fichier.read(TAILLE_ECHANTILLON); fichier.seek(0)
+        encodage, texte = _decoder(echantillon)
+        delimiteur = _delimiteur(texte)
+        sonde = SondeExport(False, tuple(next(csv.reader(io.StringIO(texte), delimiter=delimiteur), ())), delimiteur, encodage)
+    if profil is not None:
+        missing = [col for col in profil.colonnes_requises if col not in sonde.colonnes]
+        if missing: raise ColonnesManquantesError(missing)
+    return sonde
+
+def detecter_delimiteur(file):
+    """Détecte le délimiteur d'un fichier CSV ouvert en binaire (voir `sonder_export`)."""
+    return sonder_export(file).delimiteur
+
+def colonnes_a_lire(profil, colonnes_conservees=None):
+    """
+    Sélecteur `usecols` : les colonnes requises par le profil et celles à conserver dans le rapport.
+    `colonnes_conservees=None` lit toutes les colonnes. Une colonne requise absente du fichier n'est
+    pas une erreur de lecture : elle est signalée par les contrôles (ColonnesManquantesError).
+    """
+    if colonnes_conservees is None:
+        return None
+    colonnes = set(profil.colonnes_requises) | set(colonnes_conservees)
+    return lambda col: col in colonnes
+
+def types_lecture(df, dtype):
+    """
+    Export colonnaire ramené aux types d'une lecture CSV : les colonnes lues en texte selon `dtype` (str, ou
+    dict du profil) deviennent des chaînes (un flottant entier sans '.0'), et les valeurs manquantes des colonnes
+    objet valent NaN, non None, comme le donne read_csv. Les colonnes de COLONNES_NUMERIQUES déjà numériques
+    gardent leur type : les contrôles les convertissent de toute façon en nombres.
+    """
+    texte = (set(df.columns) if dtype is str else {col for col, type_ in dtype.items() if type_ is str}) - set(COLONNES_NUMERIQUES)
+    for col in df.columns:
+        serie = df[col]
+        if col in texte and serie.dtype != object:
+            if is_float_dtype(serie.dtype) and (serie.dropna() % 1 == 0).all(): serie = serie.astype('Int64')
+            df[col] = serie.astype(str).astype(object).where(serie.notna().to_numpy(), np.nan)
+        elif serie.dtype == object and serie.isna().any():
+            df[col] = serie.where(serie.notna(), np.nan)
+    return df
+
+def colonnes_export(source):
+    """En-tête d'un export (liste des colonnes), sans lire les données."""
+    return list(sonder_export(source).colonnes)
+
+def lire_export(source, profil, colonnes_conservees=None, durees=None, sonde=None):
+    """
+    Lit un export complet (chemin ou fichier téléversé) avec les types du profil
+    et écarte les deux lignes de pied de fichier d'un CSV/XLSX (un export Parquet/Feather n'en a pas).
+    Avec `colonnes_conservees`, seules les colonnes requises et celles-ci sont lues (projection de
+    colonnes pour un format colonnaire : les autres colonnes ne sont pas même décompressées).
+    Sans `sonde` (SondeExport), l'export est d'abord sondé : une colonne requise absente est signalée
+    avant la lecture complète. Si un dict `durees` est fourni, les durées de la sonde et de la lecture
+    y sont enregistrées sous les clés 'sonde' et 'lecture' (secondes).
+    Retour: (df, délimiteur) — le délimiteur vaut None pour un fichier xlsx, Parquet ou Feather.
+    """
+    if sonde is None:
+        debut = time.perf_counter(); sonde = sonder_export(source, profil)
+        if durees is not None: durees['sonde'] = time.perf_counter() - debut
+    debut = time.perf_counter()
+    usecols = colonnes_a_lire(profil, colonnes_conservees)
+    if hasattr(source, 'seek'): source.seek(0)
+    if sonde.colonnaire is not None:
+        colonnes = None if usecols is None else [col for col in sonde.colonnes if usecols(col)]
+        lire = pd.read_parquet if sonde.colonnaire == 'parquet' else pd.read_feather
+        df = types_lecture(lire(source, columns=colonnes).reset_index(drop=True), profil.dtype_lecture)
+    elif sonde.excel:
+        df = pd.read_excel(source, dtype=profil.dtype_lecture, usecols=usecols, engine=MOTEUR_EXCEL).iloc[:-2]
+    else:
+        with _ouvrir(source) as fichier:
+            df = pd.read_csv(fichier, sep=sonde.delimiteur, encoding=sonde.encodage, dtype=profil.dtype_lecture, usecols=usecols).iloc[:-2]
+    if durees is not None: durees['lecture'] = time.perf_counter() - debut
+    return df, sonde.delimiteur
@@ -0,0 +1,513 @@
+"""
+Moteur des contrôles : registre d'anomalies en masque de bits, vérification FP2E vectorisée,
+règles déclaratives (par ligne, entre lignes et statistiques) et exécution d'un profil (en une fois ou bloc par bloc).
+Ce module ne dépend pas de Streamlit.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable, Optional
+
+from .journal import JournalExecution
+from .normalisation import annee_entiere, chaines, majuscules, normaliser, types_rapport
+
+
+class ColonnesManquantesError(ValueError):
+    """Le fichier ne contient pas toutes les colonnes requises par le profil."""
+    def __init__(self, colonnes):
+        self.colonnes = list(colonnes)
+        super().__init__(f"Colonnes requises manquantes : {', '.join(self.colonnes)}")
+
+class RegistreAnomalies:
+    """
+    Enregistre les anomalies d'un contrôle sous forme de masque de bits : chaque libellé
+    occupe un bit d'un entier par ligne, attribué dans l'ordre d'application des règles.
+    Le texte de la colonne 'Anomalie' n'est construit qu'une fois, pour les lignes signalées.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.libelles = []
+        self.codes = np.zeros(len(index), dtype=np.int64)
+
+    def bit(self, libelle):
+        if libelle not in self.libelles:
+            if len(self.libelles) == 63: raise ValueError("Trop de types d'anomalies pour un masque de 64 bits.")
+            self.libelles.append(libelle)
+        return self.libelles.index(libelle)
+
+    def signaler(self, masque, libelle):
+        """Signale `libelle` sur les lignes d'un masque booléen ou d'un Index de libellés de lignes."""
+        valeur = np.int64(1) << self.bit(libelle)
+        if isinstance(masque, pd.Index):
+            self.codes[self.index.get_indexer(masque)] |= valeur
+        else:
+            if not masque.index.equals(self.index): masque = masque.reindex(self.index, fill_value=False)
+            self.codes[masque.to_numpy(dtype=bool)] |= valeur
+
+    def textes(self, positions):
+        """Retourne la colonne 'Anomalie' (libellés séparés par ' / ') pour les positions demandées."""
+        codes_uniques, inverse = np.unique(self.codes[positions], return_inverse=True)
+        textes_uniques = np.array([' / '.join(libelle for bit, libelle in enumerate(self.libelles) if code >> bit & 1) for code in codes_uniques.tolist()], dtype=object)
+        return textes_uniques[inverse.reshape(-1)]
+
+    def compter(self, positions):
+        """Compte chaque type d'anomalie sur les positions demandées (équivalent d'un value_counts)."""
+        codes = self.codes[positions]
+        comptes = pd.Series([int(((codes >> bit) & 1).sum()) for bit in range(len(self.libelles))], index=pd.Index(self.libelles, name='Anomalie'), name='count', dtype='int64')
+        return comptes[comptes > 0].sort_values(ascending=False, kind='stable')
+
+FP2E_REGEX = r'^[A-Z]\d{2}[A-Z]{2}\d{6}$'
+
+# Diamètre attendu pour chaque lettre FP2E (5e caractère du numéro de compteur).
+# La lettre 'G' accepte aussi 65, mais la correction proposée reste 60.
+FP2E_DIAMETRE_PRINCIPAL = {'A': 15, 'U': 15, 'V': 15, 'B': 20, 'C': 25, 'D': 30, 'E': 40, 'F': 50, 'G': 60, 'H': 80, 'I': 100, 'J': 125, 'K': 150}
+FP2E_DIAMETRE_ALTERNATIF = {'G': 65}
+
+# Colonne source de chaque colonne de correction : la correction est placée juste après sa source dans le rapport.
+CORRECTIONS_SOURCES = {
+    'Correction Année': 'Année de fabrication', 'Correction Diamètre': 'Diametre', 'Correction Type Compteur': 'Type Compteur',
+    'Correction Marque': 'Marque', 'Correction Numéro de Tête': 'Numéro de tête', 'Correction Protocole Radio': 'Protocole Radio',
+    'Correction Commune': 'Commune',
+}
+
+class ResultatFP2E:
+    """Masques et corrections FP2E calculés en une passe, alignés sur l'index complet du DataFrame."""
+    def __init__(self, df, masque):
+        lignes = df.loc[masque]
+        compteur = lignes['Numéro de compteur'].fillna('').astype(str).str.strip()
+        parties = compteur.str.extract(r'^[A-Z](\d{2})[A-Z]([A-Z])\d{6}$')
+        annee_compteur, lettre_diam = parties[0], parties[1]
+        est_fp2e = annee_compteur.notna()
+
+        annee = lignes['Année de fabrication'].astype(object).fillna('').astype(str).str.strip()
+        annee_non_conforme = est_fp2e & (~annee.str.isdigit() | (annee_compteur != annee.str.zfill(2)))
+
+        diametre_principal = lettre_diam.map(FP2E_DIAMETRE_PRINCIPAL)
+        diametre_alternatif = lettre_diam.map(FP2E_DIAMETRE_ALTERNATIF)
+        diametre_conforme = (lignes['Diametre'] == diametre_principal) | (lignes['Diametre'] == diametre_alternatif)
+        diametre_non_conforme = est_fp2e & ~diametre_conforme
+
+        aligner = lambda serie: serie.reindex(df.index, fill_value=False)
+        self.format_invalide = aligner(~est_fp2e)
+        self.annee_non_conforme = aligner(annee_non_conforme)
+        self.diametre_non_conforme = aligner(diametre_non_conforme)
+        self.correction_annee = annee_compteur[annee_non_conforme]
+        self.correction_diametre = diametre_principal[diametre_non_conforme].dropna().astype(int).astype(str)
+
+class ResultatGeo:
+    """
+    Cohérence des coordonnées GPS avec la commune déclarée (voir `geo.ControleGeo`), alignée sur l'index
+    du DataFrame. Seules les coordonnées valides d'une commune connue du référentiel sont évaluées ; un
+    point éloigné qui, latitude et longitude échangées, tombe dans sa commune est compté comme inversé.
+    """
+    def __init__(self, df, controle):
+        referentiel, seuil = controle.referentiel, controle.seuil_km
+        lat, lon = df['Latitude'].to_numpy(dtype=float), df['Longitude'].to_numpy(dtype=float)
+        valides = (lat != 0) & (lon != 0) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        lat, lon = np.where(valides, lat, np.nan), np.where(valides, lon, np.nan)
+        commune = df['Commune']
+        if isinstance(commune.dtype, pd.CategoricalDtype):  # seules les catégories sont normalisées
+            codes = commune.cat.codes.to_numpy()
+            codes = np.where(codes >= 0, referentiel.codes(commune.cat.categories)[codes], -1)
+        else:
+            codes = referentiel.codes(commune)
+
+        eloignees = referentiel.distance_commune(lat, lon, codes) > seuil
+        inversees = eloignees & (referentiel.distance_commune(lon, lat, codes) <= seuil)
+        eloignees &= ~inversees
+        self.inversees = pd.Series(inversees, index=df.index)
+        self.eloignees = pd.Series(eloignees, index=df.index)
+        proches = pd.Series(referentiel.commune_proche(lat[eloignees], lon[eloignees]), index=df.index[eloignees], dtype=object)
+        self.commune_proche = proches[proches.notna() & (referentiel.codes(proches.fillna('')) != codes[eloignees])]
+
+class ResultatParc:
+    """
+    Rapprochement de l'export avec le parc de compteurs (voir `parc.ControleParc`), aligné sur l'index du
+    DataFrame : compteurs renseignés mais absents du parc et, pour les compteurs connus, caractéristiques
+    différentes de celles du parc, avec la valeur du parc en correction.
+    """
+    def __init__(self, df, controle):
+        parc = controle.parc
+        positions = parc.positions(df['Numéro de compteur'])
+        self.absents = pd.Series(positions == -1, index=df.index)
+        for col, attribut in (('Marque', 'marque'), ('Diametre', 'diametre'), ('Type Compteur', 'type_compteur')):
+            differences = parc.differences(col, df[col], positions) if col in df.columns else np.zeros(len(df), dtype=bool)
+            setattr(self, attribut, pd.Series(differences, index=df.index))
+            setattr(self, 'correction_' + attribut, parc.corrections(col, positions, differences, df.index) if differences.any() else pd.Series(dtype=object))
+
+class Contexte:
+    """
+    Colonnes intermédiaires partagées par les règles d'un profil (marque en majuscules, marques,
+    format FP2E...). Chaque intermédiaire n'est calculé qu'une fois, au premier accès, sur les
+    colonnes typées par `normaliser` (les majuscules ne portent que sur les catégories).
+    """
+    def __init__(self, df, profil):
+        self.df = df
+        self.profil = profil
+
+    @cached_property
+    def marque(self): return majuscules(self.df['Marque'])
+    @cached_property
+    def protocole(self): return majuscules(self.df['Protocole Radio'])
+    @cached_property
+    def est_manuelle(self): return majuscules(self.df['Mode de relève']) == 'MANUELLE'
+    @cached_property
+    def est_kamstrup(self): return self.marque == 'KAMSTRUP'
+    @cached_property
+    def est_sappel(self): return self.marque.isin(self.profil.marques_sappel)
+    @cached_property
+    def est_itron(self): return self.marque == 'ITRON'
+    @cached_property
+    def est_kaifa(self): return self.marque == 'KAIFA'
+    @cached_property
+    def annee_num(self): return annee_entiere(self.df['Année de fabrication'])
+    @cached_property
+    def compteur(self): return chaines(self.df['Numéro de compteur'])
+    @cached_property
+    def tete(self): return self.df['Numéro de tête']
+    @cached_property
+    def tete_manquante(self): return self.tete.isin(['', 'nan'])
+    @cached_property
+    def format_fp2e(self): return self.compteur.str.match(FP2E_REGEX, na=False)
+    @cached_property
+    def fp2e(self): return ResultatFP2E(self.df, self.profil.selection_fp2e(self))
+    @cached_property
+    def geo(self): return ResultatGeo(self.df, self.profil.geo)
+    @cached_property
+    def parc(self): return ResultatParc(self.df, self.profil.parc)
+    @cached_property
+    def empreinte_marque(self): return empreintes_textes(self.marque)
+    @cached_property
+    def empreinte_commune(self): return empreintes_textes(self.df['Commune'])
+    @cached_property
+    def empreinte_marque_commune(self): return empreintes_combinees(self.empreinte_marque, self.empreinte_commune)
+    @cached_property
+    def type_compteur_verifiable(self):
+        """Compteurs SAPPEL/ITRON de 11 caractères dont les 1er et 4e caractères sont des lettres."""
+        return (self.est_sappel | self.est_itron) & (self.compteur.str.len() == 11) & self.compteur.str[0].str.isalpha().eq(True) & self.compteur.str[3].str.isalpha().eq(True)
+    @cached_property
+    def type_attendu_sappel(self): return self.compteur.str[0] + self.compteur.str[3]
+    @cached_property
+    def type_attendu_itron(self): return 'I' + self.compteur.str[3]
+
+@dataclass(frozen=True)
+class Regle:
+    """
+    Règle de contrôle déclarative.
+    `condition(contexte)` retourne le masque des lignes en anomalie ; `colonnes` liste les colonnes
+    surlignées dans le rapport ; `correction` est un couple (colonne de correction, valeur) où la valeur
+    est une constante ou une fonction `valeur(contexte)` retournant une Series (les NaN sont ignorés).
+    """
+    nom: str
+    condition: Callable
+    colonnes: tuple = ()
+    correction: Optional[tuple] = None
+
+@dataclass(frozen=True)
+class RegleDoublons:
+    """
+    Règle de contrôle entre lignes.
+    `cle(contexte)` retourne la clé normalisée de chaque ligne (Series, ou DataFrame pour une clé
+    composée), NaN pour les lignes non concernées ; toutes les lignes partageant une clé sont signalées
+    et reçoivent le même numéro de groupe dans `colonne_groupe`, placée après la dernière colonne surlignée.
+    """
+    nom: str
+    cle: Callable
+    colonnes: tuple
+    colonne_groupe: str
+
+@dataclass(frozen=True)
+class RegleStatistique:
+    """
+    Règle statistique, évaluée sur la population de tout le fichier (voir le module `statistiques`).
+    `variables(contexte)` retourne les variables compactes de chaque ligne ({nom: tableau numpy}
+    d'empreintes ou de nombres) ; `detecter(variables, controle)` retourne le masque des lignes atypiques
+    à partir des variables de tout le fichier et des seuils de `controle` (statistiques.ControleStatistique).
+    """
+    nom: str
+    variables: Callable
+    detecter: Callable
+    colonnes: tuple
+
+@dataclass(frozen=True)
+class Profil:
+    """
+    Paramètres d'un type de contrôle (radio, tele, manuelle), liste ordonnée de ses règles, puis
+    règles entre lignes et règles statistiques, appliquées après les autres sur l'ensemble du fichier.
+    `geo` (geo.ControleGeo) n'est renseigné que par `regles.avec_controle_geo`, `parc` (parc.ControleParc)
+    que par `regles.avec_controle_parc`, `statistique` (statistiques.ControleStatistique) que par
+    `regles.avec_controle_statistique`.
+    """
+    nom: str
+    colonnes_requises: tuple
+    colonnes_texte: tuple
+    corrections: tuple
+    marques_sappel: tuple
+    selection_fp2e: Callable
+    regles: tuple
+    dtype_lecture: object = str
+    regles_doublons: tuple = ()
+    geo: object = None
+    parc: object = None
+    regles_statistiques: tuple = ()
+    statistique: object = None
+
+    @property
+    def colonnes_groupes(self): return tuple(regle.colonne_groupe for regle in self.regles_doublons)
+    @property
+    def toutes_regles(self): return self.regles + self.regles_doublons + self.regles_statistiques
+
+def colonnes_par_anomalie(profil):
+    """Colonnes à surligner pour chaque type d'anomalie du profil."""
+    colonnes = {}
+    for regle in profil.toutes_regles: colonnes.setdefault(regle.nom, list(regle.colonnes))
+    return colonnes
+
+def ordre_colonnes(colonnes, profil):
+    """Ordre des colonnes du rapport : chaque correction après sa colonne source, chaque groupe de doublons après la dernière colonne de sa règle."""
+    cols = [col for col in colonnes if col not in profil.corrections and col not in profil.colonnes_groupes]
+    for col in profil.corrections: cols.insert(cols.index(CORRECTIONS_SOURCES[col]) + 1, col)
+    for regle in profil.regles_doublons: cols.insert(cols.index(regle.colonnes[-1]) + 1, regle.colonne_groupe)
+    return cols
+
+def empreintes_cles(cles):
+    """
+    Empreinte 64 bits de la clé de chaque ligne, 0 si la clé manque : les clés de tous les blocs
+    d'un fichier tiennent ainsi en 8 octets par ligne et par règle.
+    """
+    if isinstance(cles, pd.DataFrame):
+        return np.where(cles.notna().all(axis=1).to_numpy(), pd.util.hash_pandas_object(cles, index=False).to_numpy(), np.uint64(0))
+    codes, uniques = pd.factorize(cles)  # seules les clés distinctes sont hachées
+    empreintes = pd.util.hash_array(np.asarray(uniques, dtype=object), categorize=False)
+    return np.where(codes >= 0, empreintes[codes], np.uint64(0))
+
+def empreintes_textes(valeurs):
+    """
+    Empreinte 64 bits de chaque texte comparé sans espaces autour et en majuscules, 0 pour un texte vide
+    ou manquant. Seules les valeurs distinctes (les catégories d'une colonne catégorielle) sont normalisées.
+    """
+    codes, uniques = pd.factorize(valeurs)
+    textes = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip().str.upper()
+    empreintes = empreintes_cles(textes.mask(textes.isin(['', 'NAN'])))
+    return np.where(codes >= 0, empreintes[codes] if len(empreintes) else np.uint64(0), np.uint64(0))
+
+def empreintes_combinees(*empreintes):
+    """Empreinte 64 bits d'une clé composée à partir de celles de ses parties, 0 si l'une d'elles manque."""
+    combinee = np.zeros(len(empreintes[0]), dtype=np.uint64)
+    for empreinte in empreintes: combinee = (combinee * np.uint64(0x100000001B3)) ^ empreinte
+    return np.where(np.logical_and.reduce([empreinte != 0 for empreinte in empreintes]), combinee | np.uint64(1), np.uint64(0))
+
+def variables_statistiques(cles_doublons, regle):
+    """Variables de la règle statistique `regle` parmi les clés conservées d'un contrôle en plusieurs morceaux."""
+    return {cle[1]: valeurs for cle, valeurs in cles_doublons.items() if isinstance(cle, tuple) and cle[0] == regle.nom}
+
+def groupes_doublons(empreintes):
+    """
+    Numéro de groupe de chaque ligne (1, 2... dans l'ordre de première apparition de la clé), 0 si sa
+    clé manque ou n'est partagée par aucune autre ligne. Une factorisation par table de hachage suivie
+    d'un décompte : O(n), sans tri.
+    """
+    codes, uniques = pd.factorize(empreintes)
+    partagees = (np.bincount(codes, minlength=len(uniques)) > 1) & (uniques != 0)
+    numeros = np.zeros(len(uniques), dtype=np.int64); numeros[partagees] = np.arange(1, partagees.sum() + 1)
+    return numeros[codes]
+
+def corrections_par_anomalie(profil):
+    """Colonne de correction associée à chaque type d'anomalie corrigeable du profil."""
+    return {regle.nom: regle.correction[0] for regle in profil.regles if regle.correction}
+
+class IndexAnomalies:
+    """
+    Positions des lignes de chaque type d'anomalie dans un rapport, construites en une passe :
+    la colonne 'Anomalie' est factorisée, chaque texte distinct est découpé une seule fois en
+    libellés, puis les lignes sont réparties par texte. Les onglets de détail et le décompte des
+    corrections proposées deviennent de simples sélections par position, sans recherche de
+    sous-chaîne (un libellé ne capte plus les lignes d'un libellé qui le contient).
+    """
+    def __init__(self, anomalies_df, profil=None):
+        codes, uniques = pd.factorize(anomalies_df['Anomalie'])
+        ordre = np.argsort(codes, kind='stable')
+        bornes = np.searchsorted(codes[ordre], np.arange(len(uniques) + 1))
+        groupes = {}
+        for code, texte in enumerate(uniques):
+            for libelle in str(texte).split(' / '):
+                groupes.setdefault(libelle.strip(), []).append(ordre[bornes[code]:bornes[code + 1]])
+        self.positions = {libelle: np.sort(np.concatenate(parts)) for libelle, parts in groupes.items()}
+
+        # Indicateur « correction proposée » des lignes de chaque type corrigeable du profil
+        self.corrections = {}
+        for libelle, colonne in (corrections_par_anomalie(profil).items() if profil is not None else ()):
+            if colonne in anomalies_df.columns:
+                self.corrections[libelle] = anomalies_df[colonne].to_numpy(dtype=object)[self.positions.get(libelle, np.empty(0, dtype=np.intp))] != ''
+
+    def lignes(self, anomalies_df, anomaly_type):
+        """Lignes du rapport portant le type d'anomalie `anomaly_type`."""
+        return anomalies_df.iloc[self.positions.get(anomaly_type, np.empty(0, dtype=np.intp))]
+
+    def nombre_corrections(self, anomaly_type):
+        """Nombre de lignes du type `anomaly_type` pour lesquelles une correction est proposée."""
+        return int(self.corrections[anomaly_type].sum()) if anomaly_type in self.corrections else 0
+
+def executer_controles(df, profil, journal=None, cles_doublons=None):
+    """
+    Applique en une passe toutes les règles du profil, puis ses règles entre lignes et statistiques.
+    Si un JournalExecution est fourni, il reçoit la durée des étapes (normalisation, contrôles,
+    doublons, statistiques, assemblage) et, pour chaque règle, sa durée, les lignes évaluées, signalées
+    et corrigées. Pour un contrôle en plusieurs morceaux, un dict `cles_doublons` reçoit à la place
+    l'empreinte des clés de chaque règle entre lignes (par colonne de groupe) et les variables de chaque
+    règle statistique (par couple (règle, variable)), à regrouper avec `fusionner_doublons`.
+    Retour: (anomalies_df, anomaly_counter)
+    """
+    missing = [col for col in profil.colonnes_requises if col not in df.columns]
+    if missing: raise ColonnesManquantesError(missing)
+    journal = journal if journal is not None else JournalExecution(profil)
+
+    with journal.etape('normalisation'):
+        df_with_anomalies = normaliser(df, profil)
+
+    with journal.etape('controles'):
+        registre = RegistreAnomalies(df_with_anomalies.index)
+        contexte = Contexte(df_with_anomalies, profil)
+        for position, regle in enumerate(profil.regles):
+            debut = time.perf_counter(); corrections = 0
+            masque = regle.condition(contexte)
+            if masque.dtype != bool: masque = masque.fillna(False).astype(bool)  # comparaisons sur l'année entière nullable
+            registre.signaler(masque, regle.nom)
+            if regle.correction:
+                col, valeur = regle.correction
+                if callable(valeur):
+                    valeur = valeur(contexte)
+                    valeur = valeur[masque.reindex(valeur.index, fill_value=False)].dropna()
+                    df_with_anomalies.loc[valeur.index, col] = valeur; corrections = len(valeur)
+                else:
+                    df_with_anomalies.loc[masque, col] = valeur; corrections = int(masque.sum())
+            journal.regle(position, regle.nom, time.perf_counter() - debut, len(df_with_anomalies), int(masque.sum()), corrections)
+
+    with journal.etape('doublons'):
+        for position, regle in enumerate(profil.regles_doublons, start=len(profil.regles)):
+            debut = time.perf_counter(); empreintes = empreintes_cles(regle.cle(contexte))
+            if cles_doublons is not None:
+                cles_doublons[regle.colonne_groupe] = empreintes; continue
+            groupes = pd.Series(groupes_doublons(empreintes), index=df_with_anomalies.index); masque = groupes > 0
+            registre.signaler(masque, regle.nom); df_with_anomalies.loc[masque, regle.colonne_groupe] = groupes[masque].astype(str)
+            journal.regle(position, regle.nom, time.perf_counter() - debut, len(df_with_anomalies), int(masque.sum()), 0)
+
+    with journal.etape('statistiques'):
+        for position, regle in enumerate(profil.regles_statistiques, start=len(profil.regles) + len(profil.regles_doublons)):
+            debut = time.perf_counter(); variables = regle.variables(contexte)
+            if cles_doublons is not None:
+                for nom, valeurs in variables.items(): cles_doublons[(regle.nom, nom)] = valeurs
+                continue
+            masque = pd.Series(regle.detecter(variables, profil.statistique), index=df_with_anomalies.index)
+            registre.signaler(masque, regle.nom)
+            journal.regle(position, regle.nom, time.perf_counter() - debut, len(df_with_anomalies), int(masque.sum()), 0)
+
+    with journal.etape('assemblage'):
+        a_corriger = np.zeros(len(df_with_anomalies), dtype=bool)
+        for col in profil.corrections: a_corriger |= (df_with_anomalies[col] != '').to_numpy()
+        positions = np.flatnonzero((registre.codes != 0) | a_corriger)
+        anomalies_df = types_rapport(df_with_anomalies.iloc[positions].copy()); anomalies_df['Anomalie'] = registre.textes(positions)
+        anomalies_df.reset_index(inplace=True); anomalies_df.rename(columns={'index': 'Index original'}, inplace=True)
+
+        return anomalies_df[ordre_colonnes(anomalies_df.columns, profil)], registre.compter(positions)
+
+def sommer_compteurs(compteurs, profil):
+    """Somme des compteurs de plusieurs blocs ou tranches, dans l'ordre de RegistreAnomalies.compter : nombre décroissant, puis ordre des règles."""
+    ordre = list(dict.fromkeys(regle.nom for regle in profil.toutes_regles))
+    anomaly_counter = pd.concat(compteurs).groupby(level=0).sum()
+    anomaly_counter = anomaly_counter.reindex([nom for nom in ordre if nom in anomaly_counter.index]).astype('int64').sort_values(ascending=False, kind='stable')
+    anomaly_counter.index.name = 'Anomalie'; anomaly_counter.name = 'count'
+    return anomaly_counter
+
+def fusionner_doublons(anomalies_df, anomaly_counter, profil, cles_doublons, index_lignes, lire_lignes, journal=None):
+    """
+    Applique les règles entre lignes et statistiques à un fichier contrôlé en plusieurs morceaux (blocs,
+    mode delta). `cles_doublons[colonne_groupe]` donne l'empreinte de la clé de chaque ligne du fichier,
+    `cles_doublons[(règle, variable)]` les variables des règles statistiques, et `index_lignes` son
+    'Index original'. Les lignes signalées déjà présentes dans le rapport reçoivent le libellé (et le
+    numéro de groupe d'un doublon) ; les autres sont obtenues avec `lire_lignes(index)` (lignes brutes)
+    et normalisées comme en mode complet. Le résultat est celui d'un contrôle du fichier en une fois.
+    Retour: (anomalies_df, anomaly_counter)
+    """
+    journal = journal if journal is not None else JournalExecution(profil)
+    with journal.etape('doublons'):
+        groupes = []
+        for position, regle in enumerate(profil.regles_doublons, start=len(profil.regles)):
+            debut = time.perf_counter(); numeros = groupes_doublons(cles_doublons[regle.colonne_groupe]); signalees = numeros > 0
+            groupes.append((regle, pd.Series(numeros[signalees], index=index_lignes[signalees])))
+            journal.regle(position, regle.nom, time.perf_counter() - debut, len(numeros), int(signalees.sum()), 0)
+    with journal.etape('statistiques'):
+        for position, regle in enumerate(profil.regles_statistiques, start=len(profil.regles) + len(profil.regles_doublons)):
+            debut = time.perf_counter(); signalees = regle.detecter(variables_statistiques(cles_doublons, regle), profil.statistique)
+            groupes.append((regle, pd.Series(0, index=index_lignes[signalees])))
+            journal.regle(position, regle.nom, time.perf_counter() - debut, len(signalees), int(signalees.sum()), 0)
+    with journal.etape('assemblage'):
+        if not any(len(serie) for _, serie in groupes):
+            return anomalies_df, anomaly_counter
+
+        manquantes = pd.Index(np.unique(np.concatenate([serie.index.to_numpy() for _, serie in groupes]))).difference(anomalies_df['Index original'])
+        if len(manquantes):
+            supplement = types_rapport(normaliser(lire_lignes(manquantes), profil)).reset_index().rename(columns={'index': 'Index original'})
+            supplement['Anomalie'] = ''
+            anomalies_df = pd.concat([anomalies_df, supplement[anomalies_df.columns]], ignore_index=True).sort_values('Index original', kind='stable').reset_index(drop=True)
+
+        lignes = pd.Index(anomalies_df['Index original']); textes = anomalies_df['Anomalie'].to_numpy(dtype=object).copy()
+        for regle, serie in groupes:
+            if serie.empty: continue
+            positions = lignes.get_indexer(serie.index)
+            if isinstance(regle, RegleDoublons): anomalies_df.iloc[positions, anomalies_df.columns.get_loc(regle.colonne_groupe)] = serie.astype(str).to_numpy()
+            textes[positions] = np.where(textes[positions] == '', regle.nom, textes[positions] + ' / ' + regle.nom)  # les règles entre lignes et statistiques viennent en dernier, comme en mode complet
+        anomalies_df['Anomalie'] = textes
+
+        comptes = pd.Series({regle.nom: len(serie) for regle, serie in groupes if len(serie)}, dtype='int64')
+        anomaly_counter = pd.concat([anomaly_counter, comptes]).groupby(level=0, sort=False).sum().sort_values(ascending=False, kind='stable')
+        anomaly_counter.index.name = 'Anomalie'; anomaly_counter.name = 'count'
+        return anomalies_df, anomaly_counter
+
+TAILLE_BLOC_DEFAUT = 100_000
+
+def executer_controles_par_blocs(fichier, profil, sep, dtype=str, taille_bloc=TAILLE_BLOC_DEFAUT, usecols=None, journal=None, encodage=None):
+    """
+    Contrôle un CSV bloc par bloc sans le charger entièrement : la mémoire est bornée par la taille d'un bloc.
+    Comme en mode complet, les deux dernières lignes du fichier (pied de fichier) sont écartées et
+    'Index original' reste la position de la ligne dans le fichier. `usecols` et `encodage` (celui de la
+    sonde, voir `lecture.sonder_export`) sont transmis à `read_csv`.
+    Les règles entre lignes et statistiques portent sur tout le fichier : seules l'empreinte de leurs clés
+    et leurs variables sont gardées d'un bloc à l'autre, et les lignes signalées absentes du rapport sont
+    relues en une seconde passe.
+    Le `journal` éventuel cumule les mesures de tous les blocs, lecture comprise.
+    Retour: (anomalies_df, anomaly_counter)
+    """
+    journal = journal if journal is not None else JournalExecution(profil)
+    morceaux, compteurs, reste = [], [], None
+    cles_doublons, index_lignes = {}, []
+    lire = lambda: pd.read_csv(fichier, sep=sep, dtype=dtype, chunksize=taille_bloc, usecols=usecols, encoding=encodage)
+    with journal.etape('lecture'): blocs = iter(lire())
+    while True:
+        with journal.etape('lecture'): bloc = next(blocs, None)
+        if bloc is None: break
+        if reste is not None: bloc = pd.concat([reste, bloc])
+        # Les deux dernières lignes lues sont gardées en réserve : elles ne sont contrôlées que si d'autres lignes suivent.
+        reste = bloc.iloc[-2:]; bloc = bloc.iloc[:-2]
+        if bloc.empty: continue
+        cles_bloc = {}
+        anomalies_df, anomaly_counter = executer_controles(bloc, profil, journal, cles_doublons=cles_bloc)
+        for cle, valeurs in cles_bloc.items(): cles_doublons.setdefault(cle, []).append(valeurs)
+        index_lignes.append(bloc.index.to_numpy())
+        if not anomalies_df.empty: morceaux.append(anomalies_df)
+        compteurs.append(anomaly_counter)
+
+    if not compteurs:
+        if reste is None: fichier.seek(0); reste = pd.read_csv(fichier, sep=sep, dtype=dtype, nrows=0, usecols=usecols, encoding=encodage)
+        return executer_controles(reste.iloc[:0], profil, journal)
+    if morceaux:
+        anomalies_df = pd.concat(morceaux, ignore_index=True)
+        anomaly_counter = sommer_compteurs(compteurs, profil)  # égalités dans l'ordre des règles, pas dans celui du premier bloc
+
+    def relire(index):
+        fichier.seek(0)
+        return pd.concat([bloc[bloc.index.isin(index)] for bloc in lire()])
+    return fusionner_doublons(anomalies_df, anomaly_counter, profil, {cle: np.concatenate(valeurs) for cle, valeurs in cles_doublons.items()}, np.concatenate(index_lignes), relire, journal)
@@ -0,0 +1,85 @@
+"""
+Normalisation typée des colonnes avant les contrôles : colonnes peu variées en catégories,
+identifiants en chaînes Arrow, année de fabrication analysée vectoriellement. Les règles
+travaillent sur ces colonnes typées ; le rapport est reconverti en objets pour rester identique.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+# Colonnes à faible cardinalité : stockées en catégories (un code entier par ligne).
+COLONNES_CATEGORIELLES = ('Marque', 'Protocole Radio', 'Mode de relève', 'Type Compteur', 'Commune')
+# Identifiants : chaînes Arrow (mémoire contiguë, opérations .str natives).
+COLONNES_IDENTIFIANTS = ('Numéro de compteur', 'Numéro de tête')
+COLONNES_NUMERIQUES = ('Latitude', 'Longitude', 'Diametre')
+
+try:
+    import pyarrow  # noqa: F401
+    try:
+        CHAINE_ARROW = pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        CHAINE_ARROW = pd.StringDtype('pyarrow_numpy')
+except ImportError:  # sans pyarrow, les identifiants restent des objets Python
+    CHAINE_ARROW = None
+
+
+def normaliser_annee(serie):
+    """
+    Année de fabrication sur deux caractères ('2023', '2023.0', '23' -> '23'), calculée sans apply :
+    une valeur numérique est tronquée à sa partie entière, les autres textes sont gardés tels quels.
+    """
+    texte = serie.astype(str).replace('nan', '', regex=False)
+    numerique = texte.str.replace('.', '', n=1, regex=False).str.isdigit()
+    entier = texte[numerique].str.split('.', n=1).str[0].str.lstrip('0').replace('', '0')
+    return texte.mask(numerique, entier).str.slice(-2).str.zfill(2)
+
+def annee_entiere(annee):
+    """
+    Année normalisée (deux caractères) en entier nullable sur 8 bits, <NA> si non numérique.
+    Pour une colonne catégorielle, seules les catégories sont converties.
+    """
+    if not isinstance(annee.dtype, pd.CategoricalDtype):
+        return pd.to_numeric(annee, errors='coerce').astype('Int8')
+    valeurs = pd.to_numeric(pd.Series(annee.cat.categories, dtype=object), errors='coerce').astype('Int8').array
+    return pd.Series(valeurs.take(annee.cat.codes.to_numpy(), allow_fill=True), index=annee.index, name=annee.name)
+
+def chaines(serie):
+    """Colonne en texte ('nan' pour les valeurs manquantes), en chaînes Arrow si pyarrow est disponible."""
+    if CHAINE_ARROW is not None and serie.dtype == CHAINE_ARROW:
+        return serie
+    texte = serie.astype(str)
+    return texte.astype(CHAINE_ARROW) if CHAINE_ARROW is not None else texte
+
+def majuscules(serie):
+    """Met une colonne catégorielle en majuscules en ne traitant que ses catégories (les codes sont réutilisés)."""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.astype(str).str.upper()
+    codes_majuscules, categories = pd.factorize(serie.cat.categories.str.upper())
+    codes = serie.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, codes_majuscules[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=serie.index, name=serie.name)
+
+def normaliser(df, profil):
+    """
+    Copie de travail typée de `df` pour les règles du profil : colonnes de correction et de groupe vides,
+    année sur deux caractères, colonnes texte du profil sans 'nan', puis colonnes catégorielles,
+    identifiants Arrow et colonnes numériques.
+    """
+    df = df.copy()
+    for col in profil.corrections + profil.colonnes_groupes: df[col] = ''
+    df['Année de fabrication'] = normaliser_annee(df['Année de fabrication']).astype('category')
+    for col in profil.colonnes_texte: df[col] = df[col].astype(str).replace('nan', '', regex=False)
+    for col in COLONNES_CATEGORIELLES:
+        if col in df.columns: df[col] = df[col].astype('category')
+    if CHAINE_ARROW is not None:
+        for col in COLONNES_IDENTIFIANTS:
+            if col in profil.colonnes_texte: df[col] = df[col].astype(CHAINE_ARROW)
+    for col in COLONNES_NUMERIQUES: df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def types_rapport(df):
+    """Reconvertit les colonnes catégorielles et Arrow en objets : le rapport garde les types d'origine."""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) or (is_string_dtype(df[col].dtype) and df[col].dtype != object):
+            df[col] = df[col].astype(object)
+    return df
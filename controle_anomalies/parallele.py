@@ -0,0 +1,111 @@
+"""
+Exécution des contrôles sur plusieurs cœurs : l'export est écrit une fois au format Arrow (IPC) dans
+un segment de mémoire partagée, chaque processus en lit une tranche de lignes sans copie du segment
+ni sérialisation du DataFrame, la normalise et la contrôle. Les résultats partiels sont assemblés dans
+l'ordre des tranches, puis les règles entre lignes et statistiques sont appliquées sur l'ensemble : le résultat est
+identique à celui de `executer_controles`.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # sans pyarrow, les contrôles restent séquentiels
+    pa = None
+
+from .journal import JournalExecution
+from .moteur import ColonnesManquantesError, executer_controles, fusionner_doublons, sommer_compteurs
+from .regles import PROFILS, avec_controle_geo, avec_controle_parc, avec_controle_statistique
+
+LIGNES_MIN_PARALLELE = 200_000  # en dessous, le démarrage des processus coûte plus qu'il ne rapporte
+COLONNE_INDEX = '__index_original__'
+
+
+def profil_reconstructible(profil):
+    """
+    Les règles (fonctions lambda) ne passent pas d'un processus à l'autre : un processus reconstruit le
+    profil à partir de son nom, du contrôle géographique, du parc de compteurs et des seuils statistiques
+    éventuels. Un profil modifié autrement reste séquentiel.
+    """
+    return profil.nom in PROFILS and _profil(profil.nom, profil.geo, profil.parc, profil.statistique) == profil
+
+def _profil(nom, geo, parc, statistique):
+    profil = PROFILS[nom] if geo is None else avec_controle_geo(PROFILS[nom], geo)
+    profil = profil if parc is None else avec_controle_parc(profil, parc)
+    return profil if statistique is None else avec_controle_statistique(profil, statistique)
+
+def _attacher(nom):
+    """Ouvre un segment existant ; seul le processus qui l'a créé le libère."""
+    try:
+        return shared_memory.SharedMemory(name=nom, track=False)
+    except TypeError:  # Python < 3.13 : le suivi de ressources est celui du parent, l'inscription est sans effet
+        return shared_memory.SharedMemory(name=nom)
+
+def _ecrire_memoire_partagee(df):
+    """Écrit `df` (index compris, en colonne) au format Arrow IPC dans un nouveau segment de mémoire partagée."""
+    table = pa.Table.from_pandas(df.reset_index(names=COLONNE_INDEX), preserve_index=False)
+    mesure = pa.MockOutputStream()
+    with pa.ipc.new_stream(mesure, table.schema) as ecrivain: ecrivain.write_table(table)
+    memoire = shared_memory.SharedMemory(create=True, size=max(mesure.size(), 1))
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(memoire.buf)), table.schema) as ecrivain: ecrivain.write_table(table)
+    return memoire
+
+def _controler_tranche(nom_memoire, debut, fin, colonnes_objet, nom_profil, geo, parc, statistique):
+    """Contrôle les lignes `debut` à `fin` de l'export partagé (exécuté dans un processus du pool)."""
+    memoire = _attacher(nom_memoire)
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(memoire.buf)).read_all().slice(debut, fin - debut)
+        tranche = table.to_pandas().copy()  # copie : plus aucune vue sur le segment avant sa fermeture
+        del table
+    finally:
+        memoire.close()
+    tranche = tranche.set_index(COLONNE_INDEX); tranche.index.name = None
+    # Arrow rend None (ou un float64 pour une colonne vide) là où la lecture donnait NaN dans une colonne objet
+    for col in colonnes_objet: tranche[col] = tranche[col].astype(object).fillna(np.nan)
+
+    profil = _profil(nom_profil, geo, parc, statistique); journal = JournalExecution(profil); cles_doublons = {}
+    anomalies_df, anomaly_counter = executer_controles(tranche, profil, journal, cles_doublons=cles_doublons)
+    return anomalies_df, anomaly_counter, cles_doublons, tranche.index.to_numpy(), journal
+
+def executer_controles_parallele(df, profil, processus=None, journal=None, lignes_min=LIGNES_MIN_PARALLELE):
+    """
+    Répartit les contrôles de `df` sur `processus` processus (par défaut, le nombre de cœurs), une tranche
+    de lignes contiguës chacun. Sous `lignes_min` lignes, avec un seul processus, sans pyarrow ou pour un
+    profil qui ne peut être reconstruit dans un processus, les contrôles sont exécutés séquentiellement.
+    Les durées des étapes du journal sont cumulées sur les processus ; 'parallele' donne la durée réelle.
+    Retour: (anomalies_df, anomaly_counter), identique à `executer_controles(df, profil)`
+    """
+    journal = journal if journal is not None else JournalExecution(profil)
+    processus = min(processus or os.cpu_count() or 1, max(len(df) // max(lignes_min // 2, 1), 1))
+    if processus <= 1 or len(df) < lignes_min or pa is None or not profil_reconstructible(profil):
+        return executer_controles(df, profil, journal)
+    missing = [col for col in profil.colonnes_requises if col not in df.columns]
+    if missing: raise ColonnesManquantesError(missing)
+
+    debut_parallele = time.perf_counter()
+    with journal.etape('partage'): memoire = _ecrire_memoire_partagee(df)
+    try:
+        bornes = np.linspace(0, len(df), processus + 1).astype(int)
+        colonnes_objet = [col for col in df.columns if df[col].dtype == object]
+        # 'spawn' : des processus neufs, sans hériter des fils d'exécution du parent (serveur Streamlit compris)
+        with ProcessPoolExecutor(max_workers=processus, mp_context=multiprocessing.get_context('spawn')) as pool:
+            taches = [pool.submit(_controler_tranche, memoire.name, debut, fin, colonnes_objet, profil.nom, profil.geo, profil.parc, profil.statistique) for debut, fin in zip(bornes[:-1], bornes[1:])]
+            resultats = [tache.result() for tache in taches]
+    finally:
+        memoire.close(); memoire.unlink()
+
+    with journal.etape('assemblage'):
+        for *_, journal_tranche in resultats: journal.cumuler(journal_tranche)
+        anomalies_df = pd.concat([resultat[0] for resultat in resultats], ignore_index=True)
+        anomaly_counter = sommer_compteurs([resultat[1] for resultat in resultats], profil)
+        cles_doublons = {cle: np.concatenate([resultat[2][cle] for resultat in resultats]) for cle in resultats[0][2]}
+        index_lignes = np.concatenate([resultat[3] for resultat in resultats])
+    resultat = fusionner_doublons(anomalies_df, anomaly_counter, profil, cles_doublons, index_lignes, lambda index: df.loc[index], journal)
+    journal.etapes['parallele'] = time.perf_counter() - debut_parallele
+    return resultat
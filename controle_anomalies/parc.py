@@ -0,0 +1,113 @@
+"""
+Rapprochement avec le parc de compteurs : un référentiel local (CSV, Parquet ou table SQLite) des
+compteurs posés, indexé une fois par numéro de compteur normalisé. L'export y est joint par une
+recherche d'index vectorisée ; les compteurs inconnus du parc et les caractéristiques (marque,
+diamètre, type) qui en diffèrent sont signalés, la valeur du parc étant proposée en correction.
+"""
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .lecture import sonder_export
+from .moteur import ColonnesManquantesError
+from .normalisation import chaines
+
+COLONNE_NUMERO = 'Numéro de compteur'
+# Caractéristiques comparées à l'export lorsqu'elles figurent dans le parc.
+COLONNES_PARC = ('Marque', 'Diametre', 'Type Compteur')
+EXTENSIONS_SQLITE = ('.db', '.sqlite', '.sqlite3')
+TABLE_DEFAUT = 'compteurs'
+
+
+def normaliser_numeros(numeros):
+    """Numéros de compteur comparables : sans espaces autour, en majuscules ; '' pour une valeur manquante."""
+    numeros = chaines(pd.Series(numeros)).str.strip().str.upper()
+    return numeros.mask(numeros.isin(['', 'NAN']), '')
+
+def normaliser_textes(valeurs):
+    """
+    Marque ou type comparable : sans espaces autour, en majuscules ; '' pour une valeur manquante.
+    Pour une colonne catégorielle, seules les catégories sont normalisées.
+    """
+    if isinstance(getattr(valeurs, 'dtype', None), pd.CategoricalDtype):
+        codes = valeurs.cat.codes.to_numpy()
+        return np.where(codes >= 0, normaliser_textes(valeurs.cat.categories)[codes], '').astype(object)
+    valeurs = pd.Series(valeurs, dtype=object)
+    return valeurs.where(valeurs.notna(), '').astype(str).str.strip().str.upper().replace('NAN', '').to_numpy(dtype=object)
+
+class ParcCompteurs:
+    """
+    Compteurs du parc indexés par numéro normalisé (un numéro présent plusieurs fois garde sa dernière
+    ligne) et, pour chaque colonne de COLONNES_PARC présente, leurs valeurs dans l'ordre de l'index :
+    texte d'origine (proposé en correction) et forme comparable (majuscules, ou nombre pour le diamètre).
+    """
+    def __init__(self, compteurs):
+        if COLONNE_NUMERO not in compteurs.columns: raise ColonnesManquantesError([COLONNE_NUMERO])
+        numeros = normaliser_numeros(compteurs[COLONNE_NUMERO]).to_numpy(dtype=object)
+        compteurs = compteurs.assign(numero=numeros)[numeros != ''].drop_duplicates('numero', keep='last').reset_index(drop=True)
+        self.index = pd.Index(compteurs['numero'].to_numpy(dtype=object))
+        self.valeurs, self.comparables = {}, {}
+        for col in COLONNES_PARC:
+            if col not in compteurs.columns: continue
+            if col == 'Diametre':
+                self.comparables[col] = pd.to_numeric(compteurs[col], errors='coerce').to_numpy(dtype=float)
+                self.valeurs[col] = pd.Series(self.comparables[col]).map(lambda diametre: '' if np.isnan(diametre) else f'{diametre:g}').to_numpy(dtype=object)
+            else:
+                self.comparables[col] = normaliser_textes(compteurs[col])
+                self.valeurs[col] = compteurs[col].where(compteurs[col].notna(), '').astype(str).str.strip().to_numpy(dtype=object)
+        self.empreinte = hashlib.sha256(pd.util.hash_pandas_object(compteurs, index=False).to_numpy().tobytes()).hexdigest()
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def lire(cls, source, table=TABLE_DEFAUT):
+        """
+        Lit un parc Parquet, SQLite (table `table`) ou CSV (délimiteur et encodage sondés), selon l'extension
+        du chemin `source`. Seule la colonne 'Numéro de compteur' est requise.
+        """
+        extension = Path(source).suffix.lower()
+        if extension == '.parquet': return cls(pd.read_parquet(source))
+        if extension in EXTENSIONS_SQLITE:
+            with sqlite3.connect(f'file:{Path(source).resolve()}?mode=ro', uri=True) as connexion:
+                return cls(pd.read_sql_query(f'SELECT * FROM "{table}"', connexion))
+        sonde = sonder_export(source)
+        return cls(pd.read_csv(source, sep=sonde.delimiteur, encoding=sonde.encodage, dtype=str, keep_default_na=False))
+
+    def positions(self, numeros):
+        """Position de chaque numéro de compteur (normalisé ici) dans le parc : -1 s'il est inconnu, -2 s'il est vide."""
+        normalises = normaliser_numeros(numeros)
+        return np.where(normalises.to_numpy(dtype=object) != '', self.index.get_indexer(normalises), -2)
+
+    def differences(self, colonne, valeurs, positions):
+        """
+        Masque des lignes dont la valeur de `colonne` diffère de celle du parc, pour les compteurs connus
+        (`positions` >= 0) dont le parc renseigne la colonne ; une valeur manquante dans l'export diffère.
+        """
+        connus = positions >= 0
+        differences = np.zeros(len(positions), dtype=bool)
+        if colonne not in self.comparables or not connus.any(): return differences
+        parc = self.comparables[colonne][positions[connus]]
+        if colonne == 'Diametre':
+            export = pd.to_numeric(pd.Series(np.asarray(valeurs)[connus]), errors='coerce').to_numpy(dtype=float)
+            differences[connus] = ~np.isnan(parc) & ~(export == parc)
+        else:
+            export = normaliser_textes(valeurs)[connus]
+            differences[connus] = (parc != '') & (export != parc)
+        return differences
+
+    def corrections(self, colonne, positions, masque, index):
+        """Valeurs du parc pour `colonne` sur les lignes du `masque`, en Series indexée par `index`."""
+        return pd.Series(self.valeurs[colonne][positions[masque]], index=index[masque], dtype=object)
+
+@dataclass(frozen=True, eq=False)
+class ControleParc:
+    """Parc de compteurs auquel l'export est confronté (voir `regles.avec_controle_parc`)."""
+    parc: ParcCompteurs
+
+    @property
+    def empreinte(self): return self.parc.empreinte
@@ -0,0 +1,181 @@
+"""Récapitulatif des anomalies et génération des rapports (Excel, CSV éventuellement compressé, Parquet)."""
+import re
+from pathlib import Path
+
+import pandas as pd
+from pandas.api.types import infer_dtype
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font
+from openpyxl.utils import get_column_letter
+
+try:
+    import xlsxwriter
+except ImportError:  # xlsxwriter est optionnel : openpyxl en mode write_only sert de repli
+    xlsxwriter = None
+
+from .moteur import IndexAnomalies
+from .regles import NOMS_STATISTIQUES, PROFILS
+
+NIVEAU_COMPRESSION = 1  # gzip/zip : un rapport très répétitif se compresse déjà bien au niveau le plus rapide
+FAMILLE_CONTROLES, FAMILLE_STATISTIQUES = 'Contrôles', 'Statistiques'
+
+def famille_anomalie(anomaly_type):
+    """Famille d'un type d'anomalie : contrôle d'une ligne ou entre lignes, ou valeur statistiquement atypique."""
+    return FAMILLE_STATISTIQUES if anomaly_type in NOMS_STATISTIQUES else FAMILLE_CONTROLES
+
+def create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type="radio", index=None, profil=None):
+    """
+    `index` : IndexAnomalies déjà construit sur `anomalies_df` (sinon il est construit ici).
+    Avec des contrôles statistiques (`profil` qui en a, ou anomalies statistiques dans `anomaly_counter`), une
+    colonne « Famille » est ajoutée et les anomalies statistiques sont récapitulées après les contrôles ;
+    sans eux, le récapitulatif garde ses trois colonnes.
+    """
+    if index is None: index = IndexAnomalies(anomalies_df, profil or PROFILS[tab_type])
+    summary_data = [[anomaly_type, count, index.nombre_corrections(anomaly_type)] for anomaly_type, count in anomaly_counter.items()]
+
+    summary_df = pd.DataFrame(summary_data, columns=["Type d'anomalie", "Nombre de cas", "Corrections Proposées"])
+    if not ((profil is not None and profil.regles_statistiques) or any(anomaly_type in NOMS_STATISTIQUES for anomaly_type in anomaly_counter.index)):
+        return summary_df
+    summary_df["Famille"] = summary_df["Type d'anomalie"].map(famille_anomalie)
+    return summary_df.sort_values("Famille", key=lambda familles: familles == FAMILLE_STATISTIQUES, kind='stable', ignore_index=True)
+
+FILL_ANOMALIE = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
+POLICE_ENTETE = Font(bold=True)
+POLICE_LIEN = Font(underline="single", color="0563C1")
+
+def nom_onglet(anomaly_type, created_sheet_names):
+    """Nom d'onglet Excel valide (31 caractères max.) et unique pour un type d'anomalie."""
+    sheet_name = re.sub(r'[\\/?*\[\]:()\'"<>|]', '', anomaly_type).replace(' ', '_').replace('.', '').replace(':', '_').strip(); sheet_name = sheet_name[:31].rstrip('_').strip(); original_sheet_name = sheet_name; s_counter = 1
+    while sheet_name in created_sheet_names: sheet_name = f"{original_sheet_name[:28]}_{s_counter}"; s_counter += 1
+    created_sheet_names.add(sheet_name)
+    return sheet_name
+
+def largeurs_colonnes(df):
+    """Largeur de chaque colonne : plus long texte non vide (en-tête compris) + 2, calculé par colonne sans parcourir les cellules."""
+    largeurs = []
+    for col in df.columns:
+        valeurs = df[col]
+        non_vides = valeurs[valeurs.notna() & ~valeurs.isin(['', 0])]
+        longueur = non_vides.astype(str).str.len().max() if not non_vides.empty else 0
+        largeurs.append(max(len(str(col)), int(longueur)) + 2)
+    return largeurs
+
+def motifs_surlignage(anomalies, colonnes, anomaly_columns_map):
+    """
+    Positions des colonnes à surligner, calculées une fois par valeur distincte de 'Anomalie'.
+    Retour: (code de motif par ligne, liste des motifs)
+    """
+    position = {col: i for i, col in enumerate(colonnes)}
+    codes, uniques = pd.factorize(anomalies)
+    motifs = [sorted({position[col] for anomaly in str(texte).split(' / ') for col in anomaly_columns_map.get(anomaly.strip(), ()) if col in position}) for texte in uniques]
+    return codes, motifs + [[]]  # le code -1 (valeur manquante) pointe sur le motif vide
+
+def ecrire_tableau_openpyxl(ws, df, anomaly_columns_map):
+    """Écrit `df` dans une feuille openpyxl en écriture seule, en-tête en gras et cellules en cause surlignées."""
+    for i, largeur in enumerate(largeurs_colonnes(df), start=1): ws.column_dimensions[get_column_letter(i)].width = largeur
+    entete = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, value=col); cell.font = POLICE_ENTETE; entete.append(cell)
+    ws.append(entete)
+    codes, motifs = motifs_surlignage(df['Anomalie'], list(df.columns), anomaly_columns_map)
+    for code, ligne in zip(codes, df.itertuples(index=False, name=None)):
+        if motifs[code]:
+            ligne = list(ligne)
+            for i in motifs[code]:
+                cell = WriteOnlyCell(ws, value=ligne[i]); cell.fill = FILL_ANOMALIE; ligne[i] = cell
+        ws.append(ligne)
+
+def cellule_lien(ws, valeur, cible):
+    cell = WriteOnlyCell(ws, value=valeur); cell.hyperlink = cible; cell.font = POLICE_LIEN
+    return cell
+
+def _rapport_openpyxl(anomalies_df, summary_df, onglets, anomaly_columns_map, destination):
+    wb = Workbook(write_only=True)
+    ws_summary = wb.create_sheet(title="Récapitulatif")
+    titre = WriteOnlyCell(ws_summary, value="Récapitulatif des anomalies"); titre.font = Font(bold=True, size=16)
+    ws_summary.append([titre]); ws_summary.append([])
+    entete = []
+    for col in summary_df.columns:
+        cell = WriteOnlyCell(ws_summary, value=col); cell.font = POLICE_ENTETE; entete.append(cell)
+    ws_summary.append(entete)
+    for (sheet_name, _), (anomaly_type, *valeurs) in zip(onglets, summary_df.itertuples(index=False, name=None)):
+        ws_summary.append([cellule_lien(ws_summary, anomaly_type, f"#'{sheet_name}'!A1"), *valeurs])
+    ws_summary.append([])
+    ws_summary.append([cellule_lien(ws_summary, "Toutes les anomalies", "#'Toutes_Anomalies'!A1"), len(anomalies_df)])
+
+    ecrire_tableau_openpyxl(wb.create_sheet(title="Toutes_Anomalies"), anomalies_df, anomaly_columns_map)
+    for sheet_name, filtered_df in onglets:
+        ecrire_tableau_openpyxl(wb.create_sheet(title=sheet_name), filtered_df(), anomaly_columns_map)
+    wb.save(destination)
+
+def ecrire_tableau_xlsxwriter(ws, df, anomaly_columns_map, formats):
+    """Écrit `df` dans une feuille xlsxwriter, en-tête en gras et cellules en cause surlignées."""
+    for i, largeur in enumerate(largeurs_colonnes(df)): ws.set_column(i, i, largeur)
+    ws.write_row(0, 0, list(df.columns), formats['entete'])
+    codes, motifs = motifs_surlignage(df['Anomalie'], list(df.columns), anomaly_columns_map)
+    valeurs = df.astype(object).where(df.notna(), None)  # xlsxwriter refuse NaN : les cellules manquantes restent vides
+    for r, (code, ligne) in enumerate(zip(codes, valeurs.itertuples(index=False, name=None)), start=1):
+        ws.write_row(r, 0, ligne)
+        for i in motifs[code]: ws.write(r, i, ligne[i], formats['anomalie'])
+
+def _rapport_xlsxwriter(anomalies_df, summary_df, onglets, anomaly_columns_map, destination):
+    wb = xlsxwriter.Workbook(destination, {'constant_memory': True})
+    formats = {
+        'entete': wb.add_format({'bold': True}), 'titre': wb.add_format({'bold': True, 'font_size': 16}),
+        'lien': wb.add_format({'underline': 1, 'font_color': '#0563C1'}), 'anomalie': wb.add_format({'bg_color': '#FFC7CE', 'pattern': 1}),
+    }
+    ws_summary = wb.add_worksheet("Récapitulatif")
+    ws_summary.write(0, 0, "Récapitulatif des anomalies", formats['titre'])
+    ws_summary.write_row(2, 0, list(summary_df.columns), formats['entete'])
+    row = 3
+    for (sheet_name, _), (anomaly_type, *valeurs) in zip(onglets, summary_df.itertuples(index=False, name=None)):
+        ws_summary.write_url(row, 0, f"internal:'{sheet_name}'!A1", formats['lien'], string=anomaly_type); ws_summary.write_row(row, 1, valeurs); row += 1
+    ws_summary.write_url(row + 1, 0, "internal:'Toutes_Anomalies'!A1", formats['lien'], string="Toutes les anomalies"); ws_summary.write(row + 1, 1, len(anomalies_df))
+
+    ecrire_tableau_xlsxwriter(wb.add_worksheet("Toutes_Anomalies"), anomalies_df, anomaly_columns_map, formats)
+    for sheet_name, filtered_df in onglets:
+        ecrire_tableau_xlsxwriter(wb.add_worksheet(sheet_name), filtered_df(), anomaly_columns_map, formats)
+    wb.close()
+
+def ecrire_rapport_excel(anomalies_df, summary_df, anomaly_columns_map, destination, index=None):
+    """
+    Écrit le rapport xlsx : un onglet récapitulatif avec liens, l'onglet de toutes les anomalies
+    puis un onglet par type d'anomalie, les cellules en cause étant surlignées en rouge.
+    Le classeur est écrit en flux avec xlsxwriter s'il est installé, sinon avec openpyxl en mode
+    `write_only` ; seules les cellules surlignées reçoivent un format.
+    `destination` est un chemin ou un flux binaire ; `index` est l'IndexAnomalies de `anomalies_df`
+    s'il a déjà été construit pour le récapitulatif.
+    """
+    if index is None: index = IndexAnomalies(anomalies_df)
+    created_sheet_names = {"Récapitulatif", "Toutes_Anomalies"}
+    onglets = [
+        (nom_onglet(anomaly_type, created_sheet_names), lambda anomaly_type=anomaly_type: index.lignes(anomalies_df, anomaly_type))
+        for anomaly_type in summary_df["Type d'anomalie"]
+    ]
+    ecrire = _rapport_xlsxwriter if xlsxwriter is not None else _rapport_openpyxl
+    ecrire(anomalies_df, summary_df, onglets, anomaly_columns_map, destination)
+
+def ecrire_rapport_csv(anomalies_df, destination, sep=',', compression='infer'):
+    """
+    Écrit le rapport en CSV UTF-8 dans `destination` (chemin ou flux binaire), par blocs de lignes : le
+    texte complet n'est jamais construit en mémoire. `compression` : 'gzip', 'zip' ou None ; par défaut,
+    déduite de l'extension d'un chemin (.gz, .zip), aucune pour un flux.
+    """
+    chemin = Path(destination) if isinstance(destination, (str, Path)) else None
+    if compression == 'infer': compression = {'.gz': 'gzip', '.zip': 'zip'}.get(chemin.suffix.lower()) if chemin is not None else None
+    if compression is not None:
+        compression = {'method': compression, 'compresslevel': NIVEAU_COMPRESSION}
+        if compression['method'] == 'zip': compression['archive_name'] = chemin.stem if chemin is not None else 'anomalies.csv'
+    anomalies_df.to_csv(destination, index=False, sep=sep, encoding='utf-8', compression=compression)
+
+def ecrire_rapport_parquet(anomalies_df, destination):
+    """
+    Écrit le rapport en Parquet (compression zstd) dans `destination` (chemin ou flux binaire). Une colonne
+    objet mêlant textes et nombres (valeur d'origine d'une colonne lue en texte, par exemple) est écrite en texte.
+    """
+    df = anomalies_df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype == object and infer_dtype(df[col], skipna=True) not in ('string', 'empty', 'integer', 'floating', 'mixed-integer-float', 'boolean'):
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
+    df.to_parquet(destination, index=False, compression='zstd')
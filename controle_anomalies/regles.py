@@ -0,0 +1,222 @@
+"""Catalogue des règles et profils de contrôle (Radiorelève, Télérelève, Manuelle)."""
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from .moteur import Profil, Regle, RegleDoublons, RegleStatistique, empreintes_textes, executer_controles
+from .normalisation import chaines
+from .statistiques import ControleStatistique, annees_concentrees, coordonnees_eloignees, types_surrepresentes
+
+FP2E_LIBELLES_RADIO = {'annee': 'L\'année de millésime n\'est pas conforme', 'diametre': 'Le diamètre n\'est pas conforme'}
+FP2E_LIBELLES_TELE = {'format': 'Format de compteur non FP2E', 'annee': 'Année millésime non conforme FP2E', 'diametre': 'Diamètre non conforme FP2E'}
+
+def _gps_invalides(c):
+    lat, lon = c.df['Latitude'], c.df['Longitude']
+    return ((lat == 0) | (~lat.between(-90, 90))) | ((lon == 0) | (~lon.between(-180, 180)))
+
+def _kamstrup_tete_renseignee(c):
+    return c.est_kamstrup & (~c.tete.isin(['', 'nan']))
+
+REGLES_GPS = (
+    Regle('Coordonnées GPS non numériques', lambda c: c.df['Latitude'].isnull() | c.df['Longitude'].isnull(), ('Latitude', 'Longitude')),
+    Regle('Coordonnées GPS invalides', _gps_invalides, ('Latitude', 'Longitude')),
+)
+
+def _identifiant(serie):
+    """Identifiant comparable d'une ligne à l'autre (sans espaces, en majuscules), NaN s'il est vide."""
+    cle = chaines(serie).str.strip().str.upper()
+    return cle.mask(cle.isin(['', 'NAN']))
+
+def _position_gps(c):
+    """Coordonnées valides arrondies au micro-degré (les coordonnées invalides ont leur propre anomalie)."""
+    valides = ~_gps_invalides(c)
+    return pd.DataFrame({'Latitude': c.df['Latitude'].round(6).where(valides), 'Longitude': c.df['Longitude'].round(6).where(valides)})
+
+DOUBLON_COMPTEUR = RegleDoublons('Numéro de compteur en doublon', lambda c: _identifiant(c.compteur), ('Numéro de compteur',), 'Groupe doublon compteur')
+DOUBLON_TETE = RegleDoublons('Numéro de tête en doublon', lambda c: _identifiant(c.tete), ('Numéro de tête',), 'Groupe doublon tête')
+DOUBLON_GPS = RegleDoublons('Compteurs aux mêmes coordonnées GPS', _position_gps, ('Latitude', 'Longitude'), 'Groupe doublon GPS')
+
+REGLES_DONNEES_MANQUANTES = (
+    Regle('Marque manquante', lambda c: c.df['Marque'].isin(['', 'nan']), ('Marque',)),
+    Regle('Numéro de compteur manquant', lambda c: c.df['Numéro de compteur'].isin(['', 'nan']), ('Numéro de compteur',)),
+    Regle('Diamètre manquant', lambda c: c.df['Diametre'].isnull(), ('Diametre',)),
+)
+
+REGLES_KAMSTRUP = (
+    Regle('KAMSTRUP: Compteur ≠ 8 caractères', lambda c: c.est_kamstrup & (c.compteur.str.len() != 8), ('Numéro de compteur',)),
+    Regle('KAMSTRUP: Compteur ≠ Tête', lambda c: _kamstrup_tete_renseignee(c) & (c.compteur != c.tete), ('Numéro de compteur', 'Numéro de tête')),
+    Regle('KAMSTRUP: Compteur ou Tête non numérique', lambda c: _kamstrup_tete_renseignee(c) & (~c.compteur.str.isdigit() | ~c.tete.str.isdigit()), ('Numéro de compteur', 'Numéro de tête')),
+)
+
+REGLES_COHERENCE_SAPPEL = (
+    Regle('SAPPEL: Incohérence Marque/Compteur (C)', lambda c: c.est_sappel & c.compteur.str.startswith('C') & (c.marque != 'SAPPEL (C)'), ('Marque',), ('Correction Marque', 'SAPPEL (C)')),
+    Regle('SAPPEL: Incohérence Marque/Compteur (H)', lambda c: c.est_sappel & c.compteur.str.startswith('H') & (c.marque != 'SAPPEL (H)'), ('Marque',), ('Correction Marque', 'SAPPEL (H)')),
+)
+
+REGLES_TYPE_COMPTEUR = (
+    Regle('Incohérence Type Compteur', lambda c: c.type_compteur_verifiable & c.est_sappel & (c.df['Type Compteur'] != c.type_attendu_sappel), ('Type Compteur',), ('Correction Type Compteur', lambda c: c.type_attendu_sappel)),
+    Regle('Incohérence Type Compteur', lambda c: c.type_compteur_verifiable & c.est_itron & (c.df['Type Compteur'] != c.type_attendu_itron), ('Type Compteur',), ('Correction Type Compteur', lambda c: c.type_attendu_itron)),
+)
+
+def regles_fp2e(libelles):
+    """Règles FP2E (format éventuel, millésime, diamètre) appliquées aux lignes retenues par `Profil.selection_fp2e`."""
+    regles = ()
+    if 'format' in libelles:
+        regles += (Regle(libelles['format'], lambda c: c.fp2e.format_invalide, ('Numéro de compteur',)),)
+    return regles + (
+        Regle(libelles['annee'], lambda c: c.fp2e.annee_non_conforme, ('Année de fabrication',), ('Correction Année', lambda c: c.fp2e.correction_annee)),
+        Regle(libelles['diametre'], lambda c: c.fp2e.diametre_non_conforme, ('Diametre',), ('Correction Diamètre', lambda c: c.fp2e.correction_diametre)),
+    )
+
+PROFIL_RADIO = Profil(
+    nom='radio',
+    colonnes_requises=('Protocole Radio', 'Marque', 'Numéro de tête', 'Numéro de compteur', 'Latitude', 'Longitude', 'Commune', 'Année de fabrication', 'Diametre', 'Mode de relève', 'Type Compteur'),
+    colonnes_texte=('Numéro de compteur', 'Numéro de tête', 'Marque', 'Protocole Radio', 'Mode de relève', 'Type Compteur'),
+    corrections=('Correction Année', 'Correction Diamètre', 'Correction Type Compteur', 'Correction Marque', 'Correction Numéro de Tête', 'Correction Protocole Radio'),
+    marques_sappel=('SAPPEL (C)', 'SAPPEL (H)'),
+    selection_fp2e=lambda c: (c.est_sappel & ~c.est_manuelle) | (c.est_manuelle & c.format_fp2e),
+    regles=(
+        Regle('KAMSTRUP: Protocole ≠ WMS', lambda c: c.est_kamstrup & (c.protocole != 'WMS'), ('Protocole Radio',), ('Correction Protocole Radio', 'WMS')),
+        Regle('SAPPEL: Protocole ≠ WMS (année <= 22)', lambda c: c.est_sappel & (c.annee_num <= 22) & (c.protocole != 'WMS'), ('Protocole Radio',), ('Correction Protocole Radio', 'WMS')),
+        Regle('SAPPEL: Protocole ≠ OMS (année > 22)', lambda c: c.est_sappel & (c.annee_num > 22) & (c.protocole != 'OMS'), ('Protocole Radio',), ('Correction Protocole Radio', 'OMS')),
+        *REGLES_DONNEES_MANQUANTES,
+        Regle('Année de fabrication manquante', lambda c: c.df['Année de fabrication'].isnull(), ('Année de fabrication',)),
+        Regle('Numéro de tête manquant', lambda c: c.tete_manquante & (~c.est_sappel | (c.annee_num >= 22)) & ~c.est_manuelle & ~c.est_kamstrup, ('Numéro de tête',)),
+        Regle('Numéro de tête manquant', lambda c: c.tete_manquante & c.est_kamstrup & c.compteur.str.match(r'^\d{8}$'), ('Numéro de tête',), ('Correction Numéro de Tête', lambda c: c.compteur)),
+        *REGLES_GPS,
+        *REGLES_KAMSTRUP,
+        Regle('KAMSTRUP: Diamètre hors plage', lambda c: c.est_kamstrup & (~c.df['Diametre'].between(15, 80)), ('Diametre',)),
+        Regle('SAPPEL: Tête DME ≠ 15 caractères', lambda c: c.est_sappel & c.tete.str.upper().str.startswith('DME') & (c.tete.str.len() != 15), ('Numéro de tête',)),
+        Regle('SAPPEL: Compteur ne commence pas par C ou H', lambda c: c.est_sappel & ~c.est_manuelle & ~c.compteur.str.startswith(('C', 'H')), ('Numéro de compteur',)),
+        *REGLES_COHERENCE_SAPPEL,
+        Regle('ITRON: Compteur ne commence pas par I ou D', lambda c: c.est_itron & ~c.est_manuelle & ~c.compteur.str.startswith(('I', 'D')), ('Numéro de compteur',)),
+        *REGLES_TYPE_COMPTEUR,
+        *regles_fp2e(FP2E_LIBELLES_RADIO),
+    ),
+    regles_doublons=(DOUBLON_COMPTEUR, DOUBLON_TETE, DOUBLON_GPS),
+)
+
+def _traite_lra(c):
+    return c.df['Traité'].str.startswith(('903', '863'), na=False)
+
+PROFIL_TELE = Profil(
+    nom='tele',
+    colonnes_requises=('Protocole Radio', 'Marque', 'Numéro de compteur', 'Numéro de tête', 'Latitude', 'Longitude', 'Année de fabrication', 'Diametre', 'Traité', 'Mode de relève', 'Type Compteur'),
+    colonnes_texte=('Numéro de compteur', 'Numéro de tête', 'Marque', 'Protocole Radio', 'Traité', 'Mode de relève', 'Type Compteur'),
+    corrections=('Correction Année', 'Correction Diamètre', 'Correction Type Compteur', 'Correction Marque', 'Correction Numéro de Tête', 'Correction Protocole Radio'),
+    marques_sappel=('SAPPEL (C)', 'SAPPEL (H)', 'SAPPEL(C)'),
+    selection_fp2e=lambda c: ((c.est_sappel | c.est_itron) & ~c.est_manuelle) | (c.est_manuelle & c.format_fp2e),
+    regles=(
+        Regle('Protocole incorrect (devrait être LRA)', lambda c: ~c.est_manuelle & _traite_lra(c) & (c.protocole != 'LRA'), ('Protocole Radio',), ('Correction Protocole Radio', 'LRA')),
+        Regle('Protocole incorrect (devrait être SGX)', lambda c: ~c.est_manuelle & ~_traite_lra(c) & (c.protocole != 'SGX'), ('Protocole Radio',), ('Correction Protocole Radio', 'SGX')),
+        *REGLES_DONNEES_MANQUANTES,
+        Regle('Année de fabrication manquante', lambda c: c.annee_num.isnull(), ('Année de fabrication',)),
+        Regle('Numéro de tête manquant', lambda c: c.tete_manquante & ~c.est_kamstrup & ~c.est_kaifa & ~c.est_manuelle, ('Numéro de tête',)),
+        *REGLES_GPS,
+        *REGLES_KAMSTRUP,
+        Regle('KAMSTRUP: Diamètre hors de la plage [15, 80]', lambda c: c.est_kamstrup & (~c.df['Diametre'].between(15, 80)), ('Diametre',)),
+        Regle('SAPPEL: Tête ≠ 16 caractères', lambda c: c.est_sappel & ~c.tete_manquante & (c.tete.str.len() != 16), ('Numéro de tête',)),
+        *REGLES_COHERENCE_SAPPEL,
+        Regle('ITRON: Tête ≠ 8 caractères', lambda c: c.est_itron & ~c.tete_manquante & (c.tete.str.len() != 8), ('Numéro de tête',)),
+        *REGLES_TYPE_COMPTEUR,
+        *regles_fp2e(FP2E_LIBELLES_TELE),
+        Regle('ITRON manuel: doit commencer par "I" ou "D"', lambda c: c.est_manuelle & c.est_itron & c.format_fp2e & ~c.compteur.str.upper().str.startswith(('I', 'D')), ('Numéro de compteur',)),
+        Regle('SAPPEL manuel: doit commencer par "C" ou "H"', lambda c: c.est_manuelle & c.est_sappel & c.format_fp2e & ~c.compteur.str.upper().str.startswith(('C', 'H')), ('Numéro de compteur',)),
+    ),
+    regles_doublons=(DOUBLON_COMPTEUR, DOUBLON_TETE, DOUBLON_GPS),
+)
+
+PROFIL_MANUELLE = Profil(
+    nom='manuelle',
+    colonnes_requises=('Latitude', 'Longitude', 'Numéro de compteur', 'Marque', 'Année de fabrication', 'Diametre', 'Type Compteur'),
+    colonnes_texte=(),
+    corrections=('Correction Année', 'Correction Diamètre', 'Correction Marque', 'Correction Type Compteur'),
+    marques_sappel=('SAPPEL (C)', 'SAPPEL (H)'),
+    selection_fp2e=lambda c: c.format_fp2e,
+    dtype_lecture={'Numéro de branchement': str, 'Abonnement': str},
+    regles=(
+        *REGLES_GPS,
+        Regle('Compteur non-FP2E pour SAPPEL/ITRON', lambda c: (c.est_sappel | c.est_itron) & ~c.format_fp2e, ('Numéro de compteur',)),
+        Regle('SAPPEL: Incohérence Marque/Compteur (C)', lambda c: c.format_fp2e & c.compteur.str.startswith('C') & (c.marque != 'SAPPEL (C)'), ('Marque',), ('Correction Marque', 'SAPPEL (C)')),
+        Regle('SAPPEL: Incohérence Marque/Compteur (H)', lambda c: c.format_fp2e & c.compteur.str.startswith('H') & (c.marque != 'SAPPEL (H)'), ('Marque',), ('Correction Marque', 'SAPPEL (H)')),
+        Regle('ITRON: Incohérence Marque/Compteur', lambda c: c.format_fp2e & c.compteur.str.startswith(('I', 'D')) & (c.marque != 'ITRON'), ('Marque',), ('Correction Marque', 'ITRON')),
+        *regles_fp2e(FP2E_LIBELLES_RADIO),
+        Regle('Incohérence Type Compteur', lambda c: c.format_fp2e & c.compteur.str.startswith(('C', 'H')) & (c.df['Type Compteur'] != c.type_attendu_sappel), ('Type Compteur',), ('Correction Type Compteur', lambda c: c.type_attendu_sappel)),
+        Regle('Incohérence Type Compteur', lambda c: c.format_fp2e & c.compteur.str.startswith(('I', 'D')) & (c.df['Type Compteur'] != c.type_attendu_itron), ('Type Compteur',), ('Correction Type Compteur', lambda c: c.type_attendu_itron)),
+    ),
+    regles_doublons=(DOUBLON_COMPTEUR, DOUBLON_GPS),
+)
+
+PROFILS = {profil.nom: profil for profil in (PROFIL_RADIO, PROFIL_TELE, PROFIL_MANUELLE)}
+
+REGLES_GEO = (
+    Regle('Coordonnées GPS inversées', lambda c: c.geo.inversees, ('Latitude', 'Longitude')),
+    Regle('Coordonnées GPS éloignées de la commune', lambda c: c.geo.eloignees, ('Latitude', 'Longitude', 'Commune'), ('Correction Commune', lambda c: c.geo.commune_proche)),
+)
+
+def avec_controle_geo(profil, controle):
+    """
+    Profil complété par les règles géographiques de `controle` (geo.ControleGeo) : la commune devient
+    requise et la commune la plus proche est proposée dans 'Correction Commune'.
+    """
+    return replace(
+        profil, geo=controle, regles=profil.regles + REGLES_GEO, corrections=profil.corrections + ('Correction Commune',),
+        colonnes_requises=profil.colonnes_requises + (() if 'Commune' in profil.colonnes_requises else ('Commune',)),
+    )
+
+REGLES_PARC = (
+    Regle('Compteur absent du parc', lambda c: c.parc.absents, ('Numéro de compteur',)),
+    Regle('Marque différente du parc', lambda c: c.parc.marque, ('Marque',), ('Correction Marque', lambda c: c.parc.correction_marque)),
+    Regle('Diamètre différent du parc', lambda c: c.parc.diametre, ('Diametre',), ('Correction Diamètre', lambda c: c.parc.correction_diametre)),
+    Regle('Type Compteur différent du parc', lambda c: c.parc.type_compteur, ('Type Compteur',), ('Correction Type Compteur', lambda c: c.parc.correction_type_compteur)),
+)
+
+def avec_controle_parc(profil, controle):
+    """
+    Profil complété par le rapprochement avec le parc de compteurs de `controle` (parc.ControleParc) :
+    la marque, le diamètre et le type du parc sont proposés dans les colonnes de correction existantes.
+    """
+    corrections = tuple(col for col in ('Correction Marque', 'Correction Diamètre', 'Correction Type Compteur') if col not in profil.corrections)
+    return replace(profil, parc=controle, regles=profil.regles + REGLES_PARC, corrections=profil.corrections + corrections)
+
+REGLES_STATISTIQUES = (
+    RegleStatistique(
+        'STATISTIQUE: Année de fabrication surreprésentée (Marque × Commune)',
+        lambda c: {'groupe': c.empreinte_marque_commune, 'annee': c.annee_num.to_numpy(dtype=float, na_value=np.nan)},
+        annees_concentrees, ('Marque', 'Commune', 'Année de fabrication'),
+    ),
+    RegleStatistique(
+        'STATISTIQUE: Type Compteur surreprésenté (Marque × Commune)',
+        lambda c: {'groupe': c.empreinte_marque_commune, 'marque': c.empreinte_marque, 'type': empreintes_textes(c.df['Type Compteur'])},
+        types_surrepresentes, ('Marque', 'Commune', 'Type Compteur'),
+    ),
+    RegleStatistique(
+        'STATISTIQUE: Coordonnées GPS éloignées du centre de la commune',
+        lambda c: {'commune': c.empreinte_commune, **{col.lower(): c.df[col].where(~_gps_invalides(c)).to_numpy(dtype=float) for col in ('Latitude', 'Longitude')}},
+        coordonnees_eloignees, ('Latitude', 'Longitude', 'Commune'),
+    ),
+)
+NOMS_STATISTIQUES = tuple(regle.nom for regle in REGLES_STATISTIQUES)
+
+def avec_controle_statistique(profil, controle=ControleStatistique()):
+    """
+    Profil complété par les règles statistiques (seuils de `controle`, statistiques.ControleStatistique),
+    appliquées sur tout le fichier après les règles entre lignes : la commune devient requise.
+    """
+    return replace(
+        profil, statistique=controle, regles_statistiques=REGLES_STATISTIQUES,
+        colonnes_requises=profil.colonnes_requises + (() if 'Commune' in profil.colonnes_requises else ('Commune',)),
+    )
+
+
+def check_data_radio(df):
+    """Vérifie les données du DataFrame pour détecter les anomalies."""
+    return executer_controles(df, PROFIL_RADIO)
+
+def check_data_tele(df):
+    return executer_controles(df, PROFIL_TELE)
+
+def check_data_manuelle(df):
+    """Vérifie les données du DataFrame pour l'onglet Manuelle."""
+    return executer_controles(df, PROFIL_MANUELLE)
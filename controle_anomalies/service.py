@@ -0,0 +1,319 @@
+"""
+Service HTTP local des contrôles, sans Streamlit ni dépendance supplémentaire (bibliothèque standard) :
+un processus chaud garde les profils, leurs tables de règles et les référentiels (communes, parc de
+compteurs) chargés une fois pour toutes.
+
+    python -m controle_anomalies.service --port 8080 --communes communes.csv
+
+    GET  /sante                          état du service et profils disponibles
+    POST /controler/<profil>             enregistrements JSON : {"lignes": [{colonne: valeur}, ...]} ou un objet seul
+    POST /travaux/<profil>               export complet (multipart/form-data, champ 'fichier', ou corps brut
+                                         avec ?nom=export.csv) : contrôle en tâche de fond, réponse 202
+    GET  /travaux/<id>                   état et avancement d'un travail, récapitulatif une fois terminé
+    GET  /travaux/<id>/rapport?format=   rapport d'un travail terminé (csv, csv.gz, parquet ou xlsx)
+
+Les petites demandes d'un même profil arrivées à quelques millisecondes d'intervalle sont regroupées en
+un seul appel vectorisé de `executer_controles` (micro-lots) : le coût fixe d'un contrôle est partagé.
+Les règles entre lignes et statistiques, qui portent sur tout un fichier, ne s'appliquent qu'aux travaux.
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import replace
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from .cache import empreinte
+from .geo import SEUIL_KM_DEFAUT, ControleGeo, ReferentielCommunes
+from .lecture import lire_export, sonder_export
+from .moteur import CORRECTIONS_SOURCES, ColonnesManquantesError, IndexAnomalies, colonnes_par_anomalie, executer_controles
+from .parallele import executer_controles_parallele
+from .parc import TABLE_DEFAUT, ControleParc, ParcCompteurs
+from .rapport import create_summary_with_corrections, ecrire_rapport_csv, ecrire_rapport_excel, ecrire_rapport_parquet
+from .regles import PROFILS, avec_controle_geo, avec_controle_parc, avec_controle_statistique
+from .statistiques import SEUIL_Z_DEFAUT, ControleStatistique
+from .travaux import GestionnaireTravaux
+
+HOTE_DEFAUT, PORT_DEFAUT = '127.0.0.1', 8080
+DELAI_LOT = 0.002  # attente maximale, après la première demande d'un lot, des demandes suivantes (secondes)
+LIGNES_MAX_LOT = 5_000
+LIGNES_MAX_DEMANDE = 10_000  # au-delà, un export passe par /travaux
+TAILLE_MAX_CORPS = 1024 ** 3
+FILE_CONNEXIONS = 128  # connexions en attente d'acceptation (listen backlog)
+TYPES_RAPPORT = {
+    'csv': 'text/csv; charset=utf-8', 'csv.gz': 'application/gzip', 'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ErreurDemande(Exception):
+    """Demande refusée : statut HTTP et message renvoyés au client."""
+    def __init__(self, statut, message, **details):
+        super().__init__(message)
+        self.statut, self.details = statut, details
+
+def profil_par_ligne(profil):
+    """Profil réduit aux règles par ligne : le résultat d'une ligne ne dépend pas des autres lignes du lot."""
+    return replace(profil, regles_doublons=(), regles_statistiques=(), statistique=None)
+
+def lignes_en_dataframe(lignes, profil):
+    """
+    DataFrame d'enregistrements JSON typé comme une lecture d'export : valeur nulle ou vide manquante (NaN),
+    valeurs en texte dans les colonnes lues en texte par le profil (`dtype_lecture`). Converties en Python :
+    pour les quelques lignes d'une demande, c'est bien plus rapide qu'une conversion pandas colonne par colonne.
+    """
+    textes = None if profil.dtype_lecture is str else set(profil.dtype_lecture)
+    convertir = lambda col, valeur: np.nan if valeur is None or valeur == '' else str(valeur) if textes is None or col in textes else valeur
+    return pd.DataFrame.from_records([{col: convertir(col, valeur) for col, valeur in ligne.items()} for ligne in lignes])
+
+def resultats_par_ligne(anomalies_df, profil, nombre):
+    """Types d'anomalie et corrections proposées ({colonne source: valeur}) de chacune des `nombre` lignes contrôlées."""
+    resultats = [{'ligne': ligne, 'anomalies': [], 'corrections': {}} for ligne in range(nombre)]
+    corrections = [col for col in profil.corrections if col in anomalies_df.columns]
+    for ligne, texte, *valeurs in anomalies_df[['Index original', 'Anomalie', *corrections]].itertuples(index=False, name=None):
+        resultats[ligne]['anomalies'] = [libelle for libelle in str(texte).split(' / ') if libelle]
+        resultats[ligne]['corrections'] = {CORRECTIONS_SOURCES[col]: str(valeur) for col, valeur in zip(corrections, valeurs) if pd.notna(valeur) and valeur != ''}
+    return resultats
+
+class MicroLots:
+    """
+    File des demandes de contrôle d'un profil. Un fil d'exécution dédié prend la première demande en
+    attente, y ajoute celles qui arrivent dans les `delai` secondes suivantes (jusqu'à `lignes_max` lignes),
+    contrôle le lot en un seul appel et rend à chaque demande ses propres lignes, renumérotées depuis 0.
+    """
+    def __init__(self, profil, delai=DELAI_LOT, lignes_max=LIGNES_MAX_LOT):
+        self.profil = profil_par_ligne(profil)
+        self.delai, self.lignes_max = delai, lignes_max
+        self.file = queue.Queue()
+        self.lots = 0  # lots contrôlés, pour la supervision
+        threading.Thread(target=self._boucle, name=f'lots_{profil.nom}', daemon=True).start()
+
+    def controler(self, df):
+        """Ajoute `df` au prochain lot. Retour: Future du rapport de ses lignes ('Index original' = position dans `df`)"""
+        futur = Future(); self.file.put((df, futur))
+        return futur
+
+    def _boucle(self):
+        while True:
+            lot = [self.file.get()]; lignes = len(lot[0][0]); limite = time.perf_counter() + self.delai
+            while lignes < self.lignes_max:
+                try:
+                    demande = self.file.get(timeout=max(limite - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                lot.append(demande); lignes += len(demande[0])
+            self._traiter(lot)
+
+    def _traiter(self, lot):
+        bornes = np.cumsum([0] + [len(df) for df, _ in lot])
+        try:
+            anomalies_df, _ = executer_controles(pd.concat([df for df, _ in lot], ignore_index=True), self.profil)
+        except Exception as erreur:  # transmise à chaque demande du lot, le fil d'exécution continue
+            for _, futur in lot: futur.set_exception(erreur)
+            return
+        self.lots += 1
+        positions = np.searchsorted(anomalies_df['Index original'].to_numpy(), bornes)
+        for (_, futur), debut, fin, borne in zip(lot, positions[:-1], positions[1:], bornes):
+            lignes = anomalies_df.iloc[debut:fin].copy(); lignes['Index original'] -= borne
+            futur.set_result(lignes)
+
+class ServiceControles:
+    """
+    État partagé par toutes les requêtes : profils complétés des référentiels, micro-lots par profil et
+    travaux en tâche de fond (contrôles d'exports complets, dédoublonnés par empreinte du fichier).
+    """
+    def __init__(self, geo=None, parc=None, statistique=None, fils=None):
+        self.profils = {}
+        for nom, profil in PROFILS.items():
+            profil = profil if geo is None else avec_controle_geo(profil, geo)
+            profil = profil if parc is None else avec_controle_parc(profil, parc)
+            self.profils[nom] = profil if statistique is None else avec_controle_statistique(profil, statistique)
+        self.lots = {nom: MicroLots(profil) for nom, profil in self.profils.items()}
+        self.travaux = GestionnaireTravaux(fils)
+        self.debut = time.time()
+
+    def profil(self, nom):
+        if nom not in self.profils: raise ErreurDemande(HTTPStatus.NOT_FOUND, f"Profil inconnu : {nom}", profils=sorted(self.profils))
+        return self.profils[nom]
+
+    def sante(self):
+        return {
+            'statut': 'ok', 'profils': sorted(self.profils), 'depuis_s': round(time.time() - self.debut, 1),
+            'lots': {nom: lots.lots for nom, lots in self.lots.items()}, 'travaux_en_cours': len(self.travaux.en_cours()),
+            'references': {nom: controle is not None for nom, controle in (('geo', self.profils['radio'].geo), ('parc', self.profils['radio'].parc), ('statistique', self.profils['radio'].statistique))},
+        }
+
+    def controler(self, nom, donnees):
+        """Contrôle par ligne d'enregistrements JSON (un objet, ou {"lignes": [...]}), par micro-lot."""
+        profil = self.profil(nom)
+        lignes = donnees.get('lignes', [donnees]) if isinstance(donnees, dict) else donnees
+        if not isinstance(lignes, list) or not all(isinstance(ligne, dict) for ligne in lignes):
+            raise ErreurDemande(HTTPStatus.BAD_REQUEST, "Attendu : un objet JSON ou {\"lignes\": [objets]}.")
+        if len(lignes) > LIGNES_MAX_DEMANDE:
+            raise ErreurDemande(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Plus de {LIGNES_MAX_DEMANDE} lignes : soumettre l'export à /travaux/{nom}.")
+        if not lignes: return {'profil': nom, 'lignes': 0, 'lignes_en_anomalie': 0, 'resultats': []}
+        df = lignes_en_dataframe(lignes, profil)
+        missing = [col for col in profil.colonnes_requises if col not in df.columns]
+        if missing: raise ErreurDemande(HTTPStatus.BAD_REQUEST, str(ColonnesManquantesError(missing)), colonnes_manquantes=missing)
+        anomalies_df = self.lots[nom].controler(df).result()
+        resultats = resultats_par_ligne(anomalies_df, profil, len(df))
+        return {'profil': nom, 'lignes': len(df), 'lignes_en_anomalie': sum(bool(r['anomalies'] or r['corrections']) for r in resultats), 'resultats': resultats}
+
+    def soumettre(self, nom, contenu, nom_fichier):
+        """Soumet le contrôle complet d'un export (toutes règles) ; l'export est sondé avant d'être accepté."""
+        profil = self.profil(nom)
+        source = io.BytesIO(contenu); source.name = nom_fichier
+        try:
+            sonde = sonder_export(source, profil)
+        except ColonnesManquantesError as e:
+            raise ErreurDemande(HTTPStatus.BAD_REQUEST, str(e), colonnes_manquantes=e.colonnes)
+        except (ValueError, UnicodeDecodeError, ImportError) as e:
+            raise ErreurDemande(HTTPStatus.BAD_REQUEST, f"Export illisible : {e}")
+
+        def executer(journal):
+            with journal.etape('lecture'): df, _ = lire_export(source, profil, sonde=sonde)
+            anomalies_df, anomaly_counter = executer_controles_parallele(df, profil, journal=journal)
+            index = IndexAnomalies(anomalies_df, profil)
+            return anomalies_df, create_summary_with_corrections(anomalies_df, anomaly_counter, tab_type=profil.nom, index=index, profil=profil), index
+        return self.travaux.soumettre((empreinte(contenu), nom), profil, executer)
+
+    def travail(self, identifiant):
+        travail = self.travaux.obtenir(identifiant)
+        if travail is None: raise ErreurDemande(HTTPStatus.NOT_FOUND, f"Travail inconnu ou oublié : {identifiant}")
+        return travail
+
+    def etat(self, travail):
+        etape, fraction = travail.avancement()
+        etat = {'travail': travail.identifiant, 'profil': travail.profil.nom, 'termine': travail.termine, 'etape': etape, 'avancement': round(fraction, 3), 'duree_s': round(travail.duree(), 3)}
+        if travail.termine and travail.erreur is not None:
+            etat['erreur'] = str(travail.erreur)
+        elif travail.termine:
+            anomalies_df, summary_df, _ = travail.resultat
+            etat.update(lignes_en_anomalie=len(anomalies_df), recapitulatif=summary_df.to_dict('records'), execution=travail.journal.en_dict(), rapport=f'/travaux/{travail.identifiant}/rapport')
+        return etat
+
+    def rapport(self, travail, format_):
+        """Rapport d'un travail terminé. Retour: (contenu, type MIME, nom de fichier)"""
+        if format_ not in TYPES_RAPPORT: raise ErreurDemande(HTTPStatus.BAD_REQUEST, f"Format inconnu : {format_}", formats=list(TYPES_RAPPORT))
+        if not travail.termine: raise ErreurDemande(HTTPStatus.CONFLICT, "Travail en cours : rapport pas encore disponible.")
+        if travail.erreur is not None: raise ErreurDemande(HTTPStatus.CONFLICT, f"Travail en échec : {travail.erreur}")
+        anomalies_df, summary_df, index = travail.resultat; tampon = io.BytesIO()
+        if format_ == 'xlsx': ecrire_rapport_excel(anomalies_df, summary_df, colonnes_par_anomalie(travail.profil), tampon, index=index)
+        elif format_ == 'parquet': ecrire_rapport_parquet(anomalies_df, tampon)
+        else: ecrire_rapport_csv(anomalies_df, tampon, compression='gzip' if format_ == 'csv.gz' else None)
+        return tampon.getvalue(), TYPES_RAPPORT[format_], f'anomalies_{travail.profil.nom}.{format_}'
+
+def fichier_multipart(type_contenu, corps):
+    """(nom, contenu) du fichier d'un corps multipart/form-data : champ 'fichier', à défaut le premier fichier."""
+    message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + type_contenu.encode('latin-1') + b'\r\n\r\n' + corps)
+    fichiers = [partie for partie in message.iter_parts() if partie.get_filename()]
+    if not fichiers: raise ErreurDemande(HTTPStatus.BAD_REQUEST, "Aucun fichier dans le formulaire (champ 'fichier').")
+    partie = next((partie for partie in fichiers if partie.get_param('name', header='content-disposition') == 'fichier'), fichiers[0])
+    return partie.get_filename(), partie.get_payload(decode=True)
+
+class GestionnaireRequetes(BaseHTTPRequestHandler):
+    """Routes du service ; l'état partagé est `self.server.service` (ServiceControles)."""
+    protocol_version = 'HTTP/1.1'  # connexions persistantes : un client enchaîne ses demandes sans renégocier
+    server_version = 'controle-anomalies'
+
+    def _envoyer(self, statut, contenu, type_contenu='application/json; charset=utf-8', entetes=()):
+        self.send_response(statut)
+        self.send_header('Content-Type', type_contenu); self.send_header('Content-Length', str(len(contenu)))
+        for nom, valeur in entetes: self.send_header(nom, valeur)
+        self.end_headers(); self.wfile.write(contenu)
+
+    def _json(self, statut, donnees, entetes=()):
+        self._envoyer(statut, json.dumps(donnees, ensure_ascii=False, default=str).encode('utf-8'), entetes=entetes)
+
+    def _corps(self):
+        taille = int(self.headers.get('Content-Length') or 0)
+        if taille > TAILLE_MAX_CORPS: raise ErreurDemande(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Corps de requête trop volumineux.")
+        return self.rfile.read(taille)
+
+    def _router(self, methode):
+        service, url = self.server.service, urlparse(self.path)
+        parties, options = [partie for partie in url.path.split('/') if partie], parse_qs(url.query)
+        if methode == 'GET' and parties == ['sante']:
+            return self._json(HTTPStatus.OK, service.sante())
+        if methode == 'POST' and len(parties) == 2 and parties[0] == 'controler':
+            try:
+                donnees = json.loads(self._corps() or b'null')
+            except ValueError as e:
+                raise ErreurDemande(HTTPStatus.BAD_REQUEST, f"JSON invalide : {e}")
+            return self._json(HTTPStatus.OK, service.controler(parties[1], donnees))
+        if methode == 'POST' and len(parties) == 2 and parties[0] == 'travaux':
+            corps, type_contenu = self._corps(), self.headers.get('Content-Type', '')
+            nom, contenu = fichier_multipart(type_contenu, corps) if type_contenu.startswith('multipart/form-data') else (options.get('nom', ['export.csv'])[0], corps)
+            travail = service.soumettre(parties[1], contenu, nom)
+            return self._json(HTTPStatus.ACCEPTED, service.etat(travail), entetes=[('Location', f'/travaux/{travail.identifiant}')])
+        if methode == 'GET' and len(parties) == 2 and parties[0] == 'travaux':
+            return self._json(HTTPStatus.OK, service.etat(service.travail(parties[1])))
+        if methode == 'GET' and len(parties) == 3 and parties[0] == 'travaux' and parties[2] == 'rapport':
+            contenu, type_contenu, nom = service.rapport(service.travail(parties[1]), options.get('format', ['csv'])[0])
+            return self._envoyer(HTTPStatus.OK, contenu, type_contenu, entetes=[('Content-Disposition', f'attachment; filename="{nom}"')])
+        raise ErreurDemande(HTTPStatus.NOT_FOUND, f"Route inconnue : {methode} {url.path}")
+
+    def _traiter(self, methode):
+        try:
+            self._router(methode)
+        except ErreurDemande as e:
+            self._json(e.statut, {'erreur': str(e), **e.details})
+        except Exception as e:  # erreur inattendue : le service reste disponible pour les autres requêtes
+            self.log_error("%s %s : %r", methode, self.path, e)
+            self._json(HTTPStatus.INTERNAL_SERVER_ERROR, {'erreur': f"{type(e).__name__} : {e}"})
+
+    def do_GET(self): self._traiter('GET')
+    def do_POST(self): self._traiter('POST')
+
+class ServeurControles(ThreadingHTTPServer):
+    """ThreadingHTTPServer dont la file d'attente des connexions absorbe les rafales de petites demandes à regrouper."""
+    request_queue_size = FILE_CONNEXIONS  # 5 par défaut : au-delà, les connexions simultanées sont refusées
+    daemon_threads = True
+
+def creer_serveur(service, hote=HOTE_DEFAUT, port=PORT_DEFAUT):
+    """Serveur HTTP multi-fils (un fil par connexion) du `service` ; `port=0` choisit un port libre."""
+    serveur = ServeurControles((hote, port), GestionnaireRequetes)
+    serveur.service = service
+    return serveur
+
+def construire_parser():
+    parser = argparse.ArgumentParser(prog='controle-anomalies-service', description="Service HTTP local des contrôles (JSON et envoi d'exports).")
+    parser.add_argument('--hote', default=HOTE_DEFAUT, help=f"Adresse d'écoute (défaut : {HOTE_DEFAUT}, accessible de ce poste seulement).")
+    parser.add_argument('--port', type=int, default=PORT_DEFAUT, help=f"Port d'écoute (défaut : {PORT_DEFAUT}).")
+    parser.add_argument('--fils', type=int, default=None, help="Travaux exécutés simultanément (défaut : nombre de cœurs).")
+    parser.add_argument('--communes', metavar='FICHIER', help="Référentiel des communes : active le contrôle géographique.")
+    parser.add_argument('--seuil-km', type=float, default=SEUIL_KM_DEFAUT, help=f"Avec --communes, distance maximale tolérée à la commune (défaut : {SEUIL_KM_DEFAUT:g} km).")
+    parser.add_argument('--parc', metavar='FICHIER', help="Parc de compteurs (CSV, Parquet ou base SQLite) : active le rapprochement avec le parc.")
+    parser.add_argument('--table-parc', default=TABLE_DEFAUT, metavar='TABLE', help=f"Avec --parc sur une base SQLite, table des compteurs (défaut : {TABLE_DEFAUT}).")
+    parser.add_argument('--statistiques', action='store_true', help="Active les contrôles statistiques pour les travaux (exports complets).")
+    parser.add_argument('--seuil-z', type=float, default=SEUIL_Z_DEFAUT, help=f"Avec --statistiques, score z robuste minimal (défaut : {SEUIL_Z_DEFAUT:g}).")
+    return parser
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    # Référentiels chargés une fois au démarrage : chaque requête les trouve indexés
+    geo = ControleGeo(ReferentielCommunes.lire(args.communes), args.seuil_km) if args.communes else None
+    parc = ControleParc(ParcCompteurs.lire(args.parc, args.table_parc)) if args.parc else None
+    statistique = ControleStatistique(seuil_z=args.seuil_z) if args.statistiques else None
+    serveur = creer_serveur(ServiceControles(geo, parc, statistique, args.fils), args.hote, args.port)
+    print(f"Service de contrôle à l'écoute sur http://{args.hote}:{serveur.server_address[1]}")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
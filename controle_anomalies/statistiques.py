@@ -0,0 +1,119 @@
+"""
+Contrôles statistiques : valeurs atypiques d'une population plutôt que d'une ligne. Les distributions
+sont agrégées par groupe (Marque × Commune, ou commune pour les coordonnées) en une passe de factorisation
+et de décompte, puis chaque groupe est comparé à ses pairs par un score z robuste (médiane et écart absolu
+médian), insensible aux valeurs extrêmes qu'il doit justement repérer. Les règles (voir
+`regles.avec_controle_statistique`) forment une famille d'anomalies distincte dans le récapitulatif.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .geo import distance_km
+
+SEUIL_Z_DEFAUT = 3.5  # seuil usuel d'Iglewicz et Hoaglin pour le score z modifié
+EFFECTIF_MIN_DEFAUT = 30
+PART_MIN_DEFAUT = 0.25
+DISTANCE_MIN_KM_DEFAUT = 2.0
+GROUPES_MIN = 5  # en dessous, la médiane des pairs n'est pas une référence
+FACTEUR_MAD = 0.6745  # quantile 75 % de la loi normale : MAD / 0.6745 estime l'écart type
+FACTEUR_ECART_MOYEN = 1.2533  # sqrt(pi / 2) : repli sur l'écart absolu moyen quand la MAD est nulle
+
+
+@dataclass(frozen=True)
+class ControleStatistique:
+    """
+    Seuils des règles statistiques : score z robuste minimal, effectif minimal d'un groupe comparé,
+    part minimale du groupe portée par la valeur atypique (année, type) et distance minimale au centre
+    de la commune pour des coordonnées.
+    """
+    seuil_z: float = SEUIL_Z_DEFAUT
+    effectif_min: int = EFFECTIF_MIN_DEFAUT
+    part_min: float = PART_MIN_DEFAUT
+    distance_min_km: float = DISTANCE_MIN_KM_DEFAUT
+
+def scores_robustes(valeurs, groupes=None):
+    """
+    Score z robuste 0.6745 × (x − médiane) / MAD de chaque valeur, par colonne d'une matrice ou, avec
+    `groupes` (codes 0..n-1), au sein de chaque groupe. Une MAD nulle est remplacée par l'écart absolu
+    moyen ; un groupe sans dispersion donne des scores nuls.
+    """
+    if groupes is None:
+        mediane = np.median(valeurs, axis=0); ecarts = np.abs(valeurs - mediane)
+        mad, moyen = np.median(ecarts, axis=0), ecarts.mean(axis=0)
+    else:
+        mediane = pd.Series(valeurs).groupby(groupes, sort=True).median().to_numpy()[groupes]; ecarts = pd.Series(np.abs(valeurs - mediane))
+        mad, moyen = (agregat.to_numpy()[groupes] for agregat in (ecarts.groupby(groupes, sort=True).median(), ecarts.groupby(groupes, sort=True).mean()))
+    echelle = np.where(mad > 0, mad / FACTEUR_MAD, moyen * FACTEUR_ECART_MOYEN)
+    return np.divide(valeurs - mediane, echelle, out=np.zeros(np.shape(valeurs)), where=echelle > 0)
+
+def _paires(groupe, valeur):
+    """
+    Décompte des couples (groupe, valeur) en une passe : codes des groupes, effectif de chaque groupe,
+    couple de chaque ligne, groupe, valeur et effectif de chaque couple distinct.
+    """
+    codes, _ = pd.factorize(groupe); codes_valeur, valeurs = pd.factorize(valeur)
+    paires, couple = pd.factorize(codes.astype(np.int64) * len(valeurs) + codes_valeur)
+    couple = np.asarray(couple)
+    return codes, np.bincount(codes), paires, couple // len(valeurs), couple % len(valeurs), np.bincount(paires)
+
+def annees_concentrees(variables, controle):
+    """
+    Lignes portant l'année de fabrication dominante d'un groupe Marque × Commune quand la part de cette
+    année dans le groupe est atypique parmi tous les groupes (score z robuste sur la part dominante).
+    """
+    groupe, annee = variables['groupe'], variables['annee']
+    retenues = (groupe != 0) & ~np.isnan(annee); masque = np.zeros(len(groupe), dtype=bool)
+    if not retenues.any(): return masque
+    _, effectifs, paires, groupe_paire, _, comptes = _paires(groupe[retenues], annee[retenues])
+    # Couple dominant de chaque groupe : le plus fréquent, le premier rencontré en cas d'égalité
+    ordre = np.lexsort((-comptes, groupe_paire)); dominants = ordre[np.r_[True, np.diff(groupe_paire[ordre]) != 0]]
+    parts = comptes[dominants] / effectifs; comparables = effectifs >= controle.effectif_min
+    if comparables.sum() < GROUPES_MIN: return masque
+    scores = np.zeros(len(effectifs)); scores[comparables] = scores_robustes(parts[comparables])
+    atypiques = np.zeros(len(comptes), dtype=bool)
+    atypiques[dominants] = comparables & (scores > controle.seuil_z) & (parts >= controle.part_min)
+    masque[retenues] = atypiques[paires]
+    return masque
+
+def types_surrepresentes(variables, controle):
+    """
+    Lignes d'un Type Compteur dont la part dans un groupe Marque × Commune est atypique par rapport aux
+    autres communes de la même marque (score z robuste par marque et par type, une commune où le type
+    est absent comptant pour une part nulle).
+    """
+    groupe, marque, type_compteur = variables['groupe'], variables['marque'], variables['type']
+    retenues = (groupe != 0) & (type_compteur != 0); masque = np.zeros(len(groupe), dtype=bool)
+    if not retenues.any(): return masque
+    codes, effectifs, paires, groupe_paire, type_paire, comptes = _paires(groupe[retenues], type_compteur[retenues])
+    marque_groupe = np.zeros(len(effectifs), dtype=np.int64); marque_groupe[codes] = pd.factorize(marque[retenues])[0]
+    comparables = effectifs >= controle.effectif_min; parts = comptes / effectifs[groupe_paire]
+    scores = np.zeros(len(comptes))
+    for code_marque in np.unique(marque_groupe[comparables]):
+        groupes = np.flatnonzero(comparables & (marque_groupe == code_marque))
+        if len(groupes) < GROUPES_MIN: continue
+        selection = np.flatnonzero(np.isin(groupe_paire, groupes))
+        colonnes, types = pd.factorize(type_paire[selection])
+        # Parts des types de la marque dans chacun de ses groupes (une ligne par groupe, zéro si le type y est absent)
+        matrice = np.zeros((len(groupes), len(types))); lignes = np.searchsorted(groupes, groupe_paire[selection])
+        matrice[lignes, colonnes] = parts[selection]
+        scores[selection] = scores_robustes(matrice)[lignes, colonnes]
+    atypiques = comparables[groupe_paire] & (scores > controle.seuil_z) & (parts >= controle.part_min)
+    masque[retenues] = atypiques[paires]
+    return masque
+
+def coordonnees_eloignees(variables, controle):
+    """
+    Coordonnées GPS valides dont la distance au point médian de leur commune est atypique parmi celles
+    des autres compteurs de la commune (score z robuste par commune) et dépasse `distance_min_km`.
+    """
+    commune, lat, lon = variables['commune'], variables['latitude'], variables['longitude']
+    retenues = (commune != 0) & ~np.isnan(lat) & ~np.isnan(lon); masque = np.zeros(len(commune), dtype=bool)
+    if not retenues.any(): return masque
+    codes, _ = pd.factorize(commune[retenues]); lat, lon = lat[retenues], lon[retenues]
+    centres = pd.DataFrame({'lat': lat, 'lon': lon}).groupby(codes, sort=True).median()
+    distances = distance_km(lat, lon, centres['lat'].to_numpy()[codes], centres['lon'].to_numpy()[codes])
+    comparables = np.bincount(codes)[codes] >= controle.effectif_min
+    masque[retenues] = comparables & (scores_robustes(distances, codes) > controle.seuil_z) & (distances > controle.distance_min_km)
+    return masque
@@ -0,0 +1,97 @@
+"""
+Contrôles en tâche de fond : chaque travail s'exécute dans un pool de fils d'exécution partagé
+par tout le serveur, avec son JournalExecution, dont l'étape en cours et les règles déjà appliquées
+donnent l'avancement. Un travail est identifié par la clé de ce qu'il calcule (empreinte du fichier,
+profil, options) : soumettre à nouveau la même clé rattache au travail existant au lieu de le relancer.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .journal import JournalExecution
+
+TRAVAUX_MAX = 16  # travaux terminés conservés (les plus anciens sont oubliés au-delà)
+ETAPES_EXPORT = ('rapport', 'correction')
+PART_CONTROLES = 0.9  # part de l'avancement attribuée aux contrôles, le reste aux exports
+
+
+class Travail:
+    """Un contrôle soumis au GestionnaireTravaux : son journal, son état et, une fois terminé, son résultat."""
+    def __init__(self, cle, profil):
+        self.identifiant = uuid.uuid4().hex
+        self.cle = cle
+        self.profil = profil
+        self.journal = JournalExecution(profil)
+        self.debut = time.perf_counter()
+        self.fin = None
+        self.futur = None
+
+    @property
+    def termine(self): return self.futur.done()
+    @property
+    def erreur(self): return self.futur.exception() if self.futur.done() else None
+    @property
+    def resultat(self):
+        """Résultat de la fonction soumise ; relève son exception si elle a échoué."""
+        return self.futur.result()
+
+    def duree(self):
+        return (self.fin or time.perf_counter()) - self.debut
+
+    def avancement(self):
+        """
+        (étape en cours, fraction estimée entre 0 et 1) : la fraction suit les règles déjà appliquées
+        pendant les contrôles, puis passe à PART_CONTROLES pendant les exports.
+        """
+        if self.termine: return None, 1.0
+        etape = self.journal.en_cours
+        if etape in ETAPES_EXPORT: return etape, PART_CONTROLES
+        total = len(self.profil.toutes_regles)
+        return etape, PART_CONTROLES * min(len(self.journal.regles) / max(total, 1), 1.0)
+
+    def _executer(self, fonction):
+        try:
+            return fonction(self.journal)
+        finally:
+            self.fin = time.perf_counter()
+
+class GestionnaireTravaux:
+    """
+    Pool de `fils` fils d'exécution (par défaut, le nombre de cœurs) et registre des travaux.
+    Les fils d'exécution suffisent : les contrôles passent l'essentiel de leur temps dans pandas/numpy,
+    et un gros export est de toute façon réparti sur des processus par `executer_controles_parallele`.
+    Une seule instance peut être partagée par tout le serveur.
+    """
+    def __init__(self, fils=None, travaux_max=TRAVAUX_MAX):
+        self.pool = ThreadPoolExecutor(max_workers=fils or os.cpu_count() or 1, thread_name_prefix='controle')
+        self.travaux_max = travaux_max
+        self._travaux = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def soumettre(self, cle, profil, fonction):
+        """
+        Lance `fonction(journal)` en tâche de fond, sauf si un travail de même clé est en cours ou a
+        réussi : ce travail est alors retourné tel quel. Un travail en échec est relancé.
+        """
+        with self._verrou:
+            for travail in reversed(self._travaux.values()):
+                if travail.cle == cle and not (travail.termine and travail.erreur is not None):
+                    return travail
+            travail = Travail(cle, profil)
+            travail.futur = self.pool.submit(travail._executer, fonction)
+            self._travaux[travail.identifiant] = travail
+            termines = [identifiant for identifiant, t in self._travaux.items() if t.termine]
+            for identifiant in termines[:max(len(self._travaux) - self.travaux_max, 0)]: del self._travaux[identifiant]
+            return travail
+
+    def obtenir(self, identifiant):
+        """Travail d'identifiant `identifiant`, None s'il est inconnu ou a été oublié."""
+        with self._verrou:
+            return self._travaux.get(identifiant)
+
+    def en_cours(self):
+        with self._verrou:
+            return [travail for travail in self._travaux.values() if not travail.termine]
@@ -0,0 +1,69 @@
+"""
+Les chemins d'exécution des contrôles (complet, par blocs, parallèle, delta) donnent le même rapport
+sur les exports synthétiques de `benchmarks.generateur`.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generateur import generer_export
+from controle_anomalies import (
+    PROFILS, ControleStatistique, avec_controle_statistique, executer_controles, executer_controles_par_blocs,
+    executer_controles_parallele, lire_export, sonder_export,
+)
+from controle_anomalies.delta import MagasinResultats, executer_controles_delta
+
+LIGNES = 3000
+TAILLE_BLOC = 700  # plusieurs blocs, dont un dernier incomplet
+
+PROFILS_TESTES = {**{nom: PROFILS[nom] for nom in sorted(PROFILS)}, **{f'{nom}+statistiques': avec_controle_statistique(PROFILS[nom], ControleStatistique()) for nom in ('radio', 'tele')}}
+
+
+def rapports_identiques(resultat, attendu):
+    pd.testing.assert_frame_equal(resultat[0], attendu[0], check_dtype=False)
+    pd.testing.assert_series_equal(resultat[1], attendu[1], check_dtype=False)
+
+@pytest.fixture(scope='module', params=sorted(PROFILS_TESTES))
+def export(request, tmp_path_factory):
+    """Export CSV synthétique (avec doublons) du profil, sa sonde, sa lecture complète et le rapport du contrôle séquentiel."""
+    profil = PROFILS_TESTES[request.param]
+    df = generer_export(LIGNES, graine=7, type_export='tele' if profil.nom == 'tele' else 'radio')
+    df = pd.concat([df, df.iloc[::97]], ignore_index=True)  # compteurs présents deux fois
+    chemin = tmp_path_factory.mktemp('exports') / f'{profil.nom}.csv'; df.to_csv(chemin, sep=';', index=False)
+    sonde = sonder_export(chemin, profil); lu, _ = lire_export(chemin, profil, sonde=sonde)
+    return profil, chemin, sonde, lu, executer_controles(lu, profil)
+
+def test_par_blocs(export):
+    profil, chemin, sonde, _, attendu = export
+    with open(chemin, 'rb') as fichier:
+        rapports_identiques(executer_controles_par_blocs(fichier, profil, sonde.delimiteur, dtype=profil.dtype_lecture, taille_bloc=TAILLE_BLOC, encodage=sonde.encodage), attendu)
+
+def test_parallele(export):
+    pytest.importorskip('pyarrow')
+    profil, _, _, lu, attendu = export
+    rapports_identiques(executer_controles_parallele(lu, profil, processus=2, lignes_min=1000), attendu)
+
+def test_delta(export, tmp_path):
+    """Campagne précédente avec des lignes modifiées, supprimées et en plus : le rapport delta est celui du contrôle complet."""
+    profil, _, _, lu, attendu = export; magasin = MagasinResultats(tmp_path)
+    precedente = lu.drop(index=lu.index[100:150]).copy(); rng = np.random.default_rng(3)
+    modifiees = rng.choice(precedente.index, 200, replace=False)  # valeurs permutées : les types lus restent ceux de l'export
+    for col in ('Diametre', 'Latitude'): precedente.loc[modifiees, col] = precedente.loc[modifiees[::-1], col].to_numpy()
+    supprimees = lu.iloc[:100].assign(**{'Numéro de compteur': lu['Numéro de compteur'].iloc[:100] + 'X'})
+    precedente = pd.concat([precedente, supprimees], ignore_index=True)
+    executer_controles_delta(precedente, profil, magasin)
+    resultat = executer_controles_delta(lu, profil, magasin)
+    assert 0 < resultat.lignes['recontrolees'] < len(lu)
+    rapports_identiques((resultat.anomalies_df, resultat.anomaly_counter), attendu)
+
+@pytest.mark.parametrize('nom_profil', sorted(PROFILS))
+def test_delta_suppression_d_un_doublon(nom_profil, tmp_path):
+    """Supprimer l'une des deux lignes d'un compteur présent deux fois ne fait recontrôler aucune autre ligne."""
+    profil, magasin = PROFILS[nom_profil], MagasinResultats(tmp_path)
+    export = generer_export(2000, 4); copies = export.iloc[:50].copy(); copies['Latitude'] = copies['Latitude'] + '1'
+    export = pd.concat([copies, export], ignore_index=True)
+    executer_controles_delta(export, profil, magasin)
+    reduit = export.drop(range(50)); resultat = executer_controles_delta(reduit, profil, magasin)
+    assert resultat.lignes == {'total': 2000, 'recontrolees': 0, 'inchangees': 2000, 'nouvelles': 0, 'modifiees': 0, 'supprimees': 50}
+    assert resultat.evolution['Nouvelles'].sum() == 0
+    rapports_identiques((resultat.anomalies_df, resultat.anomaly_counter), executer_controles(reduit, profil))